@@ -0,0 +1,299 @@
+import pandas as pd
+import numpy as np
+import os
+import summarise_isomir_sea
+
+# Extension of the alignment files
+ALIGNMENT_FILE_EXT = '.npz'
+# Name of the unique tag alignment file shared by all replicates of a species
+UNIQUE_TAGS_FILE_NAME = 'unique_tags'
+
+def get_alignment_file(path_folder, rep_name):
+    """Get the path to the alignment file of a replicate.
+
+    Parameters
+    ----------
+    path_folder : str
+        Path to the group folder e.g <output_folder>/4_nt_templated_alignment/D0
+    rep_name : str
+        Replicate name e.g D0_rpt1.
+
+    Returns
+    -------
+    str
+        e.g <output_folder>/4_nt_templated_alignment/D0/D0_rpt1.npz
+    """
+    return f'{path_folder}/{rep_name}{ALIGNMENT_FILE_EXT}'
+
+def get_unique_tags_file(path_folder):
+    """Get the path to the unique tag alignment file shared by all replicates.
+
+    Parameters
+    ----------
+    path_folder : str
+        Path to the alignment output folder e.g <output_folder>/4_nt_templated_alignment
+
+    Returns
+    -------
+    str
+        e.g <output_folder>/4_nt_templated_alignment/unique_tags.npz
+    """
+    return f'{path_folder}/{UNIQUE_TAGS_FILE_NAME}{ALIGNMENT_FILE_EXT}'
+
+def get_group_folders(path_folder):
+    """List the group folders of the alignment output folder (the unique tag alignment file is skipped).
+
+    Parameters
+    ----------
+    path_folder : str
+        Path to the alignment output folder.
+
+    Returns
+    -------
+    list
+        The group folder names e.g ['18hr', 'D0']
+    """
+    return [group for group in os.listdir(path_folder) if os.path.isdir(f'{path_folder}/{group}')]
+
+def save_alignment(alignment, path_alignment_file):
+    """Save an encoded alignment (the unique tag alignment or a replicate index, see nt_templated.align_unique_tags() and nt_templated.get_replicate_index()) to a compressed .npz file.
+
+    Parameters
+    ----------
+    alignment : dict
+        The unique tag alignment or the replicate index.
+    path_alignment_file : str
+        Path to the alignment file.
+
+    Returns
+    -------
+    None. The alignment file is generated.
+    """
+    np.savez_compressed(path_alignment_file, **alignment)
+
+def load_alignment(path_alignment_file):
+    """Load an encoded alignment saved by save_alignment().
+
+    Parameters
+    ----------
+    path_alignment_file : str
+        Path to the alignment file.
+
+    Returns
+    -------
+    dict
+        The unique tag alignment or the replicate index.
+    """
+    with np.load(path_alignment_file) as alignment_file:
+        alignment = {key: alignment_file[key] for key in alignment_file.files}
+    # Scalars are saved as 0-d arrays
+    for key in ['max_nt_diff_5p', 'total_count']:
+        if key in alignment:
+            alignment[key] = int(alignment[key])
+    return alignment
+
+def get_replicate_alignment(unique_tag_alignment, replicate_index):
+    """Select the isomiRs of a replicate from the unique tag alignment.
+
+    Parameters
+    ----------
+    unique_tag_alignment : dict
+        The unique tag alignment shared by all replicates (see nt_templated.align_unique_tags()).
+    replicate_index : dict
+        The rows, read counts and total read count of the replicate (see nt_templated.get_replicate_index()).
+
+    Returns
+    -------
+    dict
+        The encoded alignment of the replicate, with the same keys as the unique tag alignment (only the miRNAs with isomiRs in the replicate are kept) plus counts and total_count.
+    """
+    rows = replicate_index['rows']
+    # Rows are grouped by miRNA, in the order of the miRNAs of the unique tag alignment
+    mirnas, n_isomiRs = np.unique(get_isomiR_mirnas(unique_tag_alignment)[rows], return_counts=True)
+    return {
+        'mir_names': unique_tag_alignment['mir_names'][mirnas],
+        'pre_seqs': unique_tag_alignment['pre_seqs'][mirnas],
+        'offsets': np.concatenate([[0], np.cumsum(n_isomiRs)]).astype(np.int64),
+        **{key: unique_tag_alignment[key][rows] for key in ['tag_sequences', 'starts', 'extended_or_truncated', 'nt', 'templated']},
+        'counts': replicate_index['counts'],
+        'total_count': replicate_index['total_count'],
+        'max_nt_diff_5p': unique_tag_alignment['max_nt_diff_5p']
+    }
+
+def get_templated_matrix(alignment):
+    """Unpack the templated matrix of an encoded alignment.
+
+    Parameters
+    ----------
+    alignment : dict
+        The encoded alignment.
+
+    Returns
+    -------
+    numpy.ndarray
+        A boolean matrix (one row per isomiR, one column per position): True where the nucleotide of the isomiR matches the extended precursor.
+    """
+    return np.unpackbits(alignment['templated'], axis=1, count=alignment['nt'].shape[1]).astype(bool)
+
+def get_precursor_matrix(alignment):
+    """Encode the extended precursor sequences of an encoded alignment.
+
+    Parameters
+    ----------
+    alignment : dict
+        The encoded alignment.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        A uint8 matrix of ASCII codes (one row per miRNA, one column per position, 0 after the end of the precursor) and the length of each precursor.
+    """
+    pre_matrix, pre_lens = summarise_isomir_sea.encode_sequences(pd.Series(alignment['pre_seqs'], dtype=object))
+    n_positions = alignment['nt'].shape[1]
+    pre_matrix = np.pad(pre_matrix[:, :n_positions], ((0, 0), (0, max(n_positions - pre_matrix.shape[1], 0))))
+    return pre_matrix, pre_lens
+
+def get_isomiR_mirnas(alignment):
+    """Get the miRNA of each isomiR of an encoded alignment.
+
+    Parameters
+    ----------
+    alignment : dict
+        The encoded alignment.
+
+    Returns
+    -------
+    numpy.ndarray
+        The index (in alignment['mir_names']) of the miRNA of each isomiR.
+    """
+    return np.repeat(np.arange(len(alignment['mir_names'])), np.diff(alignment['offsets']))
+
+def get_aligned_seqs(alignment, pre_lens):
+    """Get the isomiR sequences aligned to their extended precursor, with unaligned positions filled with spaces.
+
+    Parameters
+    ----------
+    alignment : dict
+        The encoded alignment.
+    pre_lens : numpy.ndarray
+        The length of each extended precursor (see get_precursor_matrix()).
+
+    Example
+    -------
+    ```
+    Extended precursor sequence : "AUGCUAUCCCGCUAAUGCUAUCCCGCU"
+    isomiR (start = 4) :              "UAUCCCGCUAAUGCUAU"
+    Output :                      "    UAUCCCGCUAAUGCUAU      "
+    ```
+
+    Returns
+    -------
+    list
+        The aligned sequence of each isomiR.
+    """
+    isomiR_pre_lens = pre_lens[get_isomiR_mirnas(alignment)]
+    return [(' ' * start + tag_seq).ljust(pre_len) for start, tag_seq, pre_len in zip(alignment['starts'].tolist(), alignment['tag_sequences'].tolist(), isomiR_pre_lens.tolist())]
+
+def build_alignment_tables(alignment, isomiR_cells_list, pre_cells):
+    """Build tables with a row for the extended precursor of each miRNA followed by a row for each of its isomiRs (the layout of the alignment files).
+
+    Parameters
+    ----------
+    alignment : dict
+        The encoded alignment.
+    isomiR_cells_list : list
+        The cell values of the isomiR rows (one row per isomiR, one column per position) of each table.
+    pre_cells : numpy.ndarray
+        The cell values of the precursor rows (one row per miRNA, one column per position), shared by all tables.
+
+    Returns
+    -------
+    list
+        One pandas.DataFrame per item of isomiR_cells_list, with columns name, pre_seq, is_pre, extended_or_truncated, 1, 2, ..., <max extended precursor length>.
+    """
+    _, pre_lens = get_precursor_matrix(alignment)
+    n_mirnas = len(alignment['mir_names'])
+    isomiR_mirnas = get_isomiR_mirnas(alignment)
+    # Row of each precursor and each isomiR in the table
+    pre_rows = alignment['offsets'][:-1] + np.arange(n_mirnas)
+    isomiR_rows = np.arange(len(isomiR_mirnas)) + isomiR_mirnas + 1
+    n_rows = n_mirnas + len(isomiR_rows)
+
+    # Columns describing each row
+    names, seqs, types = np.empty(n_rows, dtype=object), np.empty(n_rows, dtype=object), np.full(n_rows, '', dtype=object)
+    is_pre = np.zeros(n_rows, dtype=bool)
+    names[pre_rows], seqs[pre_rows], is_pre[pre_rows] = alignment['mir_names'], alignment['pre_seqs'], True
+    names[isomiR_rows], seqs[isomiR_rows], types[isomiR_rows] = alignment['mir_names'][isomiR_mirnas], get_aligned_seqs(alignment, pre_lens), alignment['extended_or_truncated']
+    columns = ['name', 'pre_seq', 'is_pre', 'extended_or_truncated'] + [str(i) for i in range(1, alignment['nt'].shape[1] + 1)]
+
+    tables = []
+    for isomiR_cells in isomiR_cells_list:
+        cells = np.empty((n_rows, alignment['nt'].shape[1]), dtype=object)
+        cells[pre_rows] = pre_cells
+        cells[isomiR_rows] = isomiR_cells
+        table = pd.DataFrame(np.column_stack([names, seqs, is_pre.astype(object), types, cells]), columns=columns)
+        tables.append(table.astype({'is_pre': bool}))
+    return tables
+
+def to_nt_templated_alignment(alignment):
+    """Decode an encoded alignment to the readable nt templated alignment table, with nucleotide details in (<nucleotide>, <matching symbol>) format.
+
+    Parameters
+    ----------
+    alignment : dict
+        The encoded alignment.
+
+    Example
+    -------
+    ```
+    name          | pre_seq                          | is_pre | extended_or_truncated | 1    | 2    | 3    | 4      | 5      | ...
+    mmu-let-7b-3p | AGAcuauacaaccuacugccuucccUUUUCAUA | True   |                       | A    | G    | A    | c      | u      | ...
+    mmu-let-7b-3p |    CUAUACAACCUACUGCCUUCCU        | False  |                       | (' ', ' ') | (' ', ' ') | (' ', ' ') | (c, +) | (u, +) | ...
+    ```
+
+    Returns
+    -------
+    pandas.DataFrame
+        The nt templated alignment with columns name, pre_seq, is_pre, extended_or_truncated, 1, 2, ..., <max extended precursor length>. Positions after the end of a precursor are empty.
+    """
+    pre_matrix, pre_lens = get_precursor_matrix(alignment)
+    nt = alignment['nt']
+    after_pre_end = np.arange(nt.shape[1]) >= pre_lens[get_isomiR_mirnas(alignment)][:, None]
+
+    # (<nucleotide>, <matching symbol>) of each ASCII code
+    letters = np.array([None] + [chr(code) for code in range(1, 256)], dtype=object)
+    matched = np.array([None] + [f'({chr(code)}, +)' for code in range(1, 256)], dtype=object)
+    mismatched = np.array([None] + [f'({chr(code)}, -)' for code in range(1, 256)], dtype=object)
+    isomiR_cells = np.where(nt == 0, "(' ', ' ')", np.where(get_templated_matrix(alignment), matched[nt], mismatched[nt]))
+    isomiR_cells[after_pre_end] = None
+    return build_alignment_tables(alignment, [isomiR_cells], letters[pre_matrix])[0]
+
+def to_split_alignments(alignment):
+    """Decode an encoded alignment to both the nt alignment and the templated alignment tables, in one pass.
+
+    Parameters
+    ----------
+    alignment : dict
+        The encoded alignment.
+
+    Example
+    -------
+    ```
+    The nt templated alignment:             (' ', ' '), (' ', ' '), ('g', '-'), ('a', '+'), ('u', '+'), ('c', '+'), ('c', '+'), ('u', '+'), ('g', '+')
+    The nt alignment:                       '','','g','a','u,'c','c','u','g'
+    The templated alignment:                '','','-','+','+,'+','+','+','+'
+    ```
+
+    Returns
+    -------
+    pandas.DataFrame, pandas.DataFrame
+        The nt alignment (nucleotides) and the templated alignment (matching symbols), with columns name, pre_seq, is_pre, extended_or_truncated, 1, 2, ..., <max extended precursor length>. Precursor rows keep the precursor nucleotides, empty cells are ''.
+    """
+    pre_matrix, _ = get_precursor_matrix(alignment)
+    nt = alignment['nt']
+
+    # Character of each ASCII code, '' for 0
+    letters = np.array([''] + [chr(code) for code in range(1, 256)], dtype=object)
+    templated_cells = np.where(nt == 0, '', np.where(get_templated_matrix(alignment), '+', '-')).astype(object)
+    nt_alignment, templated_alignment = build_alignment_tables(alignment, [letters[nt], templated_cells], letters[pre_matrix])
+    return nt_alignment, templated_alignment
@@ -1,9 +1,13 @@
 import pandas as pd 
 import os 
 import sys
+import table_store
 from colorama import Fore, Style, init
 init(autoreset=True)
 
+# Columns identifying an isomiR across the replicates of a group
+ISOMIR_KEY_COLS = ['mirna_name', 'tag_sequence', 'type', '5p_nt_diff', '3p_nt_diff']
+
 def get_grouped_type(type: str):
     """Categorise 12 variant types into 5 big groups 
     
@@ -62,80 +66,80 @@ def get_type_nt(type: str, nt_diff_5p: int, nt_diff_3p: int):
     else: 
         return ''
     
-def get_avg(r: pd.Series, rep_cols: set):
-    """Calculate the average rpm and unique tag for each isomiR across multiple replicates
+def stack_replicates(rep_dfs: dict):
+    """Stack the summarised isomiRs of the replicates of a group in long format, with the rpm of each isomiR in its replicate. 
+
+    Parameters
+    ----------
+    rep_dfs : dict 
+        Summarised isomiRs of each replicate of the group, keyed by replicate e.g {'D0_rpt1': pandas.DataFrame, ...}
+
+    Example
+    -------
+    ```
+    mirna_name    | tag_sequence           | type        | 5p_nt_diff | 3p_nt_diff | rpm
+    mmu-miR-16-5p | UAGCAGCACGUAAAUAUUGGCG | mirna_exact |          0 |          0 | 95012.5    (D0_rpt1)
+    mmu-miR-24-3p | UGGCUCAGUUCAGCAGGAACAGU| iso_3p_only |          0 |          1 | 29275.3    (D0_rpt1)
+    mmu-miR-16-5p | UAGCAGCACGUAAAUAUUGGCG | mirna_exact |          0 |          0 | 90870.1    (D0_rpt2)
+    ...
+    ```
+
+    Returns
+    -------
+    pandas.DataFrame 
+        One row per isomiR per replicate with columns mirna_name, tag_sequence, type (categorical), 5p_nt_diff, 3p_nt_diff, rpm. 
+    """
+    long_dfs = []
+    for rep_df in rep_dfs.values():
+        # Select a subset of important columns 
+        rep_df = rep_df[ISOMIR_KEY_COLS + ['#count_tags']].astype({'mirna_name': str})
+        # Normalise raw count 
+        long_dfs.append(rep_df[ISOMIR_KEY_COLS].assign(rpm=rep_df['#count_tags'] * 1000000 / rep_df['#count_tags'].sum()))
+    long_df = pd.concat(long_dfs, ignore_index=True)
+    # Group on the integer codes of categorical keys rather than on strings
+    return long_df.astype({col: 'category' for col in ['mirna_name', 'tag_sequence', 'type']})
+
+def average_replicates(rep_dfs: dict):
+    """Calculate the average rpm / unique tag for each isomiR across the replicates of a group. 
+
+    An isomiR missing from a replicate counts as 0 rpm and 0 unique tag in that replicate, so both averages are a sum over the replicates where the isomiR is found, divided by the number of replicates. 
 
     Parameters
     ----------
-    r : pandas.Series
-        A 1D array that stores information of an isomiR. 
-    rep_cols : set
-        A set of columns that store rpm / unique tag count of an isomiR.  
+    rep_dfs : dict 
+        Summarised isomiRs of each replicate of the group, keyed by replicate e.g {'D0_rpt1': pandas.DataFrame, ...}
 
     Returns
     -------
-    pd.Series
-        The average rpm and average unique tag count of an isomiR across multiple replicates. 
+    pandas.DataFrame 
+        The averaged isomiRs of the group with columns mirna_name, tag_sequence, grouped_type, type_nt, rpm, unique_tag. 
     """
-    total_rpm = 0
-    total_unique_tag = 0
-    n_reps = len(rep_cols) / 2
+    n_reps = len(rep_dfs)
+    # Sum rpm and count the replicates of each isomiR in a single grouped reduction
+    group_df = stack_replicates(rep_dfs).groupby(ISOMIR_KEY_COLS, observed=True, sort=True).agg(rpm=('rpm', 'sum'), unique_tag=('rpm', 'size')).reset_index()
+    group_df['rpm'] = group_df['rpm'] / n_reps
+    group_df['unique_tag'] = group_df['unique_tag'] / n_reps
 
-    for rep_col in rep_cols: 
-        if 'rpm' in rep_col:
-            total_rpm += r[rep_col]
-        else:
-            total_unique_tag += r[rep_col]       
+    # Group variant types into 3p, 5p, both, canonical and others, and combine type and the number of nt differences, once per distinct variant
+    variants = group_df[['type', '5p_nt_diff', '3p_nt_diff']].drop_duplicates()
+    variants['grouped_type'] = [get_grouped_type(t) for t in variants['type']]
+    variants['type_nt'] = [get_type_nt(t, nt_diff_5p, nt_diff_3p) for t, nt_diff_5p, nt_diff_3p in zip(variants['type'], variants['5p_nt_diff'], variants['3p_nt_diff'])]
+    group_df = group_df.merge(variants, how='left', on=['type', '5p_nt_diff', '3p_nt_diff'])
 
-    return pd.Series([total_rpm / n_reps, total_unique_tag / n_reps])     
+    # Select subset of important columns  
+    return group_df[['mirna_name', 'tag_sequence', 'grouped_type', 'type_nt', 'rpm', 'unique_tag']].astype({'mirna_name': str, 'tag_sequence': str})
 
 def run(path_summarised_output_folder, path_avg_replicate_output_folder):
     print(Fore.MAGENTA + "\nCalculating the average rpm / unique tag for each isomiR across multiple replicates...")
 
     # List of group folders 
     group_folders = os.listdir(path_summarised_output_folder)
+    # Create folder if not exists 
+    if not os.path.exists(path_avg_replicate_output_folder):
+        os.makedirs(path_avg_replicate_output_folder)
     # Loop through each group
     for group in group_folders:
-        # Get the list of replicate files
-        rep_files = os.listdir(f'{path_summarised_output_folder}/{group}')
-        # Create a dataframe that store summarised isomiRs of all replicates within the same group 
-        group_df = pd.DataFrame()
-        # Create folder if not exists 
-        if not os.path.exists(path_avg_replicate_output_folder):
-            os.makedirs(path_avg_replicate_output_folder)
-
-        # Loop through each replicate file 
-        for rep_file in rep_files:
-            # Get replicate name 
-            rep_name = rep_file.split('.')[0]
-            # Read the replicate file 
-            rep_df = pd.read_csv(f'{path_summarised_output_folder}/{group}/{rep_file}')
-            # Select a subset of important columns 
-            rep_df = rep_df[['mirna_name', 'tag_sequence', 'type', '#count_tags', '5p_nt_diff', '3p_nt_diff']]
-            # Normalise raw count and store in a new column named <replicate_name>_rpm
-            sum_raw_count = sum(list(rep_df['#count_tags']))
-            rep_df[f'{rep_name}_rpm'] = rep_df['#count_tags'] * 1000000 / sum_raw_count
-            # Remove the #count_tags column 
-            rep_df = rep_df.drop(columns=['#count_tags'])
-            # Add unique tag column and set value to 1
-            rep_df[f'{rep_name}_unique_tag'] = 1
-            # Group variant types into 3p, 5p, both, canonical and others and save to a new column grouped_type
-            rep_df['grouped_type'] = rep_df['type'].apply(lambda t: get_grouped_type(t))
-            # Combine type and the number of nt differences and save to a new column type_nt 
-            rep_df['type_nt'] = rep_df.apply(lambda r: get_type_nt(r['type'], r['5p_nt_diff'], r['3p_nt_diff']), axis = 1)
-            # Check if the group_df is empty. If yes, group_df is set to be the summarised isomiRs of the first replicate 
-            if group_df.empty:
-                group_df = rep_df
-            # if not, merge the summarised isomiRs of that replicated to the current group_df 
-            else:
-                group_df = pd.merge(group_df, rep_df, on=['mirna_name', 'tag_sequence', 'type', '5p_nt_diff', '3p_nt_diff', 'grouped_type', 'type_nt'], how='outer')
-                group_df = group_df.fillna(0)
-
-        # Get list of replicate columns that store rpm / unique tag count of isomiRs 
-        rep_cols = set(group_df.columns) - {'mirna_name', 'tag_sequence', 'type', '5p_nt_diff', '3p_nt_diff', 'grouped_type', 'type_nt'}
-        # Calculate the average rpm and unique tag for each isomiR and save to a new columns rpm, unique_tag
-        group_df[['rpm', 'unique_tag']] = group_df.apply(lambda r: get_avg(r, rep_cols), axis = 1)
-        # Select subset of important columns  
-        group_df = group_df[['mirna_name', 'tag_sequence', 'grouped_type', 'type_nt', 'rpm', 'unique_tag']]
-        # Export to csv file 
-        group_df.to_csv(f'{path_avg_replicate_output_folder}/{group}.csv', index=False)
\ No newline at end of file
+        # Read the summarised isomiRs of each replicate file, only the columns used for averaging 
+        rep_dfs = {rep_name: table_store.read_table(path_rep_file, columns=ISOMIR_KEY_COLS + ['#count_tags']) for rep_name, path_rep_file in table_store.list_tables(f'{path_summarised_output_folder}/{group}').items()}
+        # Calculate the average rpm / unique tag and save the group table 
+        table_store.write_table(average_replicates(rep_dfs), f'{path_avg_replicate_output_folder}/{group}')
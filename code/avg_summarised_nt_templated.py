@@ -1,16 +1,75 @@
 import pandas as pd 
 import os
 import sys
+import parallel
+import table_store
 from colorama import Fore, Style, init
 init(autoreset=True)
 
-def get_avg(r, rep_cols):
-    total_count = 0
+# Value columns of the summarised alignments and the name of their average: unique tags, read counts and rpm
+AVG_VALUE_COLS = {'value': 'count', 'read_count': 'read_count', 'rpm': 'rpm'}
 
-    for rep_col in rep_cols: 
-        total_count += r[rep_col]   
+def average_replicates(rep_dfs: dict):
+    """Calculate the average value of a summarised alignment across the replicates of a group. 
 
-    return total_count / len(rep_cols)
+    The replicates are stacked and each value is summed per key in a single grouped reduction, then divided by the number of replicates (a key missing from a replicate counts as 0 in that replicate). 
+
+    Parameters
+    ----------
+    rep_dfs : dict 
+        Summarised alignment of each replicate of the group, keyed by replicate name e.g {'D0_rpt1': pandas.DataFrame, ...}
+
+    Returns
+    -------
+    pandas.DataFrame
+        The key columns (position and nucleotide / templated) and the average values across replicates: count (unique tags), read_count and rpm. 
+    """
+    # Stack all replicates of the group 
+    long_df = pd.concat(list(rep_dfs.values()), ignore_index=True)
+    # Value columns (summaries of older runs only have unique tags) and key columns 
+    value_cols = [col for col in AVG_VALUE_COLS if col in long_df.columns]
+    key_cols = [col for col in long_df.columns if col not in AVG_VALUE_COLS]
+    # Calculate the average of each value across all replicates
+    group_df = long_df.groupby(key_cols, sort=True)[value_cols].sum() / len(rep_dfs)
+    return group_df.reset_index().rename(columns=AVG_VALUE_COLS)
+
+def average_group(rep_tables):
+    """Average the summarised alignments of the replicates of a group, reading the replicate files first if paths are given. 
+
+    Parameters
+    ----------
+    rep_tables : dict
+        The summarised alignment (pandas.DataFrame) or the path to the summarised alignment file of each replicate of the group, keyed by replicate name. 
+
+    Returns
+    -------
+    pandas.DataFrame
+        The averaged summarised alignment (see average_replicates()). 
+    """
+    return average_replicates({rep_name: table_store.read_table(rep_table, dtype={'position': 'str'}) if isinstance(rep_table, str) else rep_table for rep_name, rep_table in rep_tables.items()})
+
+def average_summaries(summaries, n_workers=None):
+    """Average the replicates of every group of several summaries (e.g nt, templated and templated at all positions) across a pool of worker processes, one job per summary and group. 
+
+    Parameters
+    ----------
+    summaries : list
+        Per summary, the summarised alignments (pandas.DataFrame) or the paths to the summarised alignment files by group and replicate e.g [{'D0': {'D0_rpt1': pandas.DataFrame, ...}, ...}, ...]
+    n_workers : int
+        The number of worker processes (see parallel.run_jobs()).
+
+    Returns
+    -------
+    list
+        Per summary, the averaged summarised alignment of each group e.g [{'D0': pandas.DataFrame, ...}, ...]
+    """
+    keys = [(i, group) for i, summary in enumerate(summaries) for group in summary]
+    # Files are read by the job that averages them
+    results = parallel.run_jobs(average_group, [(f'{i}/{group}', (summaries[i][group],)) for i, group in keys], n_workers)
+    avg_summaries = [{} for _ in summaries]
+    for (i, group), group_df in zip(keys, results):
+        avg_summaries[i][group] = group_df
+    return avg_summaries
 
 def run(
     path_summarised_nt_alignment_output_folder,
@@ -18,46 +77,21 @@ def run(
     path_summarised_templated_alignment_all_output_folder,
     path_avg_summarised_nt_alignment_output_folder,
     path_avg_summarised_templated_alignment_output_folder,
-    path_avg_summarised_templated_alignment_all_output_folder):
+    path_avg_summarised_templated_alignment_all_output_folder,
+    n_workers=None):
     print(Fore.MAGENTA + "\nAveraging statistics for different types of variation across multiple replicates ...")
 
-    # Loop through each group
-    for input_path, output_path in zip([path_summarised_nt_alignment_output_folder, path_summarised_templated_alignment_output_folder, path_summarised_templated_alignment_all_output_folder], [path_avg_summarised_nt_alignment_output_folder, path_avg_summarised_templated_alignment_output_folder, path_avg_summarised_templated_alignment_all_output_folder]):
-        # Get group folders
-        group_folders = os.listdir(input_path)
+    input_paths = [path_summarised_nt_alignment_output_folder, path_summarised_templated_alignment_output_folder, path_summarised_templated_alignment_all_output_folder]
+    output_paths = [path_avg_summarised_nt_alignment_output_folder, path_avg_summarised_templated_alignment_output_folder, path_avg_summarised_templated_alignment_all_output_folder]
+    # Replicate files of each group of each summary, keyed by replicate name 
+    summaries = [{
+        group: table_store.list_tables(f'{input_path}/{group}')
+        for group in os.listdir(input_path)} for input_path in input_paths]
+
+    # Average all summaries and groups at once, then save the group tables 
+    for avg_summary, output_path in zip(average_summaries(summaries, n_workers), output_paths):
         # Create folder if not exists 
         if not os.path.exists(output_path):
             os.makedirs(output_path)
-        # Loop through each group  
-        for group in group_folders:
-            # Get the list of replicate files
-            rep_files = os.listdir(f'{input_path}/{group}')
-            # Create a dataframe that store replicates within the same group 
-            group_df = pd.DataFrame()
-            # Loop through each replicate file 
-            for rep_file in rep_files:
-                # Get replicate name 
-                rep_name = rep_file.split('.')[0]
-                # Read the replicate file 
-                rep_df = pd.read_csv(f'{input_path}/{group}/{rep_file}', dtype={'Position': 'str'})
-                # Key columns 
-                key_cols = set(rep_df.columns) - {'value'}
-                # Rename value column to replicate name
-                rep_df = rep_df.rename(columns={'value': rep_name})
-                # Check if the group_df is empty. If yes, group_df is set to be the first replicate 
-                if group_df.empty:
-                    group_df = rep_df
-                # If not, merge that replicate to the current group_df 
-                else:
-                    group_df = pd.merge(group_df, rep_df, on=list(key_cols), how='outer')
-                    group_df = group_df.fillna(0)
-
-            # Get list of replicate columns 
-            rep_cols = set(group_df.columns) - key_cols
-            # Calculate the average value across all replicates
-            group_df['count'] = group_df.apply(lambda r: get_avg(r, rep_cols), axis = 1)
-            # Select subset of important columns  
-            group_df = group_df[list(key_cols)+['count']]
-            # Export to csv file 
-            group_df.to_csv(f'{output_path}/{group}.csv', index=False)
-                
+        for group, group_df in avg_summary.items():
+            table_store.write_table(group_df, f'{output_path}/{group}')
@@ -0,0 +1,66 @@
+import pandas as pd
+import os
+import sys
+import time
+import summarise_isomir_sea
+from colorama import Fore, Style, init
+init(autoreset=True)
+
+def read_replicate(path_rep_file):
+    """Read an isomiR-SEA raw output file the same way summarise_isomir_sea.run() does before annotation.
+
+    Parameters
+    ----------
+    path_rep_file : str
+        Path to the isomiR-SEA raw output file of a replicate.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The isomiR-SEA output table, ready to be annotated.
+    """
+    return summarise_isomir_sea.prepare_isomiR_SEA_output(pd.read_csv(path_rep_file, sep='\t', encoding='latin-1'))
+
+def benchmark_replicate(path_rep_file):
+    """Compare the row-wise (apply + add_columns) and column-wise (annotate_isomiRs) annotation of a replicate.
+
+    Parameters
+    ----------
+    path_rep_file : str
+        Path to the isomiR-SEA raw output file of a replicate.
+
+    Returns
+    -------
+    int, float, float, bool
+        The number of rows, the time taken by each path (in seconds) and whether both paths give identical values.
+    """
+    isomiR_SEA_output = read_replicate(path_rep_file)
+    cols = ['5p_nt_diff', 'snp_nt', '3p_nt_diff', 'type', 'annotation']
+
+    start = time.perf_counter()
+    row_wise = isomiR_SEA_output.apply(lambda r: summarise_isomir_sea.add_columns(r), axis = 1)
+    row_wise_time = time.perf_counter() - start
+    row_wise.columns = cols
+
+    start = time.perf_counter()
+    column_wise = summarise_isomir_sea.annotate_isomiRs(isomiR_SEA_output)
+    column_wise_time = time.perf_counter() - start
+
+    is_identical = all((row_wise[col].astype(str).to_numpy() == column_wise[col].astype(str).to_numpy()).all() for col in cols)
+
+    return len(isomiR_SEA_output), row_wise_time, column_wise_time, is_identical
+
+def run(path_raw_output_folder):
+    print(Fore.MAGENTA + "\nBenchmarking isomiR annotation: apply(add_columns) vs annotate_isomiRs ...")
+
+    # Loop through each replicate of each group
+    for group in sorted(os.listdir(path_raw_output_folder)):
+        for rep_file in sorted(os.listdir(f'{path_raw_output_folder}/{group}')):
+            n_rows, row_wise_time, column_wise_time, is_identical = benchmark_replicate(f'{path_raw_output_folder}/{group}/{rep_file}')
+            colour = Fore.GREEN if is_identical else Fore.RED
+            print(f"{group}/{rep_file}: {n_rows} rows | apply {row_wise_time:.3f}s | vectorised {column_wise_time:.3f}s | x{row_wise_time / max(column_wise_time, 1e-9):.1f} | " + colour + ('identical' if is_identical else 'DIFFERENT'))
+
+if __name__ == "__main__":
+    # Usage: python benchmark_summarise_isomir_sea.py [path to isomiR-SEA outputs folder]
+    path_raw_output_folder = sys.argv[1] if len(sys.argv) > 1 else '../input/mmu/isomiR-SEA_outputs'
+    run(path_raw_output_folder)
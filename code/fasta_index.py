@@ -0,0 +1,188 @@
+import pandas as pd
+import os
+import mmap
+
+# Columns of a .fai index file (same format as samtools faidx)
+FASTA_INDEX_COLUMNS = ['name', 'length', 'offset', 'line_bases', 'line_width']
+
+# Complement of each nucleotide (IUPAC codes included), case is kept
+COMPLEMENT = bytes.maketrans(b'ACGTURYKMBVDHNacgturykmbvdhn', b'TGCAAYRMKVBHDNtgcaayrmkvbhdn')
+
+def build_fasta_index(path_genomic_file):
+    """Build the index of a fasta file: the length of each sequence and where it starts in the file.
+
+    Parameters
+    ----------
+    path_genomic_file : str
+        Path to the genome file. All lines of a sequence must have the same length, except the last one.
+
+    Example
+    -------
+    ```
+    Genome file:
+    >chr1 some description
+    ACGTACGTAC
+    GTACG
+    >chr2
+    TTTT
+
+    Output:
+    name | length | offset | line_bases | line_width
+    chr1 |     15 |     23 |         10 |         11
+    chr2 |      4 |     46 |          4 |          5
+    ```
+
+    Returns
+    -------
+    pandas.DataFrame
+        The index with columns name (first word of the header), length, offset (of the first base), line_bases (bases per line), line_width (bytes per line, including the line break).
+    """
+    index_rows = []
+    with open(path_genomic_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as genome:
+        header_start = genome.find(b'>')
+        while header_start != -1:
+            header_end = genome.find(b'\n', header_start)
+            name = genome[header_start + 1:header_end].split()[0].decode()
+            seq_start = header_end + 1
+            # The sequence ends where the next header starts
+            header_start = genome.find(b'\n>', header_end)
+            seq_end = header_start + 1 if header_start != -1 else len(genome)
+            header_start = seq_end if header_start != -1 else -1
+
+            seq = genome[seq_start:seq_end]
+            first_line_end = seq.find(b'\n')
+            first_line = seq[:first_line_end + 1] if first_line_end != -1 else seq
+            line_width = len(first_line)
+            line_bases = len(first_line.rstrip(b'\r\n'))
+            length = len(seq) - seq.count(b'\n') - seq.count(b'\r')
+            index_rows.append([name, length, seq_start, line_bases, line_width])
+    return pd.DataFrame(index_rows, columns=FASTA_INDEX_COLUMNS)
+
+def get_fasta_index(path_genomic_file):
+    """Get the index of a fasta file, built once and cached next to it (<genome file>.fai).
+
+    Parameters
+    ----------
+    path_genomic_file : str
+        Path to the genome file.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The index (see build_fasta_index()), indexed by sequence name. The cached index is rebuilt if it is older than the genome file.
+    """
+    path_index_file = f'{path_genomic_file}.fai'
+    if os.path.isfile(path_index_file) and os.path.getmtime(path_index_file) >= os.path.getmtime(path_genomic_file):
+        fasta_index = pd.read_csv(path_index_file, sep='\t', header=None, names=FASTA_INDEX_COLUMNS, usecols=range(len(FASTA_INDEX_COLUMNS)), dtype={'name': str})
+    else:
+        fasta_index = build_fasta_index(path_genomic_file)
+        fasta_index.to_csv(path_index_file, sep='\t', header=False, index=False)
+    return fasta_index.set_index('name')
+
+def read_headers(path_genomic_file, fasta_index):
+    """Read the header line of each sequence, seeking to it from the index (sequence lines are not read).
+
+    Parameters
+    ----------
+    path_genomic_file : str
+        Path to the genome file.
+    fasta_index : pandas.DataFrame
+        The index returned by get_fasta_index().
+
+    Returns
+    -------
+    pandas.Series
+        The header line (without '>') of each sequence, indexed by sequence name e.g {'chr1': 'chr1 some description', ...}
+    """
+    headers = []
+    with open(path_genomic_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as genome:
+        for offset in fasta_index['offset'].tolist():
+            # The header is the line before the first base
+            header_start = genome.rfind(b'>', 0, offset)
+            headers.append(genome[header_start + 1:offset].rstrip(b'\r\n').decode())
+    return pd.Series(headers, index=fasta_index.index, dtype=object)
+
+def reverse_complement(seq):
+    """Get the reverse complement of a sequence.
+
+    Parameters
+    ----------
+    seq : bytes
+        A nucleotide sequence e.g b'ACGtt'.
+
+    Returns
+    -------
+    bytes
+        The reverse complement e.g b'aaCGT'.
+    """
+    return seq.translate(COMPLEMENT)[::-1]
+
+def get_sequence_lengths(path_genomic_file, chrs, chr_aliases=None):
+    """Get the length of the sequence of each chromosome name in the genome file.
+
+    Parameters
+    ----------
+    path_genomic_file : str
+        Path to the genome file.
+    chrs : pandas.Series
+        Chromosome names e.g the chr column of regions.
+    chr_aliases : dict
+        The sequence name in the genome file of each chr name, if they differ (see fetch_sequences()).
+
+    Returns
+    -------
+    pandas.Series
+        The sequence length of each chromosome name, with the same index as chrs. NaN for chromosomes not found in the genome file.
+    """
+    fasta_index = get_fasta_index(path_genomic_file)
+    seq_names = chrs.astype(str)
+    if chr_aliases is not None:
+        seq_names = seq_names.map(chr_aliases)
+    return seq_names.map(fasta_index['length'])
+
+def fetch_sequences(path_genomic_file, regions, chr_aliases=None):
+    """Fetch the sequences of genomic regions (like bedtools getfasta -s).
+
+    Parameters
+    ----------
+    path_genomic_file : str
+        Path to the genome file.
+    regions : pandas.DataFrame
+        The regions with columns chr, start (0-based), end (exclusive) and strand ('+' or '-').
+    chr_aliases : dict
+        The sequence name in the genome file of each chr name used in regions, if they differ e.g {'chr1': 'NC_000067.7', ...}
+
+    Returns
+    -------
+    pandas.Series
+        The sequence of each region (reverse complemented on '-' strand), with the same index as regions. Regions on unknown chromosomes or beyond the chromosome ends are dropped.
+    """
+    fasta_index = get_fasta_index(path_genomic_file)
+
+    # Sequence name of each region in the genome file
+    seq_names = regions['chr'].astype(str)
+    if chr_aliases is not None:
+        seq_names = seq_names.map(chr_aliases)
+
+    # Keep regions within known chromosomes
+    chr_lengths = seq_names.map(fasta_index['length'])
+    is_valid = chr_lengths.notna() & (regions['start'] >= 0) & (regions['end'] <= chr_lengths) & (regions['start'] < regions['end'])
+    if not is_valid.all():
+        print(f'  {(~is_valid).sum()} regions on unknown chromosomes or beyond the chromosome ends are skipped')
+    regions = regions[is_valid]
+
+    # Byte positions of the first and the last base of each region, skipping line breaks
+    chr_index = fasta_index.loc[seq_names[is_valid]]
+    offsets, line_bases, line_widths = chr_index['offset'].to_numpy(), chr_index['line_bases'].to_numpy(), chr_index['line_width'].to_numpy()
+    starts, ends = regions['start'].to_numpy(), regions['end'].to_numpy() - 1
+    start_bytes = offsets + starts // line_bases * line_widths + starts % line_bases
+    end_bytes = offsets + ends // line_bases * line_widths + ends % line_bases + 1
+
+    seqs = []
+    with open(path_genomic_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as genome:
+        for start_byte, end_byte, strand in zip(start_bytes.tolist(), end_bytes.tolist(), regions['strand']):
+            seq = genome[start_byte:end_byte].replace(b'\n', b'').replace(b'\r', b'')
+            if strand == '-':
+                seq = reverse_complement(seq)
+            seqs.append(seq.decode())
+    return pd.Series(seqs, index=regions.index, dtype=object)
@@ -1,114 +1,245 @@
 import pandas as pd 
-import subprocess
+import numpy as np
 import re
 import os
 import re
 import sys
-import fileinput
+import json
+import fasta_index
+import stage_manifest
+import summarise_isomir_sea
+import table_store
 from colorama import Fore, Style, init
 init(autoreset=True)
 
-def extract_miRBase_miR_info(row):
-    """Extract 'id', 'name', 'derives_from' of an miRNA from mirBase gff3. 
+# Minimum flank length extracted for the precursor cache, so that changes of the max nt differences are served from the cache
+PRECURSOR_CACHE_FLANK = 10
+# Columns of the precursor cache files (part of the cache key, so that files of previous formats are not read)
+PRECURSOR_CACHE_COLUMNS = ['mir_name', 'precursor_seq', 'flank_5p', 'flank_3p']
+
+def parse_miRBase_gff(path_coords_file):
+    """Parse a miRBase gff3 file (the file is only read, comment lines are skipped). 
 
     Parameters
     ----------
-    row : pd.Series 
-        A 1D array that corresponds to a row in mirBase gff3.
-    
+    path_coords_file : str 
+        Path to the miRBase gff3 file. 
+
+    Example
+    -------
+    ```
+    Input line : chr1	.	miRNA	12425	12447	.	+	.	ID=MIMAT0000001;Alias=MIMAT0000001;Name=cel-let-7-5p;Derives_from=MI0000001
+    Output row : chr = chr1, type = miRNA, start = 12425, end = 12447, strand = +, id = MIMAT0000001, name = cel-let-7-5p, derives_from = MI0000001
+    ```
+
+    Returns 
+    -------
+    pd.DataFrame 
+        The coordinates with columns chr, type, start, end, strand, id, name, derives_from of all miRNAs and miRNA primary transcripts. 
+    """
+    gff = pd.read_csv(path_coords_file, sep='\t', header=None, names=["chr", "unknown1", "type", "start", "end", "unknown2", "strand", "unknown3", "details"], dtype=str, usecols=["chr", "type", "start", "end", "strand", "details"])
+    # Remove comment lines 
+    gff = gff[~gff['chr'].str.startswith('#') & gff['details'].notna()]
+    # Extract 'id', 'name', 'derives_from' from the attributes 
+    return pd.DataFrame({
+        'chr': gff['chr'],
+        'type': gff['type'].astype('category'),
+        'start': gff['start'].astype('int64'),
+        'end': gff['end'].astype('int64'),
+        'strand': gff['strand'].astype('category'),
+        'id': gff['details'].str.extract(r'(?:^|;)Alias=([^;]*)', expand=False),
+        'name': gff['details'].str.extract(r'(?:^|;)Name=([^;]*)', expand=False),
+        'derives_from': gff['details'].str.extract(r'(?:^|;)Derives_from=([^;]*)', expand=False).fillna('')}).reset_index(drop=True)
+
+def read_miRNA_coordinates(is_mirbase_gff, path_coords_file):
+    """Read the miRNA coordinates, from a binary cache next to the coordinates file (<coords file>.cache.pkl) if the file size and modification time are unchanged. 
+
+    Parameters
+    ----------
+    is_mirbase_gff : boolean
+        Is the miRNA coordinates from miRBase gff file ? 
+    path_coords_file : str 
+        Path to the miRNA coordinates file (miRBase gff3 or custom excel file). 
+
     Returns 
     -------
-    pd.Series 
-        Values of 'id', 'name', 'derives_from' 
+    pd.DataFrame 
+        The coordinates of mature miRNAs with columns chr, name, start, end, strand. 
     """
-    details = row['details'].split(';')
-    if (row['type'] == "miRNA_primary_transcript"):
-        return pd.Series([details[1].split('=')[1], details[2].split('=')[1], ''])
+    path_cache_file = f'{path_coords_file}.cache.pkl'
+    stat = os.stat(path_coords_file)
+    cache_key = {'is_mirbase_gff': is_mirbase_gff, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    if os.path.isfile(path_cache_file):
+        cache = pd.read_pickle(path_cache_file)
+        if cache['key'] == cache_key:
+            return cache['genomic_coordinates'].copy()
+
+    if is_mirbase_gff: 
+        genomic_coordinates = parse_miRBase_gff(path_coords_file)
+        genomic_coordinates = genomic_coordinates[(genomic_coordinates['type'] == 'miRNA')]
+        genomic_coordinates = genomic_coordinates[['chr', 'name', 'start', 'end', 'strand']].reset_index(drop=True)
     else:
-        return pd.Series([details[1].split('=')[1], details[2].split('=')[1], details[3].split('=')[1]])
+        genomic_coordinates = pd.read_excel(path_coords_file)
+    pd.to_pickle({'key': cache_key, 'genomic_coordinates': genomic_coordinates}, path_cache_file)
+    return genomic_coordinates
     
-def create_bed_coordinates(genomic_coordinates, max_nt_diff_5p, max_nt_diff_3p, path_precursor_output_folder):
-    """Create a bed file that stores coordinates of extended precursors. 
+def get_extended_precursor_regions(genomic_coordinates, max_nt_diff_5p, max_nt_diff_3p):
+    """Get the genomic regions of extended precursors. 
     
     Parameters
     ----------
     genomic_coordinates : pd.DataFrame 
-        A dataframe that stores coordinates of miRNAs. 
+        A dataframe that stores coordinates of miRNAs (chr, name, start, end, strand, 1-based). 
     max_nt_diff_5p : int 
         The maximum number of nucleotide difference at 5' end across all isomiRs.
     max_nt_diff_3p : int 
         The maximum number of nucleotide difference at 3' end across all isomiRs.
-    path_precursor_output_folder : str 
-        Path to the output file.
 
     Returns 
     -------
-    None. A bed file is generated and saved to path_precursor_output_folder.
-    
+    pd.DataFrame
+        The regions with columns chr, name, start (0-based), end (exclusive), strand. The 5' extension is upstream on '+' strand and downstream on '-' strand.
     """
     shift = 1
-    with open(f'{path_precursor_output_folder}/extended_precursor_coords.bed', "w+") as bed_file: 
-        for _, r in genomic_coordinates.iterrows(): 
-            if r['strand'] == '+':
-                bed_file.write(f"{r['chr']}\t{int(r['start']) - max_nt_diff_5p - shift}\t{int(r['end']) + max_nt_diff_3p}\t{r['name']}\t1\t{r['strand']}\n")
-            else: 
-                bed_file.write(f"{r['chr']}\t{int(r['start']) - max_nt_diff_3p - shift}\t{int(r['end']) + max_nt_diff_5p}\t{r['name']}\t1\t{r['strand']}\n")
+    is_plus_strand = genomic_coordinates['strand'] == '+'
+    return pd.DataFrame({
+        'chr': genomic_coordinates['chr'].astype(str),
+        'name': genomic_coordinates['name'],
+        'start': genomic_coordinates['start'].astype(int) - np.where(is_plus_strand, max_nt_diff_5p, max_nt_diff_3p) - shift,
+        'end': genomic_coordinates['end'].astype(int) + np.where(is_plus_strand, max_nt_diff_3p, max_nt_diff_5p),
+        'strand': genomic_coordinates['strand']})
+
+def clip_flanks(extended_precursor_regions, flank_5p, flank_3p, chr_lengths):
+    """Clip the flanks of extended precursor regions at the ends of chromosomes, so that miRNAs near the ends still get the flanks available. 
+
+    Parameters
+    ----------
+    extended_precursor_regions : pd.DataFrame 
+        The regions returned by get_extended_precursor_regions() with flank_5p / flank_3p. 
+    flank_5p : int
+        The number of nucleotides at 5' end of each miRNA.
+    flank_3p : int
+        The number of nucleotides at 3' end of each miRNA.
+    chr_lengths : pd.Series 
+        The length of the chromosome of each region (NaN if unknown, see fasta_index.get_sequence_lengths()). 
+
+    Example
+    -------
+    ```
+    Chromosome of 100 nt, flanks 10 / 10, miRNA 1-based at 5-26 on '+' strand 
+    Input region : start = -6, end = 36 
+    Output region: start = 0, end = 36, flank_5p = 4, flank_3p = 10
+    ```
+
+    Returns 
+    -------
+    pd.DataFrame
+        The regions with start and end clipped to the chromosome (only within flanks, regions of miRNAs beyond the ends are kept as is), and the number of nucleotides actually extracted at 5' end (flank_5p) and 3' end (flank_3p) of each miRNA.
+    """
+    is_plus_strand = (extended_precursor_regions['strand'] == '+').to_numpy()
+    # Flank at the start / end of each region (5' flank is downstream on '-' strand)
+    flank_start = np.where(is_plus_strand, flank_5p, flank_3p)
+    flank_end = np.where(is_plus_strand, flank_3p, flank_5p)
+    # Nucleotides of the flanks beyond the chromosome start / end
+    clipped_start = np.clip(-extended_precursor_regions['start'].to_numpy(), 0, flank_start)
+    clipped_end = np.clip(np.nan_to_num(extended_precursor_regions['end'].to_numpy() - chr_lengths.to_numpy(dtype=float)), 0, flank_end).astype(int)
+    return extended_precursor_regions.assign(
+        start=extended_precursor_regions['start'] + clipped_start,
+        end=extended_precursor_regions['end'] - clipped_end,
+        flank_5p=flank_5p - np.where(is_plus_strand, clipped_start, clipped_end),
+        flank_3p=flank_3p - np.where(is_plus_strand, clipped_end, clipped_start))
+
+def match_chromosome(header, chr_names, chr_numbers, chr_name_pattern, chr_number_pattern):
+    """Match the header of a sequence in the genome file with a chromosome name in miRBase or customed coordinates file. 
+
+    Parameters
+    ----------
+    header : str 
+        The header line of the sequence (without '>') in lower case e.g 'nc_000067.7 mus musculus strain c57bl/6j chromosome 1, grcm39'. 
+    chr_names : list 
+        List of chromosome names in miRBase or customed coordinates file (in lower case). 
+    chr_numbers : list 
+        The chromosome number of each of chr_names e.g '1' for 'chr1' (None for names without 'chr'). 
+    chr_name_pattern : re.Pattern 
+        Pattern matching any of chr_names as a whole word. 
+    chr_number_pattern : re.Pattern 
+        Pattern matching 'chromosome <number>' or 'chr<number>' for the chr_names containing 'chr' (<number> is the name without 'chr'), None if there is none. 
+
+    Returns
+    -------
+    str 
+        The matched chromosome name, or the first word of the header if there is no match.
+    """
+    if 'tetraodon8' in header:
+        return re.search(r"(\w+)", header).group(1)
+    elif len(chr_names) == 1:
+        return chr_names[0]
+    elif 'contig' in chr_names[0]:
+        contig_number = int(re.search(r'\.([0-9]+)\s', header + ' ').group(1))
+        contig_name = f"contig{contig_number}"
+        return contig_name if contig_name in chr_names else header.split()[0]
+
+    # The first chromosome name (in chr_names order) found in the header
+    matches = [chr_names.index(match.group(1)) for match in chr_name_pattern.finditer(header)]
+    if not matches and chr_number_pattern is not None: 
+        matches = [chr_numbers.index(match.group(1)) for match in chr_number_pattern.finditer(header)]
+    return chr_names[min(matches)] if matches else header.split()[0]
 
 def match_chromosomes(path_genomic_file, chr_names):
-    """Match chromosome names in miRBase or customed coordinates file with those in a given genome file. 
+    """Match chromosome names in miRBase or customed coordinates file with those in a given genome file. Only the header lines are read, the genome file is not modified.
 
     Parameters
     ----------
     path_genomic_file : str 
         Path to the genome file. 
     chr_names : list 
-        List of chromosome names in miRBase or customed coordinates file.
+        List of chromosome names in miRBase or customed coordinates file (in lower case).
 
     Returns
     -------
-    None. The genome file's chromosome names are replaced with those from miRBase or customed coordinates file (if they match).
-    """
-    for line in fileinput.input(path_genomic_file, inplace = 1): 
-        line = line.lower()
-        if line.strip().startswith('>'):
-            if 'tetraodon8' in line:
-                chr = re.search(r">(\w+)", line).group(1)
-                print('>' + chr)
-            elif len(chr_names) == 1:
-                print('>' + chr_names[0])
-            elif 'contig' in chr_names[0]:
-                contig_number = int(re.search(r'\.([0-9]+)\s', line).group(1))
-                contig_name = f"contig{contig_number}"
-                if contig_name in chr_names:
-                    print('>' + contig_name)
-                else:
-                    print(line.rstrip())
-            else:
-                chr = ''
-                for chr_name in chr_names:
-                    match = re.search(rf"\b{chr_name}\b", line)
-                    if match: 
-                        chr = chr_name
-                        break
-                if chr == '': 
-                    for chr_name in chr_names:
-                        if 'chr' in chr_name:
-                            number = chr_name.replace('chr', '')
-                            match = re.search(rf"\b(?:chromosome|chr)\s?{number}\b", line)
-                            if match: 
-                                chr = chr_name
-                                break
-                    if chr == '':
-                        print(line.rstrip())
-                    else:
-                        print('>' + chr)
-                else:
-                    print('>' + chr)
-        else: 
-            print(line.rstrip())
+    dict 
+        The sequence name in the genome file of each chromosome name e.g {'chr1': 'NC_000067.7', ...}. When several sequences match the same chromosome name, the first one is used.
+    """
+    # Patterns are compiled once for all headers 
+    chr_name_pattern = re.compile(r"\b(" + '|'.join(re.escape(chr_name) for chr_name in chr_names) + r")\b")
+    chr_numbers = [chr_name.replace('chr', '') if 'chr' in chr_name else None for chr_name in chr_names]
+    chr_number_pattern = re.compile(r"\b(?:chromosome|chr)\s?(" + '|'.join(re.escape(chr_number) for chr_number in chr_numbers if chr_number is not None) + r")\b") if any(chr_numbers) else None
+
+    chr_aliases = {}
+    headers = fasta_index.read_headers(path_genomic_file, fasta_index.get_fasta_index(path_genomic_file))
+    for seq_name, header in headers.items():
+        chr_aliases.setdefault(match_chromosome(header.lower(), chr_names, chr_numbers, chr_name_pattern, chr_number_pattern), seq_name)
+    return chr_aliases
+
+def get_chromosome_aliases(path_genomic_file, chr_names):
+    """Get the sequence name in the genome file of each chromosome name (see match_chromosomes()), cached next to the genome file (<genome file>.chr_aliases.json). 
+
+    Parameters
+    ----------
+    path_genomic_file : str 
+        Path to the genome file. 
+    chr_names : list 
+        List of chromosome names in miRBase or customed coordinates file (in lower case).
+
+    Returns
+    -------
+    dict 
+        The sequence name in the genome file of each chromosome name. The cached aliases are matched again if the genome file changed or the chromosome names differ.
+    """
+    path_aliases_file = f'{path_genomic_file}.chr_aliases.json'
+    if os.path.isfile(path_aliases_file) and os.path.getmtime(path_aliases_file) >= os.path.getmtime(path_genomic_file):
+        with open(path_aliases_file) as f:
+            cached_aliases = json.load(f)
+        if cached_aliases['chr_names'] == chr_names:
+            return cached_aliases['chr_aliases']
+
+    chr_aliases = match_chromosomes(path_genomic_file, chr_names)
+    with open(path_aliases_file, 'w') as f:
+        json.dump({'chr_names': chr_names, 'chr_aliases': chr_aliases}, f, indent=1)
+    return chr_aliases
     
-def get_extended_miRNA_coordinates(is_mirbase_gff, is_match_chr_names, max_nt_diff_5p, max_nt_diff_3p, path_precursors_output_folder, path_genomic_file, path_coords_file):
-    """Extract the extended precursor sequences for miRNAs.
+def extract_precursors(is_mirbase_gff, is_match_chr_names, flank_5p, flank_3p, path_genomic_file, path_coords_file):
+    """Extract the precursor sequences for miRNAs with flanks from the genome file.
 
     Parameters
     ----------
@@ -116,99 +247,301 @@ def get_extended_miRNA_coordinates(is_mirbase_gff, is_match_chr_names, max_nt_di
         Is the miRNA coordinates from miRBase gff file ? 
     is_match_chr_names : boolean 
         Is matching chromosome names required ? It must be true if the chromosome names in genome file are not identical to those in miR coordinates file. 
-    max_nt_diff_5p : int
-        The maximum number of nucleotide difference at 5' end across all isomiRs.
-    max_nt_diff_3p : int
-        The maximum number of nucleotide difference at 3' end across all isomiRs.
-    path_precursors_output_folder : str 
-        Path to the folder that stores extracted precursor sequences outputs. 
+    flank_5p : int
+        The number of nucleotides extracted at 5' end of each miRNA.
+    flank_3p : int
+        The number of nucleotides extracted at 3' end of each miRNA.
     path_genomic_file : str 
-        Path to the genome file. 
+        Path to the genome file (indexed once, see fasta_index.get_fasta_index()). 
     path_coords_file : str 
         Path to the miRNA coordinates file. 
 
     Returns 
     -------
-    None. All extracted sequences are saved in a csv file in the path_precursors_output_folder.
+    pandas.DataFrame
+        The precursor sequence with flanks in upper case, T replaced by U (precursor_seq) of each miRNA (mir_name), and the flanks extracted (flank_5p, flank_3p), smaller than requested for miRNAs near the ends of chromosomes (see clip_flanks()). 
 
     """
     chr_names = []
-    genomic_coordinates = pd.DataFrame()
-
-    if is_mirbase_gff == True: 
-        for line in fileinput.input(path_coords_file, inplace = 1):
-            if line.strip().startswith("#"):
-                print("")
-            else:
-                print(line.rstrip())
-        genomic_coordinates = pd.read_csv(path_coords_file, sep='\t', header=None, names=["chr", "unknown1", "type", "start", "end", "unknown2", "strand", "unknown3", "details"])
-        genomic_coordinates[['id', 'name', 'derives_from']] = genomic_coordinates.apply(lambda r: extract_miRBase_miR_info(r), axis = 1)
-        genomic_coordinates = genomic_coordinates[(genomic_coordinates['type'] == 'miRNA')]
-        genomic_coordinates = genomic_coordinates[['chr', 'name', 'start', 'end', 'strand']]
-    else:
-        genomic_coordinates = pd.read_excel(path_coords_file)
+    chr_aliases = None
+
+    # Read miRNA coordinates 
+    genomic_coordinates = read_miRNA_coordinates(is_mirbase_gff, path_coords_file)
 
     # Match chr names in genomic coordinate file with those in genome fasta file 
     if is_match_chr_names:
         genomic_coordinates['chr'] = genomic_coordinates['chr'].astype(str)
         genomic_coordinates['chr'] = genomic_coordinates['chr'].str.lower()        
         chr_names = list(genomic_coordinates['chr'].unique())
-        match_chromosomes(path_genomic_file, chr_names)
+        chr_aliases = get_chromosome_aliases(path_genomic_file, chr_names)
     
-    # Create a bed file that stores coordinates of extended precursors 
-    create_bed_coordinates(genomic_coordinates, max_nt_diff_5p, max_nt_diff_3p, path_precursors_output_folder)   
+    # Fetch the sequences of extended precursors from the genome file, with flanks clipped at the ends of chromosomes 
+    extended_precursor_regions = get_extended_precursor_regions(genomic_coordinates, flank_5p, flank_3p)
+    extended_precursor_regions = clip_flanks(extended_precursor_regions, flank_5p, flank_3p, fasta_index.get_sequence_lengths(path_genomic_file, extended_precursor_regions['chr'], chr_aliases))
+    extracted_seqs = fasta_index.fetch_sequences(path_genomic_file, extended_precursor_regions, chr_aliases)
 
-    abs_path_to_genome_file = os.path.abspath(path_genomic_file)
-    abs_path_to_extended_coords_bed_file = os.path.abspath(f'{path_precursors_output_folder}/extended_precursor_coords.bed') 
-    abs_path_to_extracted_precursor_seqs_file = os.path.abspath(f'{path_precursors_output_folder}/extended_precursor_seqs.fa')
+    # Save all miRNA names, their precursor sequences and the flanks extracted
+    return pd.DataFrame({
+        'mir_name': list(extended_precursor_regions.loc[extracted_seqs.index, 'name']),
+        'precursor_seq': [extracted_seq.upper().replace('T', 'U').strip() for extracted_seq in extracted_seqs],
+        'flank_5p': list(extended_precursor_regions.loc[extracted_seqs.index, 'flank_5p']),
+        'flank_3p': list(extended_precursor_regions.loc[extracted_seqs.index, 'flank_3p'])})
 
-    # Check if the index file exists
-    if os.path.isfile(os.path.abspath(f'{path_genomic_file}.fai')):
-    # If it exists, delete the file
-        os.remove(os.path.abspath(f'{path_genomic_file}.fai'))
+def slice_precursors(precursors, max_nt_diff_5p, max_nt_diff_3p):
+    """Get the extended precursor sequences for smaller flanks by slicing the precursor sequences extracted with larger flanks.
 
-    # Run BEDTools to get extended precursor from genomic coordinates
-    cmd = f'bedtools getfasta -fi {abs_path_to_genome_file} -bed {abs_path_to_extended_coords_bed_file} -fo {abs_path_to_extracted_precursor_seqs_file} -s -nameOnly'
-    subprocess.call(cmd, shell=True)
+    Parameters
+    ----------
+    precursors : pandas.DataFrame
+        The precursor sequences and their flanks (flank_5p, flank_3p) returned by extract_precursors(). 
+    max_nt_diff_5p : int
+        The maximum number of nucleotide difference at 5' end across all isomiRs.
+    max_nt_diff_3p : int
+        The maximum number of nucleotide difference at 3' end across all isomiRs.
+
+    Example
+    -------
+    ```
+    precursor_seq (flank_5p = 4, flank_3p = 4) :        CGGCUGAGAUCGCGAUUAAAGCUGGUCAUG
+    extended_precursor_seq (max nt diffs = 3, 2) :       GGCugagaucgcgauuaaagcugguCA
+    ```
+
+    Returns 
+    -------
+    pandas.DataFrame
+        The extended precursor sequence (extended_precursor_seq) of each miRNA (mir_name), the miRNA in lower case. 
+        MiRNAs too close to the end of a chromosome for the max nt differences (flanks smaller than them) are skipped, as their extended precursor is beyond the chromosome.
+    """
+    # Keep miRNAs whose flanks are large enough
+    is_valid = (precursors['flank_5p'] >= max_nt_diff_5p) & (precursors['flank_3p'] >= max_nt_diff_3p)
+    if not is_valid.all():
+        print(f'  {(~is_valid).sum()} miRNAs too close to the ends of chromosomes are skipped')
+    precursors = precursors[is_valid]
 
-    # From the output file of BEDTools, save all miRNA names and their extended precursor sequences in a csv file 
-    mir_names = [] 
     extended_precursor_seqs = []
-    for line in open(abs_path_to_extracted_precursor_seqs_file).readlines():
-        if line.strip().startswith('>'):
-            mir_names.append(re.search(r'>(.*?)\(', line).group(1))
-        else:
-            extended_precursor_seq = line.upper()
-            extended_precursor_seq = extended_precursor_seq.replace('T', 'U').strip()
-            miRNA_seq = extended_precursor_seq[max_nt_diff_5p:len(extended_precursor_seq) - max_nt_diff_3p]
-            extended_precursor_seq = extended_precursor_seq.replace(miRNA_seq, miRNA_seq.lower())
-            extended_precursor_seqs.append(extended_precursor_seq)
-    pd.DataFrame({'mir_name': mir_names, 'extended_precursor_seq': extended_precursor_seqs}).to_csv(f'{path_precursors_output_folder}/{max_nt_diff_5p}_{max_nt_diff_3p}_extended_precursor_seqs.csv', index=False)
+    for precursor_seq, flank_5p, flank_3p in zip(precursors['precursor_seq'], precursors['flank_5p'], precursors['flank_3p']):
+        extended_precursor_seq = precursor_seq[flank_5p - max_nt_diff_5p:len(precursor_seq) - (flank_3p - max_nt_diff_3p)]
+        miRNA_seq = extended_precursor_seq[max_nt_diff_5p:len(extended_precursor_seq) - max_nt_diff_3p]
+        extended_precursor_seq = extended_precursor_seq.replace(miRNA_seq, miRNA_seq.lower())
+        extended_precursor_seqs.append(extended_precursor_seq)
+    return pd.DataFrame({'mir_name': list(precursors['mir_name']), 'extended_precursor_seq': extended_precursor_seqs})
 
-def run(path_summarised_output_folder, path_precursors_output_folder, path_genomic_file, path_coords_file, is_mirbase_gff, is_match_chr_names):
-    print(Fore.MAGENTA + "\nGenerating extended precursor sequences for miRNAs...")
+def get_precursor_cache_folder(path_genomic_file):
+    """Get the path to the precursor cache folder, stored next to the genome file. 
+
+    Parameters
+    ----------
+    path_genomic_file : str 
+        Path to the genome file. 
+
+    Returns
+    -------
+    str 
+        Path to the precursor cache folder e.g 'input/mmu/precursor_cache'
+    """
+    return os.path.join(os.path.dirname(path_genomic_file), 'precursor_cache')
+
+def get_cached_precursors(is_mirbase_gff, is_match_chr_names, max_nt_diff_5p, max_nt_diff_3p, path_genomic_file, path_coords_file):
+    """Get the precursor sequences with flanks of at least max_nt_diff_5p / max_nt_diff_3p from the precursor cache, extracting them if needed. 
+
+    The cache holds one file per (genome, miRNA coordinates, options) e.g 'input/mmu/precursor_cache/<key>_10_10.csv' where 10_10 are the extracted flanks. 
+    Flanks are extracted with at least PRECURSOR_CACHE_FLANK nucleotides, so that any smaller max nt differences are served from the same file. 
+    Flanks are clipped at the ends of chromosomes and the flanks extracted are stored for each miRNA, so that miRNAs near the ends are kept whenever the max nt differences fit (see clip_flanks()). 
+
+    Parameters
+    ----------
+    See get_extended_precursors(). 
+
+    Returns 
+    -------
+    pandas.DataFrame
+        The precursor sequences and their flanks (see extract_precursors()). 
+    """
+    path_cache_folder = get_precursor_cache_folder(path_genomic_file)
+    if not os.path.exists(path_cache_folder):
+        os.makedirs(path_cache_folder)
+
+    # Key of the genome and miRNA coordinates content (content hashes are cached by file size and modification time)
+    file_hashes = stage_manifest.load_manifest(f'{path_cache_folder}/file_hashes.json')
+    cache_key = stage_manifest.get_key(file_hashes, [path_genomic_file, path_coords_file], [is_mirbase_gff, is_match_chr_names, PRECURSOR_CACHE_COLUMNS])[:16]
+    stage_manifest.save_manifest(file_hashes, f'{path_cache_folder}/file_hashes.json')
+
+    # Flanks of the cached file of that key 
+    flank_5p, flank_3p = 0, 0
+    for file in os.listdir(path_cache_folder):
+        if file.startswith(f'{cache_key}_') and file.endswith('.csv'):
+            flank_5p, flank_3p = [int(flank) for flank in file[:-len('.csv')].split('_')[1:]]
+    path_cache_file = f'{path_cache_folder}/{cache_key}_{flank_5p}_{flank_3p}.csv'
+
+    if os.path.isfile(path_cache_file) and max_nt_diff_5p <= flank_5p and max_nt_diff_3p <= flank_3p:
+        return pd.read_csv(path_cache_file)
+
+    # Extract again with flanks large enough for both the cached and the requested max nt differences 
+    if os.path.isfile(path_cache_file):
+        os.remove(path_cache_file)
+    flank_5p = max(flank_5p, max_nt_diff_5p, PRECURSOR_CACHE_FLANK)
+    flank_3p = max(flank_3p, max_nt_diff_3p, PRECURSOR_CACHE_FLANK)
+    precursors = extract_precursors(is_mirbase_gff, is_match_chr_names, flank_5p, flank_3p, path_genomic_file, path_coords_file)
+    precursors.to_csv(f'{path_cache_folder}/{cache_key}_{flank_5p}_{flank_3p}.csv', index=False)
+    return precursors
+
+def get_extended_precursors(is_mirbase_gff, is_match_chr_names, max_nt_diff_5p, max_nt_diff_3p, path_genomic_file, path_coords_file):
+    """Get the extended precursor sequences for miRNAs, from the precursor cache (see get_cached_precursors()).
+
+    Parameters
+    ----------
+    is_mirbase_gff : boolean
+        Is the miRNA coordinates from miRBase gff file ? 
+    is_match_chr_names : boolean 
+        Is matching chromosome names required ? It must be true if the chromosome names in genome file are not identical to those in miR coordinates file. 
+    max_nt_diff_5p : int
+        The maximum number of nucleotide difference at 5' end across all isomiRs.
+    max_nt_diff_3p : int
+        The maximum number of nucleotide difference at 3' end across all isomiRs.
+    path_genomic_file : str 
+        Path to the genome file. 
+    path_coords_file : str 
+        Path to the miRNA coordinates file. 
+
+    Returns 
+    -------
+    pandas.DataFrame
+        The extended precursor sequence (extended_precursor_seq) of each miRNA (mir_name). 
+
+    """
+    precursors = get_cached_precursors(is_mirbase_gff, is_match_chr_names, max_nt_diff_5p, max_nt_diff_3p, path_genomic_file, path_coords_file)
+    return slice_precursors(precursors, max_nt_diff_5p, max_nt_diff_3p)
+
+def get_extended_miRNA_coordinates(is_mirbase_gff, is_match_chr_names, max_nt_diff_5p, max_nt_diff_3p, path_precursors_output_folder, path_genomic_file, path_coords_file):
+    """Extract the extended precursor sequences for miRNAs and save them to a table file.
+
+    Parameters
+    ----------
+    path_precursors_output_folder : str 
+        Path to the folder that stores the table file. 
+    Others : see get_extended_precursors(). 
+
+    Returns 
+    -------
+    None. All extracted sequences are saved in a table file in the path_precursors_output_folder.
+
+    """
+    extended_precursors = get_extended_precursors(is_mirbase_gff, is_match_chr_names, max_nt_diff_5p, max_nt_diff_3p, path_genomic_file, path_coords_file)
+    # Remove precursor files of previous runs with other max nt differences, later stages read the only table file of the folder
+    for path_table_file in table_store.list_tables(path_precursors_output_folder).values():
+        os.remove(path_table_file)
+    table_store.write_table(extended_precursors, f'{path_precursors_output_folder}/{get_precursor_name(max_nt_diff_5p, max_nt_diff_3p)}')
+
+def get_precursor_name(max_nt_diff_5p, max_nt_diff_3p):
+    """Get the name of the extended precursor sequences table. 
+
+    Parameters
+    ----------
+    max_nt_diff_5p : int 
+        The maximum number of nucleotide difference at 5' end across all isomiRs.
+    max_nt_diff_3p : int 
+        The maximum number of nucleotide difference at 3' end across all isomiRs.
 
+    Returns
+    -------
+    str 
+        e.g '3_8_extended_precursor_seqs'
+    """
+    return f'{max_nt_diff_5p}_{max_nt_diff_3p}_extended_precursor_seqs'
+
+def find_precursor_file(path_precursors_output_folder):
+    """Find the extended precursor sequences file of the precursors output folder (the folder only has the file of the last run). 
+
+    Parameters
+    ----------
+    path_precursors_output_folder : str 
+        Path to the precursors output folder. 
+
+    Returns
+    -------
+    str, int, int 
+        Path to the file, and the maximum number of nucleotide difference at 5' end and at 3' end it was extended with. 
+    """
+    precursor_name, path_precursor_file = list(table_store.list_tables(path_precursors_output_folder).items())[0]
+    return path_precursor_file, int(precursor_name.split('_')[0]), int(precursor_name.split('_')[1])
+
+def get_precursor_file(path_precursors_output_folder, max_nt_diff_5p, max_nt_diff_3p):
+    """Get the path to the extended precursor sequences file. 
+
+    Parameters
+    ----------
+    path_precursors_output_folder : str 
+        Path to the precursors output folder. 
+    max_nt_diff_5p : int 
+        The maximum number of nucleotide difference at 5' end across all isomiRs.
+    max_nt_diff_3p : int 
+        The maximum number of nucleotide difference at 3' end across all isomiRs.
+
+    Returns
+    -------
+    str 
+        Path to the table file e.g '<path_precursors_output_folder>/3_8_extended_precursor_seqs.parquet'
+    """
+    return table_store.get_table_file(f'{path_precursors_output_folder}/{get_precursor_name(max_nt_diff_5p, max_nt_diff_3p)}')
+
+def get_max_nt_diffs(summarised_isomiRs_list):
+    """Get the maximum number of nucleotide difference at 5' and 3' ends across all isomiRs. 
+
+    Parameters
+    ----------
+    summarised_isomiRs_list : list 
+        List of summarised isomiRs tables (one per replicate). 
+
+    Returns
+    -------
+    int, int 
+        The maximum number of nucleotide difference at 5' end and at 3' end (at least 0). 
+    """
     # Max nt difference at 5p and 3p 
     max_nt_diff_5p, max_nt_diff_3p = 0, 0
+    for summarised_isomiRs in summarised_isomiRs_list:
+        # Replicates without kept tags have no maximum
+        if len(summarised_isomiRs) == 0:
+            continue
+        # Update max nt difference at 5p and 3p if necessary
+        if max(summarised_isomiRs['5p_nt_diff']) > max_nt_diff_5p: 
+            max_nt_diff_5p = max(summarised_isomiRs['5p_nt_diff'])
+        if max(summarised_isomiRs['3p_nt_diff']) > max_nt_diff_3p:
+            max_nt_diff_3p = max(summarised_isomiRs['3p_nt_diff'])
+    return int(max_nt_diff_5p), int(max_nt_diff_3p)
+
+def read_max_nt_diffs(path_summarised_output_folder):
+    """Get the maximum number of nucleotide difference at 5' and 3' ends across the summarised isomiRs files. 
+    They are taken from the statistics written by summarise_isomir_sea.run(), or computed from the files if there is no statistics file (see get_max_nt_diffs()). 
+
+    Parameters
+    ----------
+    path_summarised_output_folder : str 
+        Path to the summarised isomiRs output folder (one subfolder per group). 
+
+    Returns
+    -------
+    int, int 
+        The maximum number of nucleotide difference at 5' end and at 3' end. 
+    """
+    summarised_isomiRs_stats = summarise_isomir_sea.read_stats(path_summarised_output_folder)
+    if summarised_isomiRs_stats is not None:
+        return summarised_isomiRs_stats['max_nt_diff_5p'], summarised_isomiRs_stats['max_nt_diff_3p']
+
+    # Read summarised isomiRs file of each replicate of each group 
+    summarised_isomiRs_list = (
+        table_store.read_table(path_rep_file, columns=['5p_nt_diff', '3p_nt_diff']) 
+        for group in os.listdir(path_summarised_output_folder) 
+        for path_rep_file in summarise_isomir_sea.list_summarised_files(path_summarised_output_folder, group).values())
+    return get_max_nt_diffs(summarised_isomiRs_list)
+
+def run(path_summarised_output_folder, path_precursors_output_folder, path_genomic_file, path_coords_file, is_mirbase_gff, is_match_chr_names):
+    print(Fore.MAGENTA + "\nGenerating extended precursor sequences for miRNAs...")
+
     # Create folder if not exists
     if not os.path.exists(path_precursors_output_folder):
         os.makedirs(path_precursors_output_folder)
 
-    # List of group folders 
-    group_folders = os.listdir(path_summarised_output_folder)
-    for group in group_folders:
-        # Get the list of replicate files
-        rep_files = os.listdir(f'{path_summarised_output_folder}/{group}')
-        # Loop through each replicate of that group 
-        for rep_file in rep_files:
-            # Get the replicate name 
-            rep_name = rep_file.split('.')[0]
-            # Read summarised isomiRs file of that replicate 
-            summarised_isomiRs = pd.read_csv(f'{path_summarised_output_folder}/{group}/{rep_file}', encoding='latin-1')
-            # Update max nt difference at 5p and 3p if necessary
-            if max(summarised_isomiRs['5p_nt_diff']) > max_nt_diff_5p: 
-                max_nt_diff_5p = max(summarised_isomiRs['5p_nt_diff'])
-            if max(summarised_isomiRs['3p_nt_diff']) > max_nt_diff_3p:
-                max_nt_diff_3p = max(summarised_isomiRs['3p_nt_diff'])
+    # Max nt difference at 5p and 3p 
+    max_nt_diff_5p, max_nt_diff_3p = read_max_nt_diffs(path_summarised_output_folder)
     get_extended_miRNA_coordinates(is_mirbase_gff, is_match_chr_names, max_nt_diff_5p, max_nt_diff_3p, path_precursors_output_folder, path_genomic_file, path_coords_file)
-
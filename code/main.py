@@ -4,14 +4,8 @@ import subprocess
 import re
 import signal
 import pandas as pd
-import summarise_isomir_sea 
-import avg_summarised_isomirs 
-import generate_precursor
-import nt_templated
-import split_nt_templated
-import summarise_nt_templated
-import avg_summarised_nt_templated
-import process_graph_data
+import pipeline
+import table_store
 from colorama import Fore, Style, init
 init(autoreset=True)
 
@@ -80,12 +74,14 @@ def update_metadata_file(species_code, species_name, input_folder, root_folder):
         'group': group_folders
     })
     if not os.path.exists(metadata_path):
-        species_medadata_df.to_csv(metadata_path, index = False)
+        all_medadata_df = species_medadata_df
     else: 
         current_medadata_df = pd.read_csv(metadata_path)
         current_medadata_df = current_medadata_df[(current_medadata_df['species'] != species_code) & (current_medadata_df['alias'] != species_name)]
         all_medadata_df = pd.concat([current_medadata_df, species_medadata_df], ignore_index=True)
-        all_medadata_df.to_csv(metadata_path, index = False)
+    # Replace the meta file at once, as a running dashboard reloads it when it changes
+    all_medadata_df.to_csv(f'{metadata_path}.tmp', index = False)
+    os.replace(f'{metadata_path}.tmp', metadata_path)
     
 def get_analyse_isomirs_info(): 
     print(Fore.CYAN + "\nStep 1: Input Species Information")
@@ -122,76 +118,37 @@ def get_analyse_isomirs_info():
     
     is_match_chr_names = get_yes_no_value('Is match gff to genome required (Y/N) ?:')
 
+    n_workers = get_numeric_value(f'Number of parallel workers (Press Enter to use all {os.cpu_count()} CPU cores): ')
+
+    is_in_memory = get_yes_no_value('Keep intermediate outputs in memory instead of saving them (Y/N) ?:')
+
+    saved_outputs = list(pipeline.DASHBOARD_OUTPUTS)
+    if is_in_memory:
+        extra_outputs = input(Fore.YELLOW + 'Intermediate output folders to save anyway, comma separated e.g 3_precursors,6_summarised_nt_alignment (Press Enter for none): ').strip()
+        saved_outputs += [name.strip() for name in extra_outputs.split(',') if name.strip()]
+
+    is_csv_exported = table_store.TABLE_FORMAT != 'csv' and get_yes_no_value('Also export the output tables as csv files (Y/N) ?:')
+
     output_root_folder = root_folder + 'output'
     output_folder = f"{output_root_folder}/{species_code}"
     print("Output folder is:", Fore.GREEN + output_folder)
 
-    return root_folder, input_folder, species_code, species_name, read_count_thres, is_mirbase_gff, is_match_chr_names, output_folder
+    return root_folder, input_folder, species_code, species_name, read_count_thres, is_mirbase_gff, is_match_chr_names, n_workers, is_in_memory, saved_outputs, is_csv_exported, output_folder
 
 def analyse_isomirs():
-    root_folder, input_folder, species_code, species_name, read_count_thres, is_mirbase_gff, is_match_chr_names, output_folder = get_analyse_isomirs_info()
-
-    path_genomic_file = input_folder + '/genomic.fa'
-    path_coords_file = input_folder + '/miRNA_annotation.gff3' if is_mirbase_gff else input_folder + '/miRNA_annotation.xlsx'
-    path_raw_output_folder = input_folder + '/isomiR-SEA_outputs'
-    path_summarised_output_folder = output_folder + '/1_summarised_isomiRs'
-    path_avg_replicate_output_folder = output_folder + '/2_avg_replicate_isomiRs'
-    path_precursors_output_folder = output_folder + '/3_precursors'
-    path_nt_templated_alignment_output_folder = output_folder + '/4_nt_templated_alignment'
-    path_nt_alignment_output_folder = output_folder + '/5_nt_alignment'
-    path_templated_alignment_output_folder = output_folder + '/5_templated_alignment'
-    path_summarised_nt_alignment_output_folder = output_folder + '/6_summarised_nt_alignment'
-    path_summarised_templated_alignment_output_folder = output_folder + '/6_summarised_templated_alignment'
-    path_summarised_templated_alignment_all_output_folder = output_folder + '/6_summarised_templated_alignment_all'
-    path_avg_summarised_nt_alignment_output_folder = output_folder + '/7_avg_summarised_nt_alignment'
-    path_avg_summarised_templated_alignment_output_folder = output_folder + '/7_avg_summarised_templated_alignment'
-    path_avg_summarised_templated_alignment_all_output_folder = output_folder + '/7_avg_summarised_templated_alignment_all'
-    path_graph_processed_data_folder = output_folder + '/8_graph_processed_data/'
+    root_folder, input_folder, species_code, species_name, read_count_thres, is_mirbase_gff, is_match_chr_names, n_workers, is_in_memory, saved_outputs, is_csv_exported, output_folder = get_analyse_isomirs_info()
+
+    paths = pipeline.get_paths(input_folder, output_folder, is_mirbase_gff)
 
     try: 
         check_input_files_exist(input_folder)
-        summarise_isomir_sea.run(
-            path_raw_output_folder, 
-            path_summarised_output_folder, 
-            read_count_thres)
-        avg_summarised_isomirs.run(
-            path_summarised_output_folder, 
-            path_avg_replicate_output_folder)
-        generate_precursor.run(
-            path_summarised_output_folder, 
-            path_precursors_output_folder, 
-            path_genomic_file, 
-            path_coords_file, 
-            is_mirbase_gff, 
-            is_match_chr_names)
-        nt_templated.run(
-            path_summarised_output_folder, 
-            path_precursors_output_folder, 
-            path_nt_templated_alignment_output_folder)
-        split_nt_templated.run(
-            path_nt_templated_alignment_output_folder, 
-            path_nt_alignment_output_folder, 
-            path_templated_alignment_output_folder)
-        summarise_nt_templated.run(
-            path_nt_alignment_output_folder,
-            path_templated_alignment_output_folder,
-            path_summarised_nt_alignment_output_folder,
-            path_summarised_templated_alignment_output_folder,
-            path_summarised_templated_alignment_all_output_folder,
-            path_precursors_output_folder)
-        avg_summarised_nt_templated.run(
-            path_summarised_nt_alignment_output_folder,
-            path_summarised_templated_alignment_output_folder,
-            path_summarised_templated_alignment_all_output_folder,
-            path_avg_summarised_nt_alignment_output_folder,
-            path_avg_summarised_templated_alignment_output_folder,
-            path_avg_summarised_templated_alignment_all_output_folder)
-        process_graph_data.run(
-            path_avg_replicate_output_folder,
-            path_avg_summarised_templated_alignment_output_folder,
-            path_avg_summarised_nt_alignment_output_folder,
-            path_avg_summarised_templated_alignment_all_output_folder,
-            path_graph_processed_data_folder)
+        if is_in_memory:
+            pipeline.run_in_memory(paths, read_count_thres, is_mirbase_gff, is_match_chr_names, n_workers=n_workers, saved_outputs=saved_outputs)
+        else:
+            pipeline.run_on_disk(paths, read_count_thres, is_mirbase_gff, is_match_chr_names, n_workers=n_workers)
+        if is_csv_exported:
+            print(Fore.MAGENTA + "\nExporting output tables as csv files ...")
+            print("Csv files are saved in:", Fore.GREEN + table_store.export_csv(paths['output_folder']))
         update_metadata_file(species_code, species_name, input_folder, root_folder)
     except Exception as e: 
         print(f'Analyse isomiRs of {species_name} ({species_code}) failed due to: {e}')
@@ -217,14 +174,6 @@ def visualise_isomirs():
 def kill_process(process):
     os.killpg(os.getpgid(process.pid), signal.SIGKILL)
 
-def is_visualisation_process_stopped(process): 
-    is_stopping_visualisation = get_yes_no_value(Fore.RED + "\nYou can't add more species while the visualisation is running. Do you want to stop it first ?: ")
-    if is_stopping_visualisation: 
-        kill_process(process)
-        return True
-    else:
-        return False
-
 if __name__ == "__main__":
     process = None
     while True: 
@@ -232,12 +181,8 @@ if __name__ == "__main__":
         choice = input(Fore.YELLOW + "\nEnter your choice: ").strip()
 
         if choice == '1':
-            if not process: 
-                analyse_isomirs()
-            else: 
-                if is_visualisation_process_stopped(process):
-                    process = None
-                    analyse_isomirs()
+            # A running visualisation shows the new species once analysed, it does not need to be stopped
+            analyse_isomirs()
         elif choice == '2':
             if process: 
                 print(Fore.MAGENTA + "\nVisualising multi-species work in progress\n")
@@ -1,165 +1,224 @@
-import csv
 import pandas as pd
+import numpy as np
 import os
 import sys
+import summarise_isomir_sea
+import alignment_store
+import generate_precursor
+import table_store
 from colorama import Fore, Style, init
 init(autoreset=True)
 
-def align_isomiR_to_pre_miRNA(max_nt_diff_5p, nt_diff_5p, pre_seq, isomiR_seq):
-    """Align an isomiR sequence to an extended precursor sequence. 
-    The function returns the new isomiR sequence having the same length with the extended precursor sequence, in which unaligned positions are filled with spaces.
+# Columns identifying a distinct isomiR, aligned once across all replicates
+TAG_KEY_COLS = ['mirna_name', 'tag_sequence', '5p_nt_diff']
+
+def get_aligned_matrix(tag_seqs, starts, pre_lens, n_positions):
+    """Align isomiR sequences to their extended precursor sequences, as a matrix of ASCII codes. 
 
     Parameters
     ----------
-    max_nt_diff_5p : int
-        The maximum number of nucleotide difference at 5' end across all isomiRs.
-    nt_diff_5p : int 
-        The number of nucleotide added to / trimmed from the 5' of the canonical. 
-    pre_seq : str 
-        The extended precursor sequence of a miRNA, which is extracted by adding max_nt_diff_5p and max_nt_diff_3p nucleotids to 5' and 3' ends of that miRNA. 
-    isomiR_seq : str 
-        The isomiR sequence. 
+    tag_seqs : pandas.Series
+        The isomiR sequences. 
+    starts : numpy.ndarray
+        The position (0-based) of the first nucleotide of each isomiR in its extended precursor, i.e. max_nt_diff_5p - 5p_nt_diff. 
+    pre_lens : numpy.ndarray
+        The length of the extended precursor of each isomiR. Nucleotides after the end of the extended precursor are dropped. 
+    n_positions : int
+        The number of positions (columns) of the matrix. 
 
     Example
     -----------
     ```
     Extended precursor sequence : "AUGCUAUCCCGCUAAUGCUAUCCCGCU"
     
-    isomiR :                          "UAUCCCGCUAAUGCUAU"      
+    isomiR (start = 4) :              "UAUCCCGCUAAUGCUAU"      
 
-    Output:                       "    UAUCCCGCUAAUGCUAU     "
+    Output (as characters):       "    uaucccgcuaaugcuau      " (unaligned positions are 0)
     ```
     
     Returns
     ------
-    str 
-        An isomiR sequence aligned to the extended precursor sequence. 
+    numpy.ndarray 
+        A uint8 matrix (one row per isomiR, one column per position) of the lower case ASCII code of each nucleotide, 0 where the isomiR has no nucleotide. 
+    """
+    tag_matrix, tag_lens = summarise_isomir_sea.encode_sequences(tag_seqs)
+    # Position i of an isomiR row is nucleotide i - start of its sequence
+    aligned, _ = summarise_isomir_sea.gather_positions(tag_matrix, tag_lens, -starts, pre_lens)
+    aligned = np.pad(aligned, ((0, 0), (0, n_positions - aligned.shape[1])))
+    return to_lower(aligned)
+
+def to_lower(matrix):
+    """Convert a matrix of ASCII codes to lower case. 
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        A uint8 matrix of ASCII codes. 
+
+    Returns
+    -------
+    numpy.ndarray
+        The matrix with upper case letters (A-Z) converted to lower case. 
     """
-    start_position = max_nt_diff_5p - nt_diff_5p
-    aligned_seq = ' ' * start_position + isomiR_seq # start_position should be named gaps in pre-cursor
-    aligned_seq += ' ' * (len(pre_seq) - len(aligned_seq))
+    return np.where((matrix >= ord('A')) & (matrix <= ord('Z')), matrix + (ord('a') - ord('A')), matrix).astype(np.uint8)
 
-    return aligned_seq
+def extended_or_truncated(nt_5p_diff, nt_3p_diff):
+    """
+    Classify isomiRs into truncated, extended, or neither. 
 
-def match_letters(pre_seq, aligned_isomiR_seq):
-    """Convert each nucleotide in isomiR to (<nucleotide>, <matching symbol>) format by comparing the isomiR with the extended precursor. 
+    Parameters
+    ----------
+    nt_5p_diff : numpy.ndarray
+        The number of nucleotide added to / trimmed from the 5' of the canonical, for each isomiR. 
+    nt_3p_diff : numpy.ndarray
+        The number of nucleotide added to / trimmed from the 3' of the canonical, for each isomiR. 
+
+    - If at least one of the end is truncated (and the other end is not extended), the output is 'truncated'.
+    - If at least one of the end is extended (and the other end is not truncated), the output is 'extended'.
+    - Otherwise, the output is ''.
+    Returns
+    -------
+    numpy.ndarray: 
+        Type of each isomiR based on alterations at 5' and 3'. 
     
+    """
+    is_truncated = (nt_5p_diff <= 0) & (nt_3p_diff <= 0) & ((nt_5p_diff < 0) | (nt_3p_diff < 0))
+    is_extended = (nt_5p_diff >= 0) & (nt_3p_diff >= 0) & ((nt_5p_diff > 0) | (nt_3p_diff > 0))
+    return np.select([is_truncated, is_extended], ['truncated', 'extended'], '')
+
+def align_unique_tags(rep_dfs, extended_precursors, max_nt_diff_5p):
+    """Compare nucleotide at each position of each distinct isomiR (miRNA, tag sequence, 5p_nt_diff) of all replicates with their extended precursor, once. 
+
     At each position of an isomiR: 
-    - The nucleotide of the isomiR is the same as that of the extended precursor sequence, matching symbol is +.
-    - The nucleotide of the isomiR is different from that of the extended precursor sequence, matching symbol is -.
-    
+    - The nucleotide of the isomiR is the same as that of the extended precursor sequence: templated (+).
+    - The nucleotide of the isomiR is different from that of the extended precursor sequence: nontemplated (-).
+
     Parameters
     ----------
-    pre_seq : str
-        The extended precursor sequence of a miRNA, which is extracted by adding max_nt_diff_5p and max_nt_diff_3p nucleotides to 5' and 3' ends of that miRNA. 
-    aligned_isomiR_seq : str
-        The output of align_isomiR_to_pre_miRNA().
+    rep_dfs : list
+        The summarised isomiRs (pandas.DataFrame) of each replicate. 
+    extended_precursors : pandas.DataFrame 
+        The extended precursor sequence (extended_precursor_seq) of each miRNA (mir_name).
+    max_nt_diff_5p : int
+        The maximum number of nucleotide difference at 5' end across all isomiRs.
 
-    Example 
+    Example
     -----------
     ```
     Extended precursor sequence : "AUGCUAUCCUGCUGUCCCG"
     
     isomiR :                      "    GAUCCUGCUAU    "   
 
-    Output: [(' ', ' '),  (' ', ' '), (' ', ' '), (' ', ' '), ('g', '-'), ('a', '+'), ('u', '+'), ('c', '+'), ('c', '+'), ('u', '+'), ('g', '+'), ('c', '+'), ('u', '+'), ('g', '-'), ('u', '+'), (' ', ' '),  (' ', ' '), (' ', ' '), (' ', ' ')]  
-    ``` 
+    nt (as characters) :          "    gauccugcuau    "
+    templated :                   "0000011111111011000"
+    ```
 
     Returns
     -------
-    List 
-        A list of nucleotide details in (<nucleotide>, <matching symbol>) format at each position of the isomiR. 
+    dict
+        The unique tag alignment shared by all replicates (see alignment_store.save_alignment()). IsomiRs are grouped by miRNA (sorted by name):
+        - mir_names, pre_seqs: the name and the extended precursor sequence of each miRNA.
+        - offsets: the isomiRs of the i-th miRNA are rows offsets[i] to offsets[i + 1] - 1.
+        - tag_sequences, starts, extended_or_truncated: the sequence, the position of its first nucleotide in the extended precursor and the type of each isomiR.
+        - nt: a uint8 matrix (one row per isomiR, one column per position up to the max extended precursor length) of the lower case ASCII code of each nucleotide, 0 where the isomiR has no nucleotide.
+        - templated: the bit-packed (numpy.packbits() along rows) boolean matrix of templated positions. Positions with a nucleotide that are not templated are nontemplated.
+        - max_nt_diff_5p.
     """
-    matched_letters = []
-    for pre_letter, iso_letter in zip(pre_seq, aligned_isomiR_seq):
-        pre_letter = pre_letter.lower()
-        iso_letter = iso_letter.lower()
-        if iso_letter == ' ':
-            matched_letters.append("(' ', ' ')")  # No match
-        elif iso_letter == pre_letter:
-            matched_letters.append(f"({iso_letter}, +)")  # Match
-        else:
-            matched_letters.append(f"({iso_letter}, -)")  # Mismatch
-    return matched_letters
-
-def extended_or_truncated(nt_5p_diff, nt_3p_diff):
-    """
-    Classify an isomiR into truncated, extended, or neither. 
+    # Distinct isomiRs across all replicates, in order of first appearance
+    tags_df = pd.concat([rep_df[TAG_KEY_COLS + ['3p_nt_diff']] for rep_df in rep_dfs]).drop_duplicates(TAG_KEY_COLS)
+    # Rename mirna_name to mir_name
+    tags_df = tags_df.rename(columns={'mirna_name': 'mir_name'}).astype({'mir_name': str})
+    # Merge with extended_precursors to get the extended precursor sequence for each isomiR
+    tags_df = tags_df.merge(extended_precursors, how='inner', on='mir_name')
+    # Group isomiRs by mirna name, keeping their order within each miRNA
+    tags_df = tags_df.sort_values('mir_name', kind='stable')
+
+    # Calculate max length of extended precursor
+    n_positions = int(extended_precursors['extended_precursor_seq'].str.len().max())
+    # The isomiRs of a miRNA are aligned to the first extended precursor of that miRNA
+    mir_groups = tags_df.groupby('mir_name', sort=True)
+    pre_seqs = mir_groups['extended_precursor_seq'].first()
+    offsets = np.concatenate([[0], np.cumsum(mir_groups.size().to_numpy())]).astype(np.int64)
+    isomiR_mirnas = np.repeat(np.arange(len(pre_seqs)), np.diff(offsets))
+
+    # Align each isomiR and compare it with its (lower case) extended precursor 
+    starts = max_nt_diff_5p - tags_df['5p_nt_diff'].to_numpy(dtype=np.int64)
+    pre_matrix, pre_lens = summarise_isomir_sea.encode_sequences(pre_seqs)
+    pre_matrix = to_lower(np.pad(pre_matrix, ((0, 0), (0, n_positions - pre_matrix.shape[1]))))
+    nt = get_aligned_matrix(tags_df['tag_sequence'], starts, pre_lens[isomiR_mirnas], n_positions)
+    templated = (nt != 0) & (nt == pre_matrix[isomiR_mirnas])
+
+    return {
+        'mir_names': pre_seqs.index.to_numpy(dtype=str),
+        'pre_seqs': pre_seqs.to_numpy(dtype=str),
+        'offsets': offsets,
+        'tag_sequences': tags_df['tag_sequence'].to_numpy(dtype=str),
+        'starts': starts,
+        'extended_or_truncated': extended_or_truncated(tags_df['5p_nt_diff'].to_numpy(), tags_df['3p_nt_diff'].to_numpy()),
+        'nt': nt,
+        'templated': np.packbits(templated, axis=1),
+        'max_nt_diff_5p': max_nt_diff_5p
+    }
+
+def get_replicate_index(rep_df, unique_tag_alignment):
+    """Find the isomiRs of a replicate in the unique tag alignment. 
 
     Parameters
     ----------
-    nt_5p_diff : int
-        The number of nucleotide added to / trimmed from the 5' of the canonical. 
-    nt_3p_diff : int
-        The number of nucleotide added to / trimmed from the 3' of the canonical. 
+    rep_df : pandas.DataFrame 
+        The summarised isomiRs of a replicate. 
+    unique_tag_alignment : dict
+        The unique tag alignment returned by align_unique_tags(). 
 
-    - If at least one of the end is truncated, the output is 'truncated'.
-    - If at least one of the end is extended, the output is 'extended'.
-    - Otherwise, the output is ''.
     Returns
     -------
-    str: 
-        Type of an isomiR based on alterations at 5' and 3'. 
-    
+    dict
+        The replicate index (see alignment_store.get_replicate_alignment()):
+        - rows: the row of each isomiR of the replicate in the unique tag alignment, grouped by miRNA (isomiRs of miRNAs without precursor are dropped).
+        - counts: the read count (#count_tags) of each of those isomiRs.
+        - total_count: the total read count of the replicate (including isomiRs of miRNAs without precursor), to normalise read counts to rpm.
     """
-    if (nt_5p_diff < 0 and nt_3p_diff == 0) or (nt_5p_diff == 0 and nt_3p_diff < 0) or (nt_5p_diff < 0 and nt_3p_diff < 0):
-    # if (nt_5p_diff < 0 or nt_3p_diff < 0):
-        return 'truncated'
-    elif (nt_5p_diff > 0 and nt_3p_diff == 0) or (nt_5p_diff == 0 and nt_3p_diff > 0) or (nt_5p_diff > 0 and nt_3p_diff > 0):
-    # elif (nt_5p_diff > 0 or nt_3p_diff > 0):
-        return 'extended'
-    else: 
-        return ''
+    # Total read count of the replicate, before isomiRs without precursor are dropped
+    total_count = int(rep_df['#count_tags'].sum())
+    # Key of each row of the unique tag alignment
+    tag_keys = pd.DataFrame({
+        'mirna_name': unique_tag_alignment['mir_names'][alignment_store.get_isomiR_mirnas(unique_tag_alignment)],
+        'tag_sequence': unique_tag_alignment['tag_sequences'],
+        '5p_nt_diff': unique_tag_alignment['max_nt_diff_5p'] - unique_tag_alignment['starts'],
+        'row': np.arange(len(unique_tag_alignment['starts']))})
+    # Look up the rows of the isomiRs, grouped by mirna name and keeping their order within each miRNA
+    rep_df = rep_df[TAG_KEY_COLS + ['#count_tags']].astype({'mirna_name': str, 'tag_sequence': str, '5p_nt_diff': np.int64})
+    rep_df = rep_df.merge(tag_keys, how='inner', on=TAG_KEY_COLS).sort_values('mirna_name', kind='stable')
+    return {
+        'rows': rep_df['row'].to_numpy(dtype=np.int64),
+        'counts': rep_df['#count_tags'].to_numpy(dtype=np.int64),
+        'total_count': total_count
+    }
 
 def run(path_summarised_output_folder, path_precursors_output_folder, path_nt_templated_alignment_output_folder):
     print(Fore.MAGENTA + "\nComparing nucleotide at each position of isomiRs ...")
 
     # List of group folders 
     group_folders = os.listdir(path_summarised_output_folder)
-    # Get precursor file 
-    precursor_output_file = [file for file in os.listdir(path_precursors_output_folder) if '.csv' in file][0]
+    # Get precursor file and max nt difference at 5p 
+    path_precursor_file, max_nt_diff_5p, _ = generate_precursor.find_precursor_file(path_precursors_output_folder)
     # Read the extended precursor data  
-    extended_precursors = pd.read_csv(f'{path_precursors_output_folder}/{precursor_output_file}')
-    # Get max nt difference at 5p 
-    max_nt_diff_5p = int(precursor_output_file.split('_')[0])
-    # Loop through each group folder
+    extended_precursors = table_store.read_table(path_precursor_file)
+
+    # Read the summarised isomiRs of each replicate, only the columns used for the alignment
+    rep_dfs = {}
     for group in group_folders:
-        # Get the list of replicate files
-        rep_files = os.listdir(f'{path_summarised_output_folder}/{group}')
+        for rep_name, path_rep_file in table_store.list_tables(f'{path_summarised_output_folder}/{group}').items():
+            rep_dfs[(group, rep_name)] = table_store.read_table(path_rep_file, columns=TAG_KEY_COLS + ['3p_nt_diff', '#count_tags'])
 
+    # Align each distinct isomiR once for all replicates
+    unique_tag_alignment = align_unique_tags(list(rep_dfs.values()), extended_precursors, max_nt_diff_5p)
+    if not os.path.exists(path_nt_templated_alignment_output_folder):
+        os.makedirs(path_nt_templated_alignment_output_folder)
+    alignment_store.save_alignment(unique_tag_alignment, alignment_store.get_unique_tags_file(path_nt_templated_alignment_output_folder))
+
+    # Each replicate only stores the rows and the read counts of its isomiRs
+    for (group, rep_name), rep_df in rep_dfs.items():
         if not os.path.exists(f'{path_nt_templated_alignment_output_folder}/{group}'):
             os.makedirs(f'{path_nt_templated_alignment_output_folder}/{group}')
-
-        # Loop through each replicate file 
-        for rep_file in rep_files:
-            # Read the replicate file
-            rep_df = pd.read_csv(f'{path_summarised_output_folder}/{group}/{rep_file}', encoding='latin-1')
-            # Rename mirna_name to mir_name
-            rep_df = rep_df.rename(columns={'mirna_name': 'mir_name'})
-            # Merge with extended_precursors to get the extended precursor sequence for each isomiR
-            rep_df = rep_df.merge(extended_precursors, how='inner', on='mir_name')
-            # Get replicate name 
-            rep_name = rep_file.split('.')[0]
-
-            with open(f'{path_nt_templated_alignment_output_folder}/{group}/{rep_name}.csv', 'w+', newline='') as f:
-                writer = csv.writer(f)
-                # Calculate max length of extended precursor
-                max_extended_precursor_len = max([len(extended_precursor_seq) for extended_precursor_seq in list(extended_precursors['extended_precursor_seq'])])
-                # Write file header
-                writer.writerow(['name', 'pre_seq', 'is_pre', 'extended_or_truncated'] + [str(i) for i in range(1, max_extended_precursor_len + 1)])
-                # Group isomiRs by mirna name and loop over each group 
-                grouped_mir_name = rep_df.groupby('mir_name')
-                for mir_name, mir_group in grouped_mir_name:
-                    # Get the first record of mir_group 
-                    first_r = mir_group.iloc[0]
-                    pre_seq = first_r['extended_precursor_seq']
-                    # Write a row for the extended precursor for the miRNA.
-                    writer.writerow([mir_name, pre_seq, True, ''] + list(pre_seq))
-                    for _, r in mir_group.iterrows(): 
-                        aligned_seq = align_isomiR_to_pre_miRNA(max_nt_diff_5p, r['5p_nt_diff'], pre_seq, r['tag_sequence'])
-                        matched_letters = match_letters(pre_seq, aligned_seq)
-                        writer.writerow([mir_name, aligned_seq, False, extended_or_truncated(r['5p_nt_diff'], r['3p_nt_diff'])] + list(matched_letters))
-
-
-                
-    
\ No newline at end of file
+        alignment_store.save_alignment(get_replicate_index(rep_df, unique_tag_alignment), alignment_store.get_alignment_file(f'{path_nt_templated_alignment_output_folder}/{group}', rep_name))
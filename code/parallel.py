@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from colorama import Fore, Style, init
+init(autoreset=True)
+
+def get_n_workers(n_workers=None, n_jobs=None):
+    """Get the number of worker processes to use.
+
+    Parameters
+    ----------
+    n_workers : int
+        The requested number of worker processes. None or 0 means one per CPU core.
+    n_jobs : int
+        The number of jobs to run. There is no point having more workers than jobs.
+
+    Returns
+    -------
+    int
+        The number of worker processes (at least 1).
+    """
+    if not n_workers:
+        n_workers = os.cpu_count() or 1
+    if n_jobs is not None:
+        n_workers = min(n_workers, n_jobs)
+    return max(n_workers, 1)
+
+def run_jobs(func, jobs, n_workers=None):
+    """Run independent jobs (e.g. one per replicate) across a pool of worker processes.
+
+    Parameters
+    ----------
+    func : callable
+        A module-level function (so that it can be sent to worker processes) that processes one job.
+    jobs : list
+        List of (job name, args) tuples, e.g. [('D0/D0_rpt1', (path_input_file, path_output_file)), ...]. func is called as func(*args).
+    n_workers : int
+        The number of worker processes. None or 0 means one per CPU core, 1 runs all jobs in the current process.
+
+    Returns
+    -------
+    list
+        The results of func, in the same order as jobs (regardless of which job finishes first).
+
+    Raises
+    ------
+    RuntimeError
+        If any job failed. Every failed job is reported with its name before the error is raised, other jobs are still completed.
+    """
+    n_workers = get_n_workers(n_workers, len(jobs))
+    results = [None] * len(jobs)
+    errors = []
+
+    if n_workers == 1:
+        for i, (job_name, args) in enumerate(jobs):
+            try:
+                results[i] = func(*args)
+            except Exception as e:
+                errors.append((job_name, e))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(func, *args) for _, args in jobs]
+            for i, ((job_name, _), future) in enumerate(zip(jobs, futures)):
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    errors.append((job_name, e))
+
+    if errors:
+        for job_name, e in errors:
+            print(Fore.RED + f'  {job_name} failed due to: {e}')
+        raise RuntimeError(f"{len(errors)} of {len(jobs)} jobs failed ({', '.join(job_name for job_name, _ in errors)})")
+
+    return results
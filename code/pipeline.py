@@ -0,0 +1,397 @@
+import os
+import summarise_isomir_sea
+import avg_summarised_isomirs
+import generate_precursor
+import nt_templated
+import split_nt_templated
+import summarise_nt_templated
+import avg_summarised_nt_templated
+import process_graph_data
+import parallel
+import stage_manifest
+import alignment_store
+import table_store
+from colorama import Fore, Style, init
+init(autoreset=True)
+
+# Outputs read by the dashboard (statistics dashboard and target prediction). In memory mode, only these outputs (and the ones explicitly requested) are saved.
+DASHBOARD_OUTPUTS = ['1_summarised_isomiRs', '2_avg_replicate_isomiRs', '8_graph_processed_data']
+
+def get_paths(input_folder, output_folder, is_mirbase_gff):
+    """Get paths to the input files and the output folder of each stage.
+
+    Parameters
+    ----------
+    input_folder : str
+        Path to the input folder of a species.
+    output_folder : str
+        Path to the output folder of a species.
+    is_mirbase_gff : boolean
+        Is the miRNA coordinates from miRBase gff file ?
+
+    Returns
+    -------
+    dict
+        Paths keyed by name e.g {'genomic_file': '<input_folder>/genomic.fa', 'summarised_output_folder': '<output_folder>/1_summarised_isomiRs', ...}
+    """
+    return {
+        'output_folder': output_folder,
+        'genomic_file': input_folder + '/genomic.fa',
+        'coords_file': input_folder + '/miRNA_annotation.gff3' if is_mirbase_gff else input_folder + '/miRNA_annotation.xlsx',
+        'raw_output_folder': input_folder + '/isomiR-SEA_outputs',
+        'summarised_output_folder': output_folder + '/1_summarised_isomiRs',
+        'avg_replicate_output_folder': output_folder + '/2_avg_replicate_isomiRs',
+        'precursors_output_folder': output_folder + '/3_precursors',
+        'nt_templated_alignment_output_folder': output_folder + '/4_nt_templated_alignment',
+        'nt_alignment_output_folder': output_folder + '/5_nt_alignment',
+        'templated_alignment_output_folder': output_folder + '/5_templated_alignment',
+        'summarised_nt_alignment_output_folder': output_folder + '/6_summarised_nt_alignment',
+        'summarised_templated_alignment_output_folder': output_folder + '/6_summarised_templated_alignment',
+        'summarised_templated_alignment_all_output_folder': output_folder + '/6_summarised_templated_alignment_all',
+        'avg_summarised_nt_alignment_output_folder': output_folder + '/7_avg_summarised_nt_alignment',
+        'avg_summarised_templated_alignment_output_folder': output_folder + '/7_avg_summarised_templated_alignment',
+        'avg_summarised_templated_alignment_all_output_folder': output_folder + '/7_avg_summarised_templated_alignment_all',
+        'graph_processed_data_folder': output_folder + '/8_graph_processed_data/',
+        'manifest_file': output_folder + '/stage_manifest.json'
+    }
+
+def run_stage(manifest, path_manifest_file, name, input_paths, params, output_paths, run_stage_func):
+    """Run a stage unless it was already completed with the same inputs and parameters.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest returned by stage_manifest.load_manifest(), None to always run the stage.
+    path_manifest_file : str
+        Path to the manifest file.
+    name : str
+        Name of the stage e.g 'generate_precursor'.
+    input_paths : list
+        Paths to the input files or folders of the stage.
+    params : list
+        Parameters of the stage that change its outputs.
+    output_paths : list
+        Paths to the output files or folders of the stage.
+    run_stage_func : callable
+        Runs the stage when called without arguments.
+
+    Returns
+    -------
+    None. The manifest is updated and saved after the stage ran.
+    """
+    if manifest is None:
+        run_stage_func()
+        return
+
+    # Outputs are part of the key so that a stage runs again if its outputs were modified or deleted
+    if stage_manifest.is_up_to_date(manifest, name, stage_manifest.get_key(manifest, input_paths + output_paths, params), output_paths):
+        print(Fore.GREEN + f"\n{name}: inputs unchanged, skipped")
+        return
+    try:
+        run_stage_func()
+    finally:
+        # Keep the jobs completed so far even if the stage failed
+        stage_manifest.save_manifest(manifest, path_manifest_file)
+    # The key is taken after the stage ran, from its new outputs
+    stage_manifest.record(manifest, name, stage_manifest.get_key(manifest, input_paths + output_paths, params))
+    stage_manifest.save_manifest(manifest, path_manifest_file)
+
+def run_on_disk(paths, read_count_thres, is_mirbase_gff, is_match_chr_names, n_workers=None, is_incremental=True):
+    """Run all stages, each stage reading the outputs of the previous stage from disk and saving its own outputs.
+
+    Parameters
+    ----------
+    paths : dict
+        Paths returned by get_paths().
+    read_count_thres : int
+        The minimum total read counts of a tag sequence.
+    is_mirbase_gff : boolean
+        Is the miRNA coordinates from miRBase gff file ?
+    is_match_chr_names : boolean
+        Is matching chromosome names required ?
+    n_workers : int
+        The number of worker processes (see parallel.run_jobs()).
+    is_incremental : boolean
+        Skip the stages (and the replicates of per-replicate stages) whose inputs and parameters are unchanged since the last run, according to the stage manifest.
+
+    Returns
+    -------
+    None. The outputs of all stages are saved in the output folder.
+    """
+    manifest = stage_manifest.load_manifest(paths['manifest_file']) if is_incremental else None
+    path_manifest_file = paths['manifest_file']
+
+    run_stage(manifest, path_manifest_file, 'summarise_isomir_sea',
+        [paths['raw_output_folder']], [read_count_thres, list(summarise_isomir_sea.ISOMIR_SEA_DTYPES.keys())], [paths['summarised_output_folder'], summarise_isomir_sea.get_stats_file(paths['summarised_output_folder'])],
+        lambda: summarise_isomir_sea.run(
+            paths['raw_output_folder'],
+            paths['summarised_output_folder'],
+            read_count_thres,
+            n_workers=n_workers,
+            manifest=manifest))
+    run_stage(manifest, path_manifest_file, 'avg_summarised_isomirs',
+        [paths['summarised_output_folder']], [], [paths['avg_replicate_output_folder']],
+        lambda: avg_summarised_isomirs.run(
+            paths['summarised_output_folder'],
+            paths['avg_replicate_output_folder']))
+    # The precursors only depend on the max nt differences of the summarised isomiRs (not e.g on the read count threshold)
+    max_nt_diff_5p, max_nt_diff_3p = generate_precursor.read_max_nt_diffs(paths['summarised_output_folder'])
+    path_precursor_file = generate_precursor.get_precursor_file(paths['precursors_output_folder'], max_nt_diff_5p, max_nt_diff_3p)
+    run_stage(manifest, path_manifest_file, 'generate_precursor',
+        [paths['genomic_file'], paths['coords_file']], [is_mirbase_gff, is_match_chr_names, max_nt_diff_5p, max_nt_diff_3p], [path_precursor_file],
+        lambda: generate_precursor.run(
+            paths['summarised_output_folder'],
+            paths['precursors_output_folder'],
+            paths['genomic_file'],
+            paths['coords_file'],
+            is_mirbase_gff,
+            is_match_chr_names))
+    run_stage(manifest, path_manifest_file, 'nt_templated',
+        [paths['summarised_output_folder'], path_precursor_file], [], [paths['nt_templated_alignment_output_folder']],
+        lambda: nt_templated.run(
+            paths['summarised_output_folder'],
+            paths['precursors_output_folder'],
+            paths['nt_templated_alignment_output_folder']))
+    run_stage(manifest, path_manifest_file, 'split_nt_templated',
+        [paths['nt_templated_alignment_output_folder']], [], [paths['nt_alignment_output_folder'], paths['templated_alignment_output_folder']],
+        lambda: split_nt_templated.run(
+            paths['nt_templated_alignment_output_folder'],
+            paths['nt_alignment_output_folder'],
+            paths['templated_alignment_output_folder'],
+            n_workers=n_workers,
+            manifest=manifest))
+    run_stage(manifest, path_manifest_file, 'summarise_nt_templated',
+        [paths['nt_templated_alignment_output_folder'], path_precursor_file], [],
+        [paths['summarised_nt_alignment_output_folder'], paths['summarised_templated_alignment_output_folder'], paths['summarised_templated_alignment_all_output_folder']],
+        lambda: summarise_nt_templated.run(
+            paths['nt_templated_alignment_output_folder'],
+            paths['summarised_nt_alignment_output_folder'],
+            paths['summarised_templated_alignment_output_folder'],
+            paths['summarised_templated_alignment_all_output_folder'],
+            paths['precursors_output_folder'],
+            n_workers=n_workers,
+            manifest=manifest))
+    run_stage(manifest, path_manifest_file, 'avg_summarised_nt_templated',
+        [paths['summarised_nt_alignment_output_folder'], paths['summarised_templated_alignment_output_folder'], paths['summarised_templated_alignment_all_output_folder']], [],
+        [paths['avg_summarised_nt_alignment_output_folder'], paths['avg_summarised_templated_alignment_output_folder'], paths['avg_summarised_templated_alignment_all_output_folder']],
+        lambda: avg_summarised_nt_templated.run(
+            paths['summarised_nt_alignment_output_folder'],
+            paths['summarised_templated_alignment_output_folder'],
+            paths['summarised_templated_alignment_all_output_folder'],
+            paths['avg_summarised_nt_alignment_output_folder'],
+            paths['avg_summarised_templated_alignment_output_folder'],
+            paths['avg_summarised_templated_alignment_all_output_folder'],
+            n_workers=n_workers))
+    run_stage(manifest, path_manifest_file, 'process_graph_data',
+        [paths['avg_replicate_output_folder'], paths['avg_summarised_templated_alignment_output_folder'], paths['avg_summarised_nt_alignment_output_folder'], paths['avg_summarised_templated_alignment_all_output_folder']], [],
+        [paths['graph_processed_data_folder']],
+        lambda: process_graph_data.run(
+            paths['avg_replicate_output_folder'],
+            paths['avg_summarised_templated_alignment_output_folder'],
+            paths['avg_summarised_nt_alignment_output_folder'],
+            paths['avg_summarised_templated_alignment_all_output_folder'],
+            paths['graph_processed_data_folder']))
+
+def is_saved(path_output_folder, saved_outputs):
+    """Check if an output folder should be saved in memory mode.
+
+    Parameters
+    ----------
+    path_output_folder : str
+        Path to the output folder of a stage.
+    saved_outputs : list
+        Names of output folders to save e.g ['1_summarised_isomiRs', '2_avg_replicate_isomiRs', '8_graph_processed_data'].
+
+    Returns
+    -------
+    boolean
+        True if the output folder is one of saved_outputs.
+    """
+    return os.path.basename(path_output_folder.rstrip('/')) in saved_outputs
+
+def save_replicate_tables(replicate_tables, path_output_folder):
+    """Save a table per replicate in a subfolder per group.
+
+    Parameters
+    ----------
+    replicate_tables : dict
+        Tables by group and replicate e.g {'D0': {'D0_rpt1': pandas.DataFrame, ...}, ...}
+    path_output_folder : str
+        Path to the output folder.
+
+    Returns
+    -------
+    None. A table file (see table_store.write_table()) is generated for each replicate.
+    """
+    for group, rep_tables in replicate_tables.items():
+        if not os.path.exists(f'{path_output_folder}/{group}'):
+            os.makedirs(f'{path_output_folder}/{group}')
+        for rep_name, rep_table in rep_tables.items():
+            table_store.write_table(rep_table, f'{path_output_folder}/{group}/{rep_name}')
+
+def save_replicate_alignments(unique_tag_alignment, replicate_alignments, path_output_folder):
+    """Save the unique tag alignment and the replicate index of each replicate in a subfolder per group.
+
+    Parameters
+    ----------
+    unique_tag_alignment : dict
+        The unique tag alignment shared by all replicates.
+    replicate_alignments : dict
+        Replicate indexes by group and replicate e.g {'D0': {'D0_rpt1': dict, ...}, ...}
+    path_output_folder : str
+        Path to the output folder.
+
+    Returns
+    -------
+    None. The unique tag alignment file and an alignment file (see alignment_store.save_alignment()) for each replicate are generated.
+    """
+    if not os.path.exists(path_output_folder):
+        os.makedirs(path_output_folder)
+    alignment_store.save_alignment(unique_tag_alignment, alignment_store.get_unique_tags_file(path_output_folder))
+    for group, rep_alignments in replicate_alignments.items():
+        if not os.path.exists(f'{path_output_folder}/{group}'):
+            os.makedirs(f'{path_output_folder}/{group}')
+        for rep_name, rep_alignment in rep_alignments.items():
+            alignment_store.save_alignment(rep_alignment, alignment_store.get_alignment_file(f'{path_output_folder}/{group}', rep_name))
+
+def save_group_tables(group_tables, path_output_folder):
+    """Save a table per group.
+
+    Parameters
+    ----------
+    group_tables : dict
+        Tables by group e.g {'D0': pandas.DataFrame, ...}
+    path_output_folder : str
+        Path to the output folder.
+
+    Returns
+    -------
+    None. A table file (see table_store.write_table()) is generated for each group.
+    """
+    if not os.path.exists(path_output_folder):
+        os.makedirs(path_output_folder)
+    for group, group_table in group_tables.items():
+        table_store.write_table(group_table, f'{path_output_folder}/{group}')
+
+def map_replicates(func, replicate_tables, n_workers, *args):
+    """Apply a function to the table of each replicate across a pool of worker processes.
+
+    Parameters
+    ----------
+    func : callable
+        A module-level function called as func(table, *args) for each replicate.
+    replicate_tables : dict
+        Tables by group and replicate e.g {'D0': {'D0_rpt1': pandas.DataFrame, ...}, ...}
+    n_workers : int
+        The number of worker processes (see parallel.run_jobs()).
+    *args
+        Other arguments of func, shared by all replicates.
+
+    Returns
+    -------
+    dict
+        Results of func by group and replicate.
+    """
+    keys = [(group, rep_name) for group, rep_tables in replicate_tables.items() for rep_name in rep_tables]
+    results = parallel.run_jobs(func, [(f'{group}/{rep_name}', (replicate_tables[group][rep_name], *args)) for group, rep_name in keys], n_workers)
+    replicate_results = {}
+    for (group, rep_name), result in zip(keys, results):
+        replicate_results.setdefault(group, {})[rep_name] = result
+    return replicate_results
+
+def unzip_replicates(replicate_results, n):
+    """Split replicate results that are tuples into one dict per tuple item.
+
+    Parameters
+    ----------
+    replicate_results : dict
+        Tuples of n items by group and replicate.
+    n : int
+        The number of items of each tuple.
+
+    Returns
+    -------
+    list
+        n dicts of tables by group and replicate.
+    """
+    return [{group: {rep_name: result[i] for rep_name, result in rep_results.items()} for group, rep_results in replicate_results.items()} for i in range(n)]
+
+def run_in_memory(paths, read_count_thres, is_mirbase_gff, is_match_chr_names, n_workers=None, saved_outputs=DASHBOARD_OUTPUTS):
+    """Run all stages passing tables between stages in memory. Only the outputs used by the dashboard and those explicitly requested are saved.
+
+    Parameters
+    ----------
+    paths : dict
+        Paths returned by get_paths().
+    read_count_thres : int
+        The minimum total read counts of a tag sequence.
+    is_mirbase_gff : boolean
+        Is the miRNA coordinates from miRBase gff file ?
+    is_match_chr_names : boolean
+        Is matching chromosome names required ?
+    n_workers : int
+        The number of worker processes (see parallel.run_jobs()).
+    saved_outputs : list
+        Names of output folders to save. 8_graph_processed_data is always saved.
+
+    Returns
+    -------
+    None. The requested outputs are saved in the output folder.
+    """
+    print(Fore.MAGENTA + "\nUpdating outputs of isomiR-SEA by calculating 5', 3' and snp modification, naming isomiRs, categorizing isomiRs, ...")
+    # Summarised isomiRs by group and replicate file
+    summarised_isomiRs = summarise_isomir_sea.summarise(paths['raw_output_folder'], read_count_thres, n_workers=n_workers)
+    # Replicate files are named by replicate name from here on
+    summarised_isomiRs = {group: {summarise_isomir_sea.get_rep_name(rep_file): rep_df for rep_file, rep_df in rep_dfs.items()} for group, rep_dfs in summarised_isomiRs.items()}
+    if is_saved(paths['summarised_output_folder'], saved_outputs):
+        save_replicate_tables(summarised_isomiRs, paths['summarised_output_folder'])
+
+    print(Fore.MAGENTA + "\nCalculating the average rpm / unique tag for each isomiR across multiple replicates...")
+    avg_replicate_isomiRs = {group: avg_summarised_isomirs.average_replicates(rep_dfs) for group, rep_dfs in summarised_isomiRs.items()}
+    if is_saved(paths['avg_replicate_output_folder'], saved_outputs):
+        save_group_tables(avg_replicate_isomiRs, paths['avg_replicate_output_folder'])
+
+    print(Fore.MAGENTA + "\nGenerating extended precursor sequences for miRNAs...")
+    max_nt_diff_5p, max_nt_diff_3p = generate_precursor.get_max_nt_diffs(rep_df for rep_dfs in summarised_isomiRs.values() for rep_df in rep_dfs.values())
+    extended_precursors = generate_precursor.get_extended_precursors(is_mirbase_gff, is_match_chr_names, max_nt_diff_5p, max_nt_diff_3p, paths['genomic_file'], paths['coords_file'])
+    if is_saved(paths['precursors_output_folder'], saved_outputs):
+        if not os.path.exists(paths['precursors_output_folder']):
+            os.makedirs(paths['precursors_output_folder'])
+        table_store.write_table(extended_precursors, f"{paths['precursors_output_folder']}/{generate_precursor.get_precursor_name(max_nt_diff_5p, max_nt_diff_3p)}")
+
+    print(Fore.MAGENTA + "\nComparing nucleotide at each position of isomiRs ...")
+    # Each distinct isomiR is aligned once, replicates only keep the rows and read counts of their isomiRs
+    unique_tag_alignment = nt_templated.align_unique_tags([rep_df for rep_dfs in summarised_isomiRs.values() for rep_df in rep_dfs.values()], extended_precursors, max_nt_diff_5p)
+    replicate_indexes = {group: {rep_name: nt_templated.get_replicate_index(rep_df, unique_tag_alignment) for rep_name, rep_df in rep_dfs.items()} for group, rep_dfs in summarised_isomiRs.items()}
+    if is_saved(paths['nt_templated_alignment_output_folder'], saved_outputs):
+        save_replicate_alignments(unique_tag_alignment, replicate_indexes, paths['nt_templated_alignment_output_folder'])
+
+    # The nt and templated alignments are only generated to be saved, the summaries are calculated from the encoded alignments
+    if is_saved(paths['nt_alignment_output_folder'], saved_outputs) or is_saved(paths['templated_alignment_output_folder'], saved_outputs):
+        print(Fore.MAGENTA + "\nGenerating files showing variation at each positions of isomiRs ...")
+        nt_alignments, templated_alignments = unzip_replicates(map_replicates(split_nt_templated.split_alignments, replicate_indexes, n_workers, unique_tag_alignment), 2)
+        for alignments, path_output_folder in [(nt_alignments, paths['nt_alignment_output_folder']), (templated_alignments, paths['templated_alignment_output_folder'])]:
+            if is_saved(path_output_folder, saved_outputs):
+                save_replicate_tables(alignments, path_output_folder)
+
+    print(Fore.MAGENTA + "\nSummarising statistics for different types of variation ...")
+    tag_values = summarise_nt_templated.get_tag_values(unique_tag_alignment, max_nt_diff_5p, max_nt_diff_3p)
+    summaries = unzip_replicates(map_replicates(summarise_nt_templated.summarise_alignment, replicate_indexes, n_workers, tag_values, max_nt_diff_5p, max_nt_diff_3p), 3)
+    for summary, path_output_folder in zip(summaries, [paths['summarised_nt_alignment_output_folder'], paths['summarised_templated_alignment_output_folder'], paths['summarised_templated_alignment_all_output_folder']]):
+        if is_saved(path_output_folder, saved_outputs):
+            save_replicate_tables(summary, path_output_folder)
+
+    print(Fore.MAGENTA + "\nAveraging statistics for different types of variation across multiple replicates ...")
+    avg_summaries = avg_summarised_nt_templated.average_summaries(summaries, n_workers)
+    for avg_summary, path_output_folder in zip(avg_summaries, [paths['avg_summarised_nt_alignment_output_folder'], paths['avg_summarised_templated_alignment_output_folder'], paths['avg_summarised_templated_alignment_all_output_folder']]):
+        if is_saved(path_output_folder, saved_outputs):
+            save_group_tables(avg_summary, path_output_folder)
+    avg_summarised_nt_alignment, avg_summarised_templated_alignment, avg_summarised_templated_alignment_all = avg_summaries
+
+    print(Fore.MAGENTA + "\nPreparing data for isomiR statistics visualisation ...")
+    # Groups are sorted by name, as when reading the group files of a folder
+    graphs_data = process_graph_data.process_graphs_data(*[
+        dict(sorted(avg_group_dfs.items()))
+        for avg_group_dfs in [avg_replicate_isomiRs, avg_summarised_templated_alignment, avg_summarised_nt_alignment, avg_summarised_templated_alignment_all]
+    ])
+    process_graph_data.write_graphs_data(graphs_data, paths['graph_processed_data_folder'])
@@ -1,139 +1,157 @@
 import pandas as pd 
+import numpy as np
 import os
 import sys
 import warnings
+import table_store
 warnings.filterwarnings('ignore')
 from colorama import Fore, Style, init
 init(autoreset=True)
 
+def stack_groups(avg_group_dfs):
+    """Stack the averaged tables of all groups once, with a group column. 
+
+    Parameters
+    ----------
+    avg_group_dfs : dict 
+        The averaged table of each group e.g {'18hr': pandas.DataFrame, 'D0': pandas.DataFrame}
+
+    Returns
+    -------
+    pandas.DataFrame
+        The rows of all groups (in the order of avg_group_dfs) with a group column added last. 
+    """
+    return pd.concat([avg_group_df.assign(group=group) for group, avg_group_df in avg_group_dfs.items()], ignore_index=True)
+
+def sum_by_group(all_group_df, groups, by, value_cols):
+    """Sum values by group and other columns, keeping the groups in their original order. 
+
+    Parameters
+    ----------
+    all_group_df : pandas.DataFrame 
+        The stacked tables of all groups (see stack_groups()). 
+    groups : list
+        The groups, in order. 
+    by : list
+        The columns to group by within each group (sorted). 
+    value_cols : list
+        The columns to sum. 
+
+    Returns
+    -------
+    pandas.DataFrame
+        The columns by, value_cols and group, sorted by group then by. 
+    """
+    # Groups are categorical so that they are sorted in their original order
+    all_group_df = all_group_df.astype({'group': pd.CategoricalDtype(groups)})
+    sum_df = all_group_df.groupby(['group'] + by, observed=True, sort=True)[value_cols].sum().reset_index()
+    return sum_df[by + value_cols + ['group']].astype({'group': str})
+
 # Graph 1: Summarise data for showing miRNAs and isomiRs total reads (rpm) and relative abundance as percentage of total reads. 
-def process_graph1_data(path_avg_replicate_output_folder, path_graph_processed_data_folder):
-    # All groups df
-    all_group_df = pd.DataFrame()
-    # Loop through averaged summarised isomiRs of each group
-    avg_files = sorted(os.listdir(path_avg_replicate_output_folder))
-
-    for avg_file in avg_files:
-        # Read averaged summarised isomiRs of each group
-        avg_summarised_isomiRs_df = pd.read_csv(f'{path_avg_replicate_output_folder}/{avg_file}')
-        # Select a subset of important columms 
-        type_df = avg_summarised_isomiRs_df[['grouped_type', 'rpm']]
-        # Add a new column type: if grouped_type is canonical, type is Canonical. otherwise, type is isomiR
-        type_df['type'] = type_df['grouped_type'].apply(lambda gt: 'Canonical' if gt == 'Canonical' else 'IsomiR')
-        # Drop grouped_type column 
-        type_df = type_df.drop(columns=['grouped_type'])
-        # Group by type column and sum the rpm values
-        type_df = type_df.groupby(by='type').sum().reset_index()
-        # Add relative abundance column 
-        sum_rpm = type_df['rpm'].sum()
-        type_df['relative_abundance'] = type_df['rpm'] / sum_rpm * 100
-        # Add group column 
-        type_df['group'] = avg_file.split('.')[0]
-        
-        if all_group_df.empty: 
-            all_group_df = type_df
-        else:
-            all_group_df = pd.concat([all_group_df, type_df], ignore_index=True)
-    all_group_df.to_csv(f'{path_graph_processed_data_folder}/graph_1_data.csv', index=False)
+def process_graph1_data(avg_group_dfs):
+    all_group_df = stack_groups(avg_group_dfs)
+    # Add a new column type: if grouped_type is canonical, type is Canonical. otherwise, type is isomiR
+    all_group_df['type'] = np.where(all_group_df['grouped_type'] == 'Canonical', 'Canonical', 'IsomiR')
+    # Group by group and type columns and sum the rpm values
+    type_df = sum_by_group(all_group_df, list(avg_group_dfs), ['type'], ['rpm'])
+    # Add relative abundance column (percentage of the total rpm of the group)
+    type_df.insert(2, 'relative_abundance', type_df['rpm'] / type_df.groupby('group')['rpm'].transform('sum') * 100)
+    return type_df
 
 # Graph 2: Summarise data for showing the relative abundance as percentage of total reads of types (5p, 3p, both, canonical, others).
-def process_graph2_data(path_avg_replicate_output_folder, path_graph_processed_data_folder):
-    # All groups df
-    all_group_df = pd.DataFrame()
-    # Loop through averaged summarised isomiRs of each group
-    avg_files = sorted(os.listdir(path_avg_replicate_output_folder))
-    for avg_file in avg_files:
-        # Read averaged summarised isomiRs of each group
-        avg_summarised_isomiRs_df = pd.read_csv(f'{path_avg_replicate_output_folder}/{avg_file}')
-        # Select a subset of important columms 
-        grouped_type_df = avg_summarised_isomiRs_df[['grouped_type', 'rpm', 'unique_tag']]
-        # Group by grouped_type column and sum the rpm values and count unique tags 
-        grouped_type_df = grouped_type_df.groupby('grouped_type').agg(rpm=('rpm', 'sum'), unique_tag=('unique_tag', 'sum')).reset_index()
-        # Add group column 
-        grouped_type_df['group'] = avg_file.split('.')[0]
-        
-        if all_group_df.empty: 
-            all_group_df = grouped_type_df
-        else:
-            all_group_df = pd.concat([all_group_df, grouped_type_df], ignore_index=True)
-    all_group_df.to_csv(f'{path_graph_processed_data_folder}/graph_2_data.csv', index=False)
+def process_graph2_data(avg_group_dfs):
+    # Group by group and grouped_type columns and sum the rpm values and count unique tags 
+    return sum_by_group(stack_groups(avg_group_dfs), list(avg_group_dfs), ['grouped_type'], ['rpm', 'unique_tag'])
 
 # Summarise data for showing proportions of 5p/3p addition/truncation at different positions (3e1, 3e2, 3e3,..., 3t1, 3t2, 5e1, 5e2,..., 5t1, 5t2, 5t3, ...) across stages 
-def process_graph3_data(path_avg_replicate_output_folder, path_graph_processed_data_folder):
-    # All groups df
-    all_group_df = pd.DataFrame()
-    # Loop through averaged summarised isomiRs of each group
-    avg_files = sorted(os.listdir(path_avg_replicate_output_folder))
-    for avg_file in avg_files:
-        # Read averaged summarised isomiRs of each group
-        avg_summarised_isomiRs_df = pd.read_csv(f'{path_avg_replicate_output_folder}/{avg_file}')
-        # Select a subset of important columms 
-        type_nt_df = avg_summarised_isomiRs_df[['type_nt', 'rpm', 'unique_tag', 'grouped_type']]
-        # Select isomiR 3p or 5p 
-        type_nt_df = type_nt_df[type_nt_df['grouped_type'].isin(["5'isomiR", "3'isomiR"])]
-        # Group by type_nt column and sum the rpm values and count unique tags
-        type_nt_df = type_nt_df.groupby(['type_nt', 'grouped_type']).agg(rpm=('rpm', 'sum'), unique_tag=('unique_tag', 'sum')).reset_index()
-        # Add group column 
-        type_nt_df['group'] = avg_file.split('.')[0]
-        
-        if all_group_df.empty: 
-            all_group_df = type_nt_df
-        else:
-            all_group_df = pd.concat([all_group_df, type_nt_df], ignore_index=True)
-    all_group_df.to_csv(f'{path_graph_processed_data_folder}/graph_3_data.csv', index=False)
+def process_graph3_data(avg_group_dfs):
+    all_group_df = stack_groups(avg_group_dfs)
+    # Select isomiR 3p or 5p 
+    all_group_df = all_group_df[all_group_df['grouped_type'].isin(["5'isomiR", "3'isomiR"])]
+    # Group by group, type_nt and grouped_type columns and sum the rpm values and count unique tags
+    return sum_by_group(all_group_df, list(avg_group_dfs), ['type_nt', 'grouped_type'], ['rpm', 'unique_tag'])
 
 # Summarise data for showing proportion of templated vs nontemplated at addition positions in different groups. 
-def process_graph4_data(path_avg_summarised_templated_alignment_output_folder, path_graph_processed_data_folder):
-    # All groups df
-    all_group_df = pd.DataFrame()
-    # Loop through averaged templated summarised alignment file of each group
-    avg_files = sorted(os.listdir(path_avg_summarised_templated_alignment_output_folder))
-    for avg_file in avg_files:
-        # Read averaged templated summarised alignment file of each group
-        avg_templated_summarised_alignment_df = pd.read_csv(f'{path_avg_summarised_templated_alignment_output_folder}/{avg_file}', dtype={'position': 'str'})
-        # Add group column 
-        avg_templated_summarised_alignment_df['group'] = avg_file.split('.')[0]
-        
-        if all_group_df.empty: 
-            all_group_df = avg_templated_summarised_alignment_df
-        else:
-            all_group_df = pd.concat([all_group_df, avg_templated_summarised_alignment_df], ignore_index=True)
-    all_group_df.to_csv(f'{path_graph_processed_data_folder}/graph_4_data.csv', index=False)
+def process_graph4_data(avg_group_dfs):
+    return stack_groups(avg_group_dfs)
 
 # summarise data for showing proportion of nucleotides (A, U, C, G) at addition positions in different groups.
-def process_graph5_data(path_avg_summarised_nt_alignment_output_folder, path_graph_processed_data_folder):
-    # All groups df
-    all_group_df = pd.DataFrame()
-    # Loop through averaged nt summarised alignment file of each group
-    avg_files = sorted(os.listdir(path_avg_summarised_nt_alignment_output_folder))
-    for avg_file in avg_files:
-        # Read averaged nt summarised alignment file of each group
-        avg_nt_summarised_alignment_df = pd.read_csv(f'{path_avg_summarised_nt_alignment_output_folder}/{avg_file}',  dtype={'position': 'str'})
-        # Add group column 
-        avg_nt_summarised_alignment_df['group'] = avg_file.split('.')[0]
-        
-        if all_group_df.empty: 
-            all_group_df = avg_nt_summarised_alignment_df
-        else:
-            all_group_df = pd.concat([all_group_df, avg_nt_summarised_alignment_df], ignore_index=True)
-    all_group_df.to_csv(f'{path_graph_processed_data_folder}/graph_5_data.csv', index=False)
-
-def process_graph6_data(path_avg_summarised_templated_alignment_all_output_folder, path_graph_processed_data_folder):
-    # All groups df
-    all_group_df = pd.DataFrame()
-    # Loop through averaged templated summarised alignment all file of each group
-    avg_files = sorted(os.listdir(path_avg_summarised_templated_alignment_all_output_folder))
-    for avg_file in avg_files:
-        # Read averaged templated summarised alignment file of each group
-        avg_templated_summarised_alignment_all_df = pd.read_csv(f'{path_avg_summarised_templated_alignment_all_output_folder}/{avg_file}',  dtype={'position': 'str'})
-        # Add group column 
-        avg_templated_summarised_alignment_all_df['group'] = avg_file.split('.')[0]
-        
-        if all_group_df.empty: 
-            all_group_df = avg_templated_summarised_alignment_all_df
-        else:
-            all_group_df = pd.concat([all_group_df, avg_templated_summarised_alignment_all_df], ignore_index=True)
-    all_group_df.to_csv(f'{path_graph_processed_data_folder}/graph_6_data.csv', index=False)
+def process_graph5_data(avg_group_dfs):
+    return stack_groups(avg_group_dfs)
+
+# Summarise data for showing proportion of templated vs nontemplated at all positions in different groups.
+def process_graph6_data(avg_group_dfs):
+    return stack_groups(avg_group_dfs)
+
+def read_group_files(path_avg_output_folder, dtype=None):
+    """Read the averaged file of each group in a folder. 
+
+    Parameters
+    ----------
+    path_avg_output_folder : str 
+        Path to a folder that has one averaged file per group e.g. D0.csv, 18hr.csv. 
+    dtype : dict 
+        Datatypes of columns, passed to table_store.read_table(). 
+
+    Returns
+    -------
+    dict
+        The averaged table of each group, keyed by group name and sorted by file name e.g {'18hr': pandas.DataFrame, 'D0': pandas.DataFrame}
+    """
+    return {group: table_store.read_table(path_avg_file, dtype=dtype) for group, path_avg_file in table_store.list_tables(path_avg_output_folder).items()}
+
+def process_graphs_data(avg_replicate_dfs, avg_summarised_templated_alignment_dfs, avg_summarised_nt_alignment_dfs, avg_summarised_templated_alignment_all_dfs):
+    """Prepare the data of all 6 graphs. 
+
+    Parameters
+    ----------
+    avg_replicate_dfs : dict 
+        Averaged summarised isomiRs of each group. 
+    avg_summarised_templated_alignment_dfs : dict 
+        Averaged summarised templated alignment (extension positions) of each group. 
+    avg_summarised_nt_alignment_dfs : dict 
+        Averaged summarised nt alignment (extension positions) of each group. 
+    avg_summarised_templated_alignment_all_dfs : dict 
+        Averaged summarised templated alignment (all positions) of each group. 
+
+    Returns
+    -------
+    dict 
+        The data of each graph, keyed by table name e.g {'graph_1_data': pandas.DataFrame, ...}
+    """
+    # Positions are read as strings by the dashboard 
+    avg_summarised_templated_alignment_dfs, avg_summarised_nt_alignment_dfs, avg_summarised_templated_alignment_all_dfs = [
+        {group: df.astype({'position': str}) for group, df in avg_group_dfs.items()}
+        for avg_group_dfs in [avg_summarised_templated_alignment_dfs, avg_summarised_nt_alignment_dfs, avg_summarised_templated_alignment_all_dfs]
+    ]
+    return {
+        'graph_1_data': process_graph1_data(avg_replicate_dfs),
+        'graph_2_data': process_graph2_data(avg_replicate_dfs),
+        'graph_3_data': process_graph3_data(avg_replicate_dfs),
+        'graph_4_data': process_graph4_data(avg_summarised_templated_alignment_dfs),
+        'graph_5_data': process_graph5_data(avg_summarised_nt_alignment_dfs),
+        'graph_6_data': process_graph6_data(avg_summarised_templated_alignment_all_dfs)
+    }
+
+def write_graphs_data(graphs_data, path_graph_processed_data_folder):
+    """Save the data of all graphs. 
+
+    Parameters
+    ----------
+    graphs_data : dict 
+        The data of each graph, keyed by table name (see process_graphs_data()). 
+    path_graph_processed_data_folder : str 
+        Path to the folder that stores graph data. 
+
+    Returns
+    -------
+    None. A table file is generated for each graph. 
+    """
+    if not os.path.exists(path_graph_processed_data_folder):
+        os.makedirs(path_graph_processed_data_folder)
+
+    for graph_name, graph_df in graphs_data.items(): 
+        table_store.write_table(graph_df, f"{path_graph_processed_data_folder.rstrip('/')}/{graph_name}")
 
 def run(
     path_avg_replicate_output_folder,
@@ -144,12 +162,9 @@ def run(
 ):
     print(Fore.MAGENTA + "\nPreparing data for isomiR statistics visualisation ...")
 
-    if not os.path.exists(path_graph_processed_data_folder):
-        os.makedirs(path_graph_processed_data_folder)
-
-    process_graph1_data(path_avg_replicate_output_folder, path_graph_processed_data_folder)
-    process_graph2_data(path_avg_replicate_output_folder, path_graph_processed_data_folder)
-    process_graph3_data(path_avg_replicate_output_folder, path_graph_processed_data_folder)
-    process_graph4_data(path_avg_summarised_templated_alignment_output_folder, path_graph_processed_data_folder)
-    process_graph5_data(path_avg_summarised_nt_alignment_output_folder, path_graph_processed_data_folder)
-    process_graph6_data(path_avg_summarised_templated_alignment_all_output_folder, path_graph_processed_data_folder)
\ No newline at end of file
+    graphs_data = process_graphs_data(
+        read_group_files(path_avg_replicate_output_folder),
+        read_group_files(path_avg_summarised_templated_alignment_output_folder, dtype={'position': 'str'}),
+        read_group_files(path_avg_summarised_nt_alignment_output_folder, dtype={'position': 'str'}),
+        read_group_files(path_avg_summarised_templated_alignment_all_output_folder, dtype={'position': 'str'}))
+    write_graphs_data(graphs_data, path_graph_processed_data_folder)
@@ -1,62 +1,72 @@
 import pandas as pd 
 import os
 import sys
+import parallel
+import stage_manifest
+import alignment_store
+import table_store
 from colorama import Fore, Style, init
 init(autoreset=True)
 
-def split_nt_templated(input_file, output_file, type):
-    """Extract nucleotide or matching symbol from the nucleotide details (<nucleotide>, <matching symbol>) and store each in a seperate file. 
+def split_alignments(replicate_index, unique_tag_alignment):
+    """Generate both the nt alignment and the templated alignment of a replicate from the unique tag alignment, in one pass. 
 
-    Parameters 
+    Parameters
     ----------
-    input_file : str
-        Path to the file that stores nucleotide details in (<nucleotide>, <matching symbol>) format at each position for each isomiR.
-    output_file : str 
-        Path to the file that stores the nucleotide or matching at each position for each isomiR.
+    replicate_index : dict
+        The rows and read counts of the isomiRs of a replicate (see nt_templated.get_replicate_index()). 
+    unique_tag_alignment : dict
+        The unique tag alignment shared by all replicates (see nt_templated.align_unique_tags()). 
 
     Example
     ----------- 
     ```
-    The original file:                      (' ', ' '), (' ', ' '), ('g', '-'), ('a', '+'), ('u', '+'), ('c', '+'), ('c', '+'), ('u', '+'), ('g', '+')
-    The output file (type = nt):            '','','g','a','u,'c','c','u','g' 
-    The output file (type = templated):     '','','-','+','+,'+','+','+','+' 
+    The nt templated alignment:             (' ', ' '), (' ', ' '), ('g', '-'), ('a', '+'), ('u', '+'), ('c', '+'), ('c', '+'), ('u', '+'), ('g', '+')
+    The nt alignment:                       '','','g','a','u,'c','c','u','g' 
+    The templated alignment:                '','','-','+','+,'+','+','+','+' 
     ```
-    
-    Returns 
+
+    Returns
     -------
-    None. A new file that stores the nucleotide or matching at each position for each isomiR is generated. 
+    pandas.DataFrame, pandas.DataFrame
+        The nt alignment and the templated alignment. 
     """
-    # Read input file
-    templated_nt = pd.read_csv(input_file, low_memory=False)
-    # Replace NA with ''
-    templated_nt = templated_nt.fillna('')
-    # Get position columns 
-    cols = list(templated_nt.columns)
-    del cols[0:4]
-    # Loop over all rows 
-    for index, r in templated_nt.iterrows():
-        if r['is_pre'] == False:            
-            for col in cols:
-                vals = r[col]
-                if vals != '':
-                    first_val = ''
-                    second_val = ''
-                    if vals != "(' ', ' ')":
-                        vals = vals.replace('(', '').replace(')', '').replace(' ', '').split(',')
-                        first_val = vals[0]
-                        second_val = vals[1]
+    return alignment_store.to_split_alignments(alignment_store.get_replicate_alignment(unique_tag_alignment, replicate_index))
+
+def split_replicate(path_nt_templated_alignment_file, unique_tag_alignment, path_nt_alignment_file, path_templated_alignment_file):
+    """Generate the nt alignment and the templated alignment files of a replicate from its replicate index file. 
+
+    Parameters
+    ----------
+    path_nt_templated_alignment_file : str
+        Path to the replicate index file (.npz) of a replicate. 
+    unique_tag_alignment : dict
+        The unique tag alignment shared by all replicates. 
+    path_nt_alignment_file : str 
+        Path to the nt alignment file of that replicate, without extension (see table_store.write_table()). 
+    path_templated_alignment_file : str 
+        Path to the templated alignment file of that replicate, without extension. 
 
-                    if type == 'templated':
-                        templated_nt.loc[index, col] = second_val
-                    else: 
-                        templated_nt.loc[index, col] = first_val  
-    templated_nt.to_csv(output_file, index=False)
+    Returns
+    -------
+    None. The nt alignment and templated alignment files are generated. 
+    """
+    # Read the replicate index once for both files
+    nt_alignment, templated_alignment = split_alignments(alignment_store.load_alignment(path_nt_templated_alignment_file), unique_tag_alignment)
+    table_store.write_table(nt_alignment, path_nt_alignment_file)
+    table_store.write_table(templated_alignment, path_templated_alignment_file)
 
-def run(path_nt_templated_alignment_output_folder, path_nt_alignment_output_folder, path_templated_alignment_output_folder):
+def run(path_nt_templated_alignment_output_folder, path_nt_alignment_output_folder, path_templated_alignment_output_folder, n_workers=None, manifest=None):
     print(Fore.MAGENTA + "\nGenerating files showing variation at each positions of isomiRs ...")
 
+    # Read the unique tag alignment shared by all replicates
+    path_unique_tags_file = alignment_store.get_unique_tags_file(path_nt_templated_alignment_output_folder)
+    unique_tag_alignment = alignment_store.load_alignment(path_unique_tags_file)
+
+    # One job per replicate 
+    jobs = []
     # List of group folders
-    group_folders = os.listdir(path_nt_templated_alignment_output_folder)
+    group_folders = alignment_store.get_group_folders(path_nt_templated_alignment_output_folder)
     # Loop through each group
     for group in group_folders:
         # Get the list of replicate files
@@ -70,7 +80,14 @@ def run(path_nt_templated_alignment_output_folder, path_nt_alignment_output_fold
 
         # Loop through each replicate file 
         for rep_file in rep_files:
-            # Generate the nt alignment from nt templated file 
-            split_nt_templated(f'{path_nt_templated_alignment_output_folder}/{group}/{rep_file}', f'{path_nt_alignment_output_folder}/{group}/{rep_file}', 'nt')
-            # Generate the templated alignment from nt templated file 
-            split_nt_templated(f'{path_nt_templated_alignment_output_folder}/{group}/{rep_file}', f'{path_templated_alignment_output_folder}/{group}/{rep_file}', 'templated')
\ No newline at end of file
+            # Get replicate name 
+            rep_name = rep_file.split('.')[0]
+            jobs.append((f'{group}/{rep_name}', (f'{path_nt_templated_alignment_output_folder}/{group}/{rep_file}', unique_tag_alignment, f'{path_nt_alignment_output_folder}/{group}/{rep_name}', f'{path_templated_alignment_output_folder}/{group}/{rep_name}')))
+
+    if manifest is not None:
+        # A replicate is only split again if its replicate index or the unique tag alignment changed
+        job_keys = [stage_manifest.get_key(manifest, [args[0], path_unique_tags_file]) for _, args in jobs]
+        jobs, job_keys = stage_manifest.select_jobs(manifest, 'split_nt_templated', jobs, job_keys, [[table_store.get_table_file(args[2]), table_store.get_table_file(args[3])] for _, args in jobs])
+    parallel.run_jobs(split_replicate, jobs, n_workers)
+    if manifest is not None:
+        stage_manifest.record_jobs(manifest, 'split_nt_templated', jobs, job_keys)
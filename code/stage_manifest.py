@@ -0,0 +1,232 @@
+import pandas as pd
+import os
+import json
+import hashlib
+
+# Size of the blocks read when hashing a file
+HASH_BLOCK_SIZE = 1 << 20
+
+def load_manifest(path_manifest_file):
+    """Load the stage manifest of a species, or create an empty one.
+
+    The manifest stores
+    - 'files': the content hash of each input / output file, with the size and modification time it was hashed at (a file is only hashed again if those changed).
+    - 'stages': the key (hash of inputs and parameters) each stage or job (e.g 'nt_templated/D0/D0_rpt1') was last completed with.
+
+    Parameters
+    ----------
+    path_manifest_file : str
+        Path to the manifest file.
+
+    Returns
+    -------
+    dict
+        The manifest e.g {'files': {'<path>': {'size': 1024, 'mtime': 1700000000000000000, 'hash': 'ab12...'}, ...}, 'stages': {'nt_templated': 'cd34...', ...}}
+    """
+    if os.path.exists(path_manifest_file):
+        with open(path_manifest_file) as f:
+            return json.load(f)
+    return {'files': {}, 'stages': {}}
+
+def save_manifest(manifest, path_manifest_file):
+    """Save the stage manifest of a species.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest returned by load_manifest().
+    path_manifest_file : str
+        Path to the manifest file.
+
+    Returns
+    -------
+    None. The manifest file is replaced (written to a temporary file first so that an interrupted run never leaves a partial manifest).
+    """
+    if not os.path.exists(os.path.dirname(path_manifest_file)):
+        os.makedirs(os.path.dirname(path_manifest_file))
+    with open(f'{path_manifest_file}.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f'{path_manifest_file}.tmp', path_manifest_file)
+
+def hash_file(manifest, path_file):
+    """Get the content hash of a file, reusing the hash stored in the manifest if the file size and modification time are unchanged.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest returned by load_manifest().
+    path_file : str
+        Path to the file.
+
+    Returns
+    -------
+    str
+        The sha256 hex digest of the file content.
+    """
+    stat = os.stat(path_file)
+    cached = manifest['files'].get(path_file)
+    if cached is not None and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns:
+        return cached['hash']
+
+    file_hash = hashlib.sha256()
+    with open(path_file, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            file_hash.update(block)
+    manifest['files'][path_file] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': file_hash.hexdigest()}
+    return file_hash.hexdigest()
+
+def hash_path(manifest, path):
+    """Get the content hash of a file, or of all files (and their relative paths) in a folder.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest returned by load_manifest().
+    path : str
+        Path to a file or a folder.
+
+    Returns
+    -------
+    str
+        The sha256 hex digest. A missing path has an empty hash.
+    """
+    if os.path.isfile(path):
+        return hash_file(manifest, path)
+
+    folder_hash = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        # Walk folders and files in a fixed order
+        dirs.sort()
+        for file in sorted(files):
+            path_file = os.path.join(root, file)
+            folder_hash.update(os.path.relpath(path_file, path).encode())
+            folder_hash.update(hash_file(manifest, path_file).encode())
+    return folder_hash.hexdigest()
+
+def hash_values(values):
+    """Get a hash of a list of values e.g the kept tag sequences.
+
+    Parameters
+    ----------
+    values : list-like
+        The values to hash.
+
+    Returns
+    -------
+    str
+        The sha256 hex digest.
+    """
+    return hashlib.sha256(pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy().tobytes()).hexdigest()
+
+def get_key(manifest, input_paths, params=()):
+    """Get the key of a stage or job from the content of its inputs and its parameters.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest returned by load_manifest().
+    input_paths : list
+        Paths to the input files or folders.
+    params : list
+        Parameters that change the outputs (must be serialisable to json e.g int, str, boolean).
+
+    Returns
+    -------
+    str
+        The sha256 hex digest of the input hashes and parameters.
+    """
+    key = hashlib.sha256()
+    for path in input_paths:
+        key.update(hash_path(manifest, path).encode())
+    key.update(json.dumps(list(params)).encode())
+    return key.hexdigest()
+
+def is_up_to_date(manifest, name, key, output_paths):
+    """Check if a stage or job was last completed with the same key and its outputs still exist.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest returned by load_manifest().
+    name : str
+        Name of the stage or job e.g 'generate_precursor' or 'nt_templated/D0/D0_rpt1'.
+    key : str
+        The key returned by get_key().
+    output_paths : list
+        Paths to the output files or folders.
+
+    Returns
+    -------
+    boolean
+        True if the stage or job can be skipped.
+    """
+    return manifest['stages'].get(name) == key and all(os.path.exists(path) for path in output_paths)
+
+def record(manifest, name, key):
+    """Record that a stage or job was completed with a key.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest returned by load_manifest().
+    name : str
+        Name of the stage or job.
+    key : str
+        The key returned by get_key().
+
+    Returns
+    -------
+    None. The manifest is updated in place (see save_manifest() to write it).
+    """
+    manifest['stages'][name] = key
+
+def select_jobs(manifest, stage, jobs, job_keys, job_outputs):
+    """Select the jobs of a stage (see parallel.run_jobs()) that are not up to date.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest returned by load_manifest().
+    stage : str
+        Name of the stage e.g 'nt_templated'.
+    jobs : list
+        List of (job name, args) tuples.
+    job_keys : list
+        The key of each job.
+    job_outputs : list
+        The list of output paths of each job.
+
+    Returns
+    -------
+    list, list
+        The jobs to run and their keys.
+    """
+    selected_jobs, selected_keys = [], []
+    for job, job_key, output_paths in zip(jobs, job_keys, job_outputs):
+        if not is_up_to_date(manifest, f'{stage}/{job[0]}', job_key, output_paths):
+            selected_jobs.append(job)
+            selected_keys.append(job_key)
+    if len(selected_jobs) < len(jobs):
+        print(f'  {len(jobs) - len(selected_jobs)} of {len(jobs)} replicates are up to date')
+    return selected_jobs, selected_keys
+
+def record_jobs(manifest, stage, jobs, job_keys):
+    """Record that the jobs of a stage were completed.
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest returned by load_manifest().
+    stage : str
+        Name of the stage e.g 'nt_templated'.
+    jobs : list
+        List of (job name, args) tuples returned by select_jobs().
+    job_keys : list
+        The key of each job.
+
+    Returns
+    -------
+    None. The manifest is updated in place.
+    """
+    for job, job_key in zip(jobs, job_keys):
+        record(manifest, f'{stage}/{job[0]}', job_key)
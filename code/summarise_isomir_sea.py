@@ -1,9 +1,45 @@
 import pandas as pd 
+import numpy as np
 import os
 import sys
+import json
+import parallel
+import stage_manifest
+import table_store
 from colorama import Fore, Style, init
 init(autoreset=True)
 
+# Columns of isomiR-SEA raw output files and their compact datatypes, in file order. All columns are kept in the summarised isomiRs files.
+ISOMIR_SEA_DTYPES = {
+    'tag_index': 'int32',
+    'tag_sequence': 'str',
+    'tag_quality': 'str',
+    '#count_tags': 'int64',
+    'mirna_id': 'int32',
+    'mirna_name': 'str',
+    'mirna_seq': 'category',
+    'seed_index': 'int32',
+    'begin_ungapped_mirna': 'int16',
+    'begin_ungapped_tag': 'int16',
+    'size_ungapped': 'int16',
+    'size_ungapped_1': 'int16',
+    'size_ungapped_2': 'int16',
+    'align_score': 'int16',
+    'mir_tag_size_diff': 'int16',
+    'mirna_exact': 'int8',
+    'iso_5p': 'int8',
+    'iso_snp': 'int8',
+    'iso_multi_snp': 'int8',
+    'iso_3p': 'int8',
+    'offset_site': 'int8',
+    'suppl_compens_site': 'int8',
+    'central_site': 'int8'
+}
+# Columns added to isomiR-SEA outputs 
+ANNOTATION_COLUMNS = ['5p_nt_diff', 'snp_nt', '3p_nt_diff', 'type', 'annotation']
+# Number of rows of an isomiR-SEA raw output file read at a time
+CHUNK_SIZE = 100000
+
 def snp_count(mir_seq: str, tag_seq: str, begin_ungapped_mirna: int, begin_ungapped_tag: int):
     """Count the number of snp found in an isomiR. 
     
@@ -133,59 +169,567 @@ def add_columns(row: pd.Series):
 
     return pd.Series([nt_diff_5p, nt_snp, nt_diff_3p, type, name])
 
-def run(path_raw_output_folder, path_summarised_output_folder, read_count_threshold):
-    print(Fore.MAGENTA + "\nUpdating outputs of isomiR-SEA by calculating 5', 3' and snp modification, naming isomiRs, categorizing isomiRs, ...")
+def encode_sequences(seqs: pd.Series):
+    """Encode sequences as a padded matrix of ASCII codes. 
 
-    # List of all tag sequences and their sum of read counts across all samples e.g {'AACCCUGUAGACCCGAGUUUGG': 34, 'UGAAAGACGAUGGUAGUGAGAUG': 10, 'ACCCUUGUUCGACUGUGA': 8, ...}
-    sum_read_counts = {}
-
-    # List of all sample groups 
-    group_folders = os.listdir(path_raw_output_folder)
-    # Loop through each group
-    for group in group_folders:
-        # Get the list of replicate files
-        rep_files = os.listdir(f'{path_raw_output_folder}/{group}')
-        # Loop through each replicate of that group 
-        for rep_file in rep_files:
-            # Read isomiR-SEA raw output file of that replicate
-            isomiR_SEA_output = pd.read_csv(f'{path_raw_output_folder}/{group}/{rep_file}', sep='\t', encoding='latin-1')
-            # Change the datatype of the column 
-            isomiR_SEA_output = isomiR_SEA_output.astype({
-                'begin_ungapped_tag': int,
-                'begin_ungapped_mirna': int,
-                'mir_tag_size_diff': int
-            })
-            # Retain the mirna_name   
-            isomiR_SEA_output['mirna_name'] = isomiR_SEA_output['mirna_name'].apply(lambda r: r.replace('>', '').split(' ')[0])
+    Parameters
+    ----------
+    seqs : pandas.Series
+        Sequences (miRNA or isomiR) to encode. 
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        A uint8 matrix (one row per sequence, right-padded with 0) and the length of each sequence.
+    """
+    encoded = seqs.to_numpy(dtype=str).astype('S')
+    width = max(encoded.dtype.itemsize, 1)
+    matrix = np.frombuffer(encoded.tobytes(), dtype=np.uint8).reshape(len(encoded), width) if len(encoded) else np.zeros((0, width), dtype=np.uint8)
+    lengths = seqs.str.len().to_numpy(dtype=np.int64)
+    return matrix, lengths
+
+def decode_sequences(matrix: np.ndarray):
+    """Decode a padded matrix of ASCII codes back to strings. Padding (0) is dropped.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        A uint8 matrix produced by encode_sequences() or sliced from it. 
+
+    Returns
+    -------
+    numpy.ndarray
+        An array of str, one per row. 
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.uint8)
+    if matrix.shape[1] == 0: 
+        return np.full(matrix.shape[0], '', dtype=object)
+    return np.char.decode(matrix.view(f'S{matrix.shape[1]}').ravel(), 'ascii').astype(object)
+
+def gather_positions(matrix: np.ndarray, lengths: np.ndarray, starts: np.ndarray, counts: np.ndarray):
+    """Gather counts[i] characters of row i starting at starts[i]. Positions outside the range are padded with 0.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray
+        A uint8 matrix produced by encode_sequences(). 
+    lengths : numpy.ndarray
+        The length of each sequence. 
+    starts : numpy.ndarray
+        The first position to gather for each row. 
+    counts : numpy.ndarray
+        The number of positions to gather for each row. 
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The gathered uint8 matrix and a boolean mask of valid positions. 
+    """
+    width = int(counts.max()) if len(counts) else 0
+    offsets = np.arange(width)
+    positions = starts[:, None] + offsets
+    valid = (offsets < counts[:, None]) & (positions >= 0) & (positions < lengths[:, None])
+    gathered = np.take_along_axis(matrix, np.clip(positions, 0, max(matrix.shape[1] - 1, 0)), axis=1) if width else np.zeros((len(counts), 0), dtype=np.uint8)
+    return np.where(valid, gathered, 0).astype(np.uint8), valid
+
+def annotate_isomiRs(isomiR_SEA_output: pd.DataFrame):
+    """Add extra information to all rows of an isomiR-SEA output at once. 
+    This is the column-wise equivalent of applying add_columns() to each row and gives identical values. 
+
+    Parameters
+    ----------
+    isomiR_SEA_output : pandas.DataFrame
+        The isomiR-SEA output table of a replicate. 
+        Required columns: mirna_name, mirna_seq, tag_sequence, begin_ungapped_mirna, begin_ungapped_tag, mir_tag_size_diff.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A table with the same index and 5 columns: 5p_nt_diff, snp_nt, 3p_nt_diff, type, annotation. 
+    """
+    index = isomiR_SEA_output.index
+    begin_ungapped_mirna = isomiR_SEA_output['begin_ungapped_mirna'].to_numpy(dtype=np.int64)
+    begin_ungapped_tag = isomiR_SEA_output['begin_ungapped_tag'].to_numpy(dtype=np.int64)
+    mir_tag_size_diff = isomiR_SEA_output['mir_tag_size_diff'].to_numpy(dtype=np.int64)
+
+    # 5p and 3p nucleotide differences 
+    nt_diff_5p = begin_ungapped_tag - begin_ungapped_mirna
+    nt_diff_3p = - mir_tag_size_diff - nt_diff_5p
+
+    # Encode miRNA and tag sequences 
+    mir_matrix, mir_lengths = encode_sequences(isomiR_SEA_output['mirna_seq'])
+    tag_matrix, tag_lengths = encode_sequences(isomiR_SEA_output['tag_sequence'])
+
+    # Aligned start positions of miRNA and tag (see snp_count())
+    shift = np.minimum(begin_ungapped_mirna, begin_ungapped_tag)
+    mirna_aligned_start = begin_ungapped_mirna - shift
+    tag_aligned_start = begin_ungapped_tag - shift
+    overlap = np.maximum(np.minimum(mir_lengths - mirna_aligned_start, tag_lengths - tag_aligned_start), 0)
+
+    # Compare aligned positions 
+    mir_aligned, valid = gather_positions(mir_matrix, mir_lengths, mirna_aligned_start, overlap)
+    tag_aligned, _ = gather_positions(tag_matrix, tag_lengths, tag_aligned_start, overlap)
+    mismatch = valid & (mir_aligned != tag_aligned)
+    nt_snp = mismatch.sum(axis=1)
+
+    # SNP descriptions: <miRNA position><tag nucleotide> for each mismatch, concatenated per row 
+    snp_desc = np.full(len(index), '', dtype=object)
+    rows, cols = np.nonzero(mismatch)
+    if len(rows): 
+        snp_positions = (mirna_aligned_start[rows] + cols + 1).astype(str).astype(object)
+        snp_nts = np.char.decode(tag_aligned[rows, cols].astype(np.uint8).view('S1'), 'ascii').astype(object)
+        # Mismatches are sorted by row, so each row's parts are a contiguous run 
+        row_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        snp_desc[rows[row_starts]] = np.add.reduceat(snp_positions + snp_nts, row_starts)
+
+    # Added nucleotides at 5p (prefix of the tag) and 3p (suffix of the tag)
+    added_5p, _ = gather_positions(tag_matrix, tag_lengths, np.zeros_like(nt_diff_5p), np.clip(nt_diff_5p, 0, None))
+    start_3p = np.maximum(tag_lengths - np.clip(nt_diff_3p, 0, None), 0)
+    added_3p, _ = gather_positions(tag_matrix, tag_lengths, start_3p, np.where(nt_diff_3p > 0, tag_lengths - start_3p, 0))
+    added_5p = decode_sequences(added_5p)
+    added_3p = decode_sequences(added_3p)
+
+    # Variant type 
+    type_5p = np.where(nt_diff_5p != 0, 'iso_5p', '')
+    type_snp = np.where(nt_snp > 1, 'iso_multi_snp', np.where(nt_snp == 1, 'iso_snp', ''))
+    type_3p = np.where(nt_diff_3p != 0, 'iso_3p', '')
+    n_types = (nt_diff_5p != 0).astype(int) + (nt_snp != 0).astype(int) + (nt_diff_3p != 0).astype(int)
+    type = pd.Series(np.char.add(np.char.add(np.char.add(type_5p, '-'), np.char.add(type_snp, '-')), type_3p).astype(object), index=index)
+    type = type.str.replace('-+', '-', regex=True).str.strip('-')
+    type = type.where(n_types != 1, type + '_only').where(n_types != 0, 'mirna_exact')
+
+    # isomiR name 
+    diff_5p_str = nt_diff_5p.astype(str).astype(object)
+    diff_3p_str = nt_diff_3p.astype(str).astype(object)
+    name_5p = np.where(nt_diff_5p > 0, "5'+" + diff_5p_str + ':' + added_5p, np.where(nt_diff_5p < 0, "5'" + diff_5p_str, ''))
+    name_snp = np.where(nt_snp > 0, 'snp+' + nt_snp.astype(str).astype(object) + ':' + snp_desc, '')
+    name_3p = np.where(nt_diff_3p > 0, "3'+" + diff_3p_str + ':' + added_3p, np.where(nt_diff_3p < 0, "3'" + diff_3p_str, ''))
+    name = pd.Series(name_5p.astype(object) + '|' + name_snp.astype(object) + '|' + name_3p.astype(object), index=index)
+    name = name.str.replace(r'\|+', '|', regex=True).str.strip('|')
+    mirna_name = isomiR_SEA_output['mirna_name'].astype(object)
+    annotation = (mirna_name + '(' + name + ')').where(n_types != 0, mirna_name)
+
+    return pd.DataFrame({
+        '5p_nt_diff': nt_diff_5p,
+        'snp_nt': nt_snp,
+        '3p_nt_diff': nt_diff_3p,
+        'type': type.astype(object),
+        'annotation': annotation.astype(object)
+    }, index=index)
+
+def count_tag_reads(isomiR_SEA_output: pd.DataFrame):
+    """Sum the read counts of each tag sequence in an isomiR-SEA output. 
+
+    Parameters
+    ----------
+    isomiR_SEA_output : pandas.DataFrame
+        The isomiR-SEA output table (or a chunk of it). Required columns: tag_sequence, #count_tags. 
+
+    Returns
+    -------
+    pandas.Series
+        Sum of read counts indexed by tag sequence e.g {'AACCCUGUAGACCCGAGUUUGG': 34, 'UGAAAGACGAUGGUAGUGAGAUG': 10, ...}
+    """
+    return isomiR_SEA_output.groupby('tag_sequence', sort=False)['#count_tags'].sum().astype(np.int64)
+
+def merge_tag_read_counts(tag_read_counts_list: list):
+    """Merge partial sums of read counts (e.g. from different replicates, groups or chunks) into one. 
+
+    Parameters
+    ----------
+    tag_read_counts_list : list
+        List of pandas.Series returned by count_tag_reads() or merge_tag_read_counts(). 
+
+    Returns
+    -------
+    pandas.Series
+        Sum of read counts indexed by tag sequence across all partial sums. 
+    """
+    tag_read_counts_list = [tag_read_counts for tag_read_counts in tag_read_counts_list if len(tag_read_counts)]
+    if not tag_read_counts_list: 
+        return pd.Series(dtype=np.int64, name='#count_tags')
+    return pd.concat(tag_read_counts_list).groupby(level=0, sort=False).sum().astype(np.int64)
+
+def get_kept_tag_sequences(sum_read_counts: pd.Series, read_count_threshold: int):
+    """Get tag sequences having total read counts >= read_count_threshold.
+
+    Parameters
+    ----------
+    sum_read_counts : pandas.Series
+        Sum of read counts indexed by tag sequence across all samples. 
+    read_count_threshold : int 
+        The minimum total read counts of a tag sequence. 
+
+    Returns
+    -------
+    pandas.Index
+        A hashed index of kept tag sequences, to be used with isin() / get_indexer(). 
+    """
+    return pd.Index(sum_read_counts.index[sum_read_counts.to_numpy() >= read_count_threshold], name='tag_sequence')
+
+def prepare_isomiR_SEA_output(isomiR_SEA_output: pd.DataFrame):
+    """Clean an isomiR-SEA raw output table (or a chunk of it): retain the miRNA name and exclude reads having N. 
+
+    Parameters
+    ----------
+    isomiR_SEA_output : pandas.DataFrame
+        The isomiR-SEA raw output table of a replicate. 
+
+    Returns
+    -------
+    pandas.DataFrame
+        The cleaned isomiR-SEA output table. 
+    """
+    # Exclude reads having N inside it
+    isomiR_SEA_output = isomiR_SEA_output[isomiR_SEA_output['tag_sequence'].str.contains('N') == False].copy()
+    # Change the datatype of the column 
+    isomiR_SEA_output = isomiR_SEA_output.astype({
+        'begin_ungapped_tag': int,
+        'begin_ungapped_mirna': int,
+        'mir_tag_size_diff': int
+    })
+    # Retain the mirna_name e.g. '>mmu-miR-16-5p MIMAT0000527 Mus musculus miR-16-5p' -> 'mmu-miR-16-5p'
+    isomiR_SEA_output['mirna_name'] = isomiR_SEA_output['mirna_name'].str.replace('>', '').str.split(' ').str[0].astype('category')
+    return isomiR_SEA_output
+
+def read_isomiR_SEA_output(path_rep_file, columns=None, chunk_size=CHUNK_SIZE):
+    """Stream an isomiR-SEA raw output file chunk by chunk, reading only the needed columns with compact datatypes. 
+
+    Parameters
+    ----------
+    path_rep_file : str 
+        Path to the isomiR-SEA raw output file of a replicate. 
+    columns : list 
+        Columns to read, a subset of ISOMIR_SEA_DTYPES e.g only the tag/count columns to sum read counts. All columns of the file are read by default. 
+        If mirna_name is read, each chunk is also cleaned by prepare_isomiR_SEA_output(). Otherwise, only reads having N are excluded.
+    chunk_size : int 
+        The number of rows read at a time. 
+
+    Returns
+    -------
+    Iterator of pandas.DataFrame 
+        Chunks of the isomiR-SEA output table, in file order. 
+    """
+    chunks = pd.read_csv(
+        path_rep_file, 
+        sep='\t', 
+        encoding='latin-1', 
+        usecols=columns, 
+        dtype=ISOMIR_SEA_DTYPES if columns is None else {column: ISOMIR_SEA_DTYPES[column] for column in columns}, 
+        chunksize=chunk_size)
+    for chunk in chunks: 
+        if 'mirna_name' in chunk.columns: 
+            yield prepare_isomiR_SEA_output(chunk)
+        else:
             # Exclude reads having N inside it
-            isomiR_SEA_output = isomiR_SEA_output[isomiR_SEA_output['tag_sequence'].str.contains('N') == False]
-            # Add 5p_nt_diff, snp_nt, 3p_nt_diff, type, annotation columns 
-            isomiR_SEA_output[['5p_nt_diff', 'snp_nt', '3p_nt_diff', 'type', 'annotation']] = isomiR_SEA_output.apply(lambda r: add_columns(r), axis = 1)
-            
-            # Get list of tag sequences found so far 
-            found_tag_sequences = list(sum_read_counts.keys())
-            # Loop through each tag sequence
-            for _, r in isomiR_SEA_output.iterrows(): 
-                if r['tag_sequence'] in found_tag_sequences: 
-                    sum_read_counts[r['tag_sequence']] = sum_read_counts[r['tag_sequence']] + r['#count_tags']
-                else: 
-                    sum_read_counts[r['tag_sequence']] = r['#count_tags']
-
-            # Create folder if not exist 
-            if not os.path.exists(f'{path_summarised_output_folder}/{group}'):
-                os.makedirs(f'{path_summarised_output_folder}/{group}')
-            isomiR_SEA_output.to_csv(f'{path_summarised_output_folder}/{group}/{rep_file}', index=False)
+            yield chunk[chunk['tag_sequence'].str.contains('N') == False]
+
+def count_replicate_tag_reads(path_rep_file, chunk_size=CHUNK_SIZE):
+    """Phase one: sum the read counts of each tag sequence of a replicate, reading only the tag/count columns. 
+
+    Parameters
+    ----------
+    path_rep_file : str 
+        Path to the isomiR-SEA raw output file of a replicate. 
+    chunk_size : int 
+        The number of rows read at a time. 
+
+    Returns
+    -------
+    pandas.Series
+        Sum of read counts indexed by tag sequence (see count_tag_reads()). 
+    """
+    tag_read_counts = pd.Series(dtype=np.int64, name='#count_tags')
+    for chunk in read_isomiR_SEA_output(path_rep_file, ['tag_sequence', '#count_tags'], chunk_size): 
+        tag_read_counts = merge_tag_read_counts([tag_read_counts, count_tag_reads(chunk)])
+    return tag_read_counts
+
+def annotate_replicate(path_rep_file, kept_tag_sequences, chunk_size=CHUNK_SIZE):
+    """Phase two: annotate the kept tag sequences of a replicate, chunk by chunk. 
+
+    Parameters
+    ----------
+    path_rep_file : str 
+        Path to the isomiR-SEA raw output file of a replicate. 
+    kept_tag_sequences : pandas.Index
+        Tag sequences having total read counts >= read_count_threshold (see get_kept_tag_sequences()). 
+    chunk_size : int 
+        The number of rows read at a time. 
 
+    Returns
+    -------
+    Iterator of pandas.DataFrame 
+        Chunks of summarised isomiRs, in file order. 
+    """
+    for isomiR_SEA_output in read_isomiR_SEA_output(path_rep_file, chunk_size=chunk_size):
+        # Keep tag sequences having total read counts >= read_count_threshold 
+        isomiR_SEA_output = isomiR_SEA_output[isomiR_SEA_output['tag_sequence'].isin(kept_tag_sequences)]
+        # Add 5p_nt_diff, snp_nt, 3p_nt_diff, type, annotation columns 
+        isomiR_SEA_output[ANNOTATION_COLUMNS] = annotate_isomiRs(isomiR_SEA_output)
+        yield isomiR_SEA_output
+
+def summarise_replicate(path_rep_file, path_summarised_rep_file, kept_tag_sequences, chunk_size=CHUNK_SIZE):
+    """Phase two: annotate the kept tag sequences of a replicate and write the summarised isomiRs file once, chunk by chunk. 
+
+    Parameters
+    ----------
+    path_rep_file : str 
+        Path to the isomiR-SEA raw output file of a replicate. 
+    path_summarised_rep_file : str 
+        Path to the summarised isomiRs file of that replicate, without extension (see table_store.write_table_chunks()). 
+    kept_tag_sequences : pandas.Index
+        Tag sequences having total read counts >= read_count_threshold (see get_kept_tag_sequences()). 
+    chunk_size : int 
+        The number of rows read at a time. 
+
+    Returns
+    -------
+    int, int 
+        The maximum number of nucleotide difference at 5' end and at 3' end across the isomiRs of that replicate. The summarised isomiRs file is generated. 
+    """
+    max_nt_diffs = [0, 0]
+
+    def track_max_nt_diffs(chunks):
+        for isomiR_SEA_output in chunks:
+            # Update max nt difference at 5p and 3p, chunks without kept tags have no maximum (0 is kept for a replicate without kept tags)
+            if len(isomiR_SEA_output):
+                max_nt_diffs[0] = max(max_nt_diffs[0], int(isomiR_SEA_output['5p_nt_diff'].max()))
+                max_nt_diffs[1] = max(max_nt_diffs[1], int(isomiR_SEA_output['3p_nt_diff'].max()))
+            yield isomiR_SEA_output
+
+    # Append each chunk to the summarised isomiRs file 
+    table_store.write_table_chunks(track_max_nt_diffs(annotate_replicate(path_rep_file, kept_tag_sequences, chunk_size)), path_summarised_rep_file, list(ISOMIR_SEA_DTYPES.keys()) + ANNOTATION_COLUMNS)
+    return max_nt_diffs[0], max_nt_diffs[1]
+
+def get_stats_file(path_summarised_output_folder):
+    """Get the path to the statistics file of the summarised isomiRs, stored next to the output folder (the output folder only contains group folders). 
+
+    Parameters
+    ----------
+    path_summarised_output_folder : str 
+        Path to the summarised isomiRs output folder. 
+
+    Returns
+    -------
+    str 
+        Path to the statistics file e.g 'output/mmu/1_summarised_isomiRs_stats.json'
+    """
+    return f"{path_summarised_output_folder.rstrip('/')}_stats.json"
+
+def read_stats(path_summarised_output_folder):
+    """Read the statistics of the summarised isomiRs. 
+
+    Parameters
+    ----------
+    path_summarised_output_folder : str 
+        Path to the summarised isomiRs output folder. 
+
+    Returns
+    -------
+    dict 
+        The statistics e.g {'max_nt_diff_5p': 3, 'max_nt_diff_3p': 8, 'replicates': {'D0/D0_rpt1.txt': [3, 7], ...}}, None if there is no statistics file. 
+    """
+    path_stats_file = get_stats_file(path_summarised_output_folder)
+    if not os.path.isfile(path_stats_file):
+        return None
+    with open(path_stats_file) as f:
+        return json.load(f)
+
+def write_stats(path_summarised_output_folder, rep_files, replicate_stats):
+    """Write the statistics of the summarised isomiRs: the maximum number of nucleotide difference at 5' and 3' ends of each replicate and across all replicates. 
+
+    Parameters
+    ----------
+    path_summarised_output_folder : str 
+        Path to the summarised isomiRs output folder. 
+    rep_files : list 
+        List of (group, replicate file) of all replicates. 
+    replicate_stats : dict 
+        The (max nt difference at 5p, max nt difference at 3p) of the replicates summarised in this run e.g {'D0/D0_rpt1.txt': (3, 7), ...}. 
+        The statistics of other replicates are kept from the previous statistics file, or read from their summarised isomiRs file. 
+
+    Returns
+    -------
+    None. The statistics file is generated. 
+    """
+    previous_stats = read_stats(path_summarised_output_folder)
+    previous_replicate_stats = previous_stats['replicates'] if previous_stats is not None else {}
+
+    all_replicate_stats = {}
+    for group, rep_file in rep_files:
+        rep_name = f'{group}/{rep_file}'
+        if rep_name in replicate_stats:
+            all_replicate_stats[rep_name] = list(replicate_stats[rep_name])
+        elif rep_name in previous_replicate_stats:
+            all_replicate_stats[rep_name] = previous_replicate_stats[rep_name]
+        else:
+            summarised_isomiRs = table_store.read_table(list_summarised_files(path_summarised_output_folder, group)[get_rep_name(rep_file)], columns=['5p_nt_diff', '3p_nt_diff'])
+            all_replicate_stats[rep_name] = [int(summarised_isomiRs['5p_nt_diff'].max()) if len(summarised_isomiRs) else 0, int(summarised_isomiRs['3p_nt_diff'].max()) if len(summarised_isomiRs) else 0]
+
+    with open(get_stats_file(path_summarised_output_folder), 'w') as f:
+        json.dump({
+            'max_nt_diff_5p': max([stats[0] for stats in all_replicate_stats.values()], default=0),
+            'max_nt_diff_3p': max([stats[1] for stats in all_replicate_stats.values()], default=0),
+            'replicates': all_replicate_stats}, f, indent=1)
+
+def summarise_replicate_in_memory(path_rep_file, kept_tag_sequences, chunk_size=CHUNK_SIZE):
+    """Phase two: annotate the kept tag sequences of a replicate and return them as one table. 
+
+    Parameters
+    ----------
+    path_rep_file : str 
+        Path to the isomiR-SEA raw output file of a replicate. 
+    kept_tag_sequences : pandas.Index
+        Tag sequences having total read counts >= read_count_threshold (see get_kept_tag_sequences()). 
+    chunk_size : int 
+        The number of rows read at a time. 
+
+    Returns
+    -------
+    pandas.DataFrame
+        The summarised isomiRs of that replicate. 
+    """
+    chunks = list(annotate_replicate(path_rep_file, kept_tag_sequences, chunk_size))
+    if not chunks: 
+        return pd.DataFrame(columns=list(ISOMIR_SEA_DTYPES.keys()) + ANNOTATION_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+def list_replicate_files(path_raw_output_folder):
+    """List the isomiR-SEA raw output files of all sample groups. 
+
+    Parameters
+    ----------
+    path_raw_output_folder : str 
+        Path to the folder of isomiR-SEA raw outputs (one subfolder per group). 
+
+    Returns
+    -------
+    list 
+        List of (group, replicate file) e.g [('D0', 'D0_rpt1.txt'), ('D0', 'D0_rpt2.txt'), ('18hr', '18hr_rpt1.txt'), ...]
+    """
+    return [(group, rep_file) for group in os.listdir(path_raw_output_folder) for rep_file in os.listdir(f'{path_raw_output_folder}/{group}')]
+
+def get_rep_name(rep_file):
+    """Get the replicate name of an isomiR-SEA raw output file, which also names its summarised isomiRs file. 
+
+    Parameters
+    ----------
+    rep_file : str 
+        The raw output file name e.g D0_rpt1.txt
+
+    Returns
+    -------
+    str 
+        e.g D0_rpt1
+    """
+    return rep_file.split('.')[0]
+
+def list_summarised_files(path_summarised_output_folder, group):
+    """List the summarised isomiRs files of a group. 
+
+    Parameters
+    ----------
+    path_summarised_output_folder : str 
+        Path to the summarised isomiRs output folder. 
+    group : str 
+        The group name. 
+
+    Returns
+    -------
+    dict 
+        The path to the summarised isomiRs file of each replicate, keyed by replicate name (see table_store.list_tables()). 
+    """
+    return table_store.list_tables(f'{path_summarised_output_folder}/{group}')
+
+def count_all_tag_reads(path_raw_output_folder, rep_files, read_count_threshold, chunk_size=CHUNK_SIZE, n_workers=None):
+    """Phase one: sum read counts of each tag sequence across all replicates and get the kept tag sequences. 
+
+    Parameters
+    ----------
+    path_raw_output_folder : str 
+        Path to the folder of isomiR-SEA raw outputs (one subfolder per group). 
+    rep_files : list 
+        List of (group, replicate file) returned by list_replicate_files(). 
+    read_count_threshold : int 
+        The minimum total read counts of a tag sequence. 
+    chunk_size : int 
+        The number of rows read at a time. 
+    n_workers : int 
+        The number of worker processes (see parallel.run_jobs()). 
+
+    Returns
+    -------
+    pandas.Index
+        Tag sequences having total read counts >= read_count_threshold. 
+    """
+    # Sum read counts of each tag sequence, one per replicate 
+    tag_read_counts_list = parallel.run_jobs(
+        count_replicate_tag_reads, 
+        [(f'{group}/{rep_file}', (f'{path_raw_output_folder}/{group}/{rep_file}', chunk_size)) for group, rep_file in rep_files], 
+        n_workers)
+
+    # List of all tag sequences and their sum of read counts across all samples e.g {'AACCCUGUAGACCCGAGUUUGG': 34, 'UGAAAGACGAUGGUAGUGAGAUG': 10, 'ACCCUUGUUCGACUGUGA': 8, ...}
+    sum_read_counts = merge_tag_read_counts(tag_read_counts_list)
     # Get tag sequences having read counts >= read_count_threshold
-    kept_tag_sequences = [k for k,v in sum_read_counts.items() if v >= read_count_threshold]
-    # Loop through each group
-    for group in group_folders:
-        # Get the list of replicate files
-        rep_files = os.listdir(f'{path_summarised_output_folder}/{group}')
-        # Loop through each replicate of that group 
-        for rep_file in rep_files:
-            # Read summarised isomiR-SEA output file of that replicate
-            isomiR_SEA_output = pd.read_csv(f'{path_summarised_output_folder}/{group}/{rep_file}')
-            # Keep tag sequences having total read counts >= read_count_threshold 
-            isomiR_SEA_output = isomiR_SEA_output[isomiR_SEA_output['tag_sequence'].isin(kept_tag_sequences)]
-            isomiR_SEA_output.to_csv(f'{path_summarised_output_folder}/{group}/{rep_file}', index=False)
\ No newline at end of file
+    return get_kept_tag_sequences(sum_read_counts, read_count_threshold)
+
+def summarise(path_raw_output_folder, read_count_threshold, chunk_size=CHUNK_SIZE, n_workers=None):
+    """Summarise the isomiR-SEA outputs of all replicates in memory (no file is written). 
+
+    Parameters
+    ----------
+    path_raw_output_folder : str 
+        Path to the folder of isomiR-SEA raw outputs (one subfolder per group). 
+    read_count_threshold : int 
+        The minimum total read counts of a tag sequence. 
+    chunk_size : int 
+        The number of rows read at a time. 
+    n_workers : int 
+        The number of worker processes (see parallel.run_jobs()). 
+
+    Returns
+    -------
+    dict 
+        Summarised isomiRs by group and replicate file e.g {'D0': {'D0_rpt1.txt': pandas.DataFrame, ...}, ...}
+    """
+    rep_files = list_replicate_files(path_raw_output_folder)
+    # Phase one
+    kept_tag_sequences = count_all_tag_reads(path_raw_output_folder, rep_files, read_count_threshold, chunk_size, n_workers)
+    # Phase two 
+    summarised_isomiRs = parallel.run_jobs(
+        summarise_replicate_in_memory, 
+        [(f'{group}/{rep_file}', (f'{path_raw_output_folder}/{group}/{rep_file}', kept_tag_sequences, chunk_size)) for group, rep_file in rep_files], 
+        n_workers)
+
+    summarised_isomiRs_by_group = {}
+    for (group, rep_file), rep_df in zip(rep_files, summarised_isomiRs):
+        summarised_isomiRs_by_group.setdefault(group, {})[rep_file] = rep_df
+    return summarised_isomiRs_by_group
+
+def run(path_raw_output_folder, path_summarised_output_folder, read_count_threshold, chunk_size=CHUNK_SIZE, n_workers=None, manifest=None):
+    print(Fore.MAGENTA + "\nUpdating outputs of isomiR-SEA by calculating 5', 3' and snp modification, naming isomiRs, categorizing isomiRs, ...")
+
+    # List of (group, replicate file) of all sample groups 
+    rep_files = list_replicate_files(path_raw_output_folder)
+
+    # Phase one: sum read counts of each tag sequence across all replicates 
+    kept_tag_sequences = count_all_tag_reads(path_raw_output_folder, rep_files, read_count_threshold, chunk_size, n_workers)
+
+    # Create group folders if not exist 
+    for group in {group for group, _ in rep_files}:
+        if not os.path.exists(f'{path_summarised_output_folder}/{group}'):
+            os.makedirs(f'{path_summarised_output_folder}/{group}')
+
+    # Phase two: annotate and write the kept tag sequences of each replicate 
+    jobs = [(f'{group}/{rep_file}', (f'{path_raw_output_folder}/{group}/{rep_file}', f'{path_summarised_output_folder}/{group}/{get_rep_name(rep_file)}', kept_tag_sequences, chunk_size)) for group, rep_file in rep_files]
+    if manifest is not None:
+        # A replicate is only summarised again if its raw output or the kept tag sequences changed
+        kept_tag_sequences_hash = stage_manifest.hash_values(kept_tag_sequences)
+        job_keys = [stage_manifest.get_key(manifest, [args[0]], [kept_tag_sequences_hash, list(ISOMIR_SEA_DTYPES.keys())]) for _, args in jobs]
+        jobs, job_keys = stage_manifest.select_jobs(manifest, 'summarise_isomir_sea', jobs, job_keys, [[table_store.get_table_file(args[1])] for _, args in jobs])
+    replicate_stats = parallel.run_jobs(summarise_replicate, jobs, n_workers)
+    if manifest is not None:
+        stage_manifest.record_jobs(manifest, 'summarise_isomir_sea', jobs, job_keys)
+
+    # Max nt differences of each replicate, used to extend precursors 
+    write_stats(path_summarised_output_folder, rep_files, {job_name: stats for (job_name, _), stats in zip(jobs, replicate_stats)})
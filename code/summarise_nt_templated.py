@@ -1,60 +1,160 @@
 import pandas as pd 
-from collections import Counter
+import numpy as np
 import os
 import sys
+import parallel
+import stage_manifest
+import alignment_store
+import generate_precursor
+import table_store
 from colorama import Fore, Style, init
 init(autoreset=True)
 
-def get_extension_values(r, max_nt_diff_5p, max_nt_diff_3p):
-    """Get the matching symbol or nucleotide at extension positions (5'+1, 5'+2, 5'+3, ..., 3'+1, 3'+2, 3'+3,...) for each isomiR.
+# Nucleotides counted at extension positions
+EXTENSION_NUCLEOTIDES = ['a', 'u', 'c', 'g']
+# State of each position of an isomiR: no nucleotide, templated or nontemplated
+NO_NT, TEMPLATED, NONTEMPLATED = 0, 1, 2
+
+def get_extension_cols(max_nt_diff_5p, max_nt_diff_3p):
+    """Get the names of the extension positions. 
 
     Parameters
     ----------
-    r : pandas.Series 
-        A 1D array that stores details of an isomiRs such as sequence, matching symbol / nucleotides at each position. 
-        Indexes correspond to column names, values correspond to cell values. 
     max_nt_diff_5p : int 
         The maximum number of nucleotide difference at 5' end across all isomiRs.
     max_nt_diff_3p : int 
         The maximum number of nucleotide difference at 3' end across all isomiRs.
 
+    Returns
+    -------
+    list
+        e.g ["5'+1", "5'+2", "5'+3", "3'+1", "3'+2", ...]
+    """
+    # Create a list of columns for extension positions at 5p
+    extension_5p_cols = [ f"5'+{i + 1}" for i in range(max_nt_diff_5p)]
+    # Create a list of columns for extension positions at 3p
+    extension_3p_cols = [ f"3'+{i + 1}" for i in range(max_nt_diff_3p)]
+    # Combine 5 extension cols and 3 extension cols
+    return extension_5p_cols + extension_3p_cols
+
+def get_position_states(alignment):
+    """Get the state (no nucleotide, templated or nontemplated) of each position of each isomiR of an encoded alignment. 
+
+    Parameters
+    ----------
+    alignment : dict
+        The unique tag alignment (see nt_templated.align_unique_tags()). 
+
+    Returns
+    -------
+    numpy.ndarray
+        A uint8 matrix (one row per isomiR, one column per position) of NO_NT, TEMPLATED or NONTEMPLATED. 
+    """
+    has_nt = alignment['nt'] != 0
+    return np.where(has_nt, np.where(alignment_store.get_templated_matrix(alignment), TEMPLATED, NONTEMPLATED), NO_NT).astype(np.uint8)
+
+def get_extension_values(matrix, alignment, max_nt_diff_5p, max_nt_diff_3p):
+    """Get the values (nucleotide codes or states) at extension positions (5'+1, 5'+2, 5'+3, ..., 3'+1, 3'+2, 3'+3,...) for each isomiR.
+
+    The 5' extension positions are the first max_nt_diff_5p positions of the extended precursor (5'+1 is the closest to the canonical). 
+    The 3' extension positions are the last max_nt_diff_3p positions of the isomiR aligned to its extended precursor.
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray 
+        A matrix with one row per isomiR and one column per position e.g alignment['nt'] or get_position_states(). 
+    alignment : dict
+        The unique tag alignment. 
+    max_nt_diff_5p : int 
+        The maximum number of nucleotide difference at 5' end across all isomiRs.
+    max_nt_diff_3p : int 
+        The maximum number of nucleotide difference at 3' end across all isomiRs.
     
     Example
     -----------
     ```
-    r (nt alignment) : sja-bantam,   UGAGAUCGCGAUUAAAGCUGGU        ,False,,,,,u,g,a,g,a,u,c,g,c,g,a,u,u,a,a,a,g,c,u,g,g,u,,,,,,,,,,,
+    nt alignment :   sja-bantam,   UGAGAUCGCGAUUAAAGCUGGU        ,False,,,,,u,g,a,g,a,u,c,g,c,g,a,u,u,a,a,a,g,c,u,g,g,u,,,,,,,,,,,
     max_nt_diff_5p : 3
     max_nt_diff_3p : 8
-    Output (for nt alignment file) : ['a','g','u','a','a','g','c','u','g','g','u'] - the nucleotides at 5'+1,5'+2,5'+3,3'+1,3'+2,3'+3,3'+4,3'+5,3'+6,3'+7,3'+8.
-
-    r (templated alignment) : sja-bantam,   UGGGAUCGCGAUUAAAGCUGGA        ,False,,,,,+,+,-,+,+,+,+,+,+,+,+,+,+,+,+,+,+,+,+,+,+,-,,,,,,,,,,,
-    max_nt_diff_5p : 3
-    max_nt_diff_3p : 8
-    Output (for templated alignment file) : ['-','+','+','+','+','+','+','+','+','+','-'] - the matching symbols at 5'+1,5'+2,5'+3,3'+1,3'+2,3'+3,3'+4,3'+5,3'+6,3'+7,3'+8.
+    Output (as characters) : ['a','g','u','a','a','g','c','u','g','g','u'] - the nucleotides at 5'+1,5'+2,5'+3,3'+1,3'+2,3'+3,3'+4,3'+5,3'+6,3'+7,3'+8 (0 where the isomiR has no nucleotide).
     ```
     
     Returns
     -------
-    pandas.Series 
-        A list of matching symbols or nucleotides at extension positions.
+    numpy.ndarray 
+        A matrix with one row per isomiR and one column per extension position (see get_extension_cols()). 
     """
-    values = []
-    pre_len = len(r['pre_seq'])
-    for i in range(max_nt_diff_5p, 0, -1):
-        values.append(r[str(i)])
-    for i in range(pre_len - max_nt_diff_3p + 1, pre_len + 1):
-        values.append(r[str(i)])
-    return pd.Series(values)
-
-def summarise_nt_alignment(path_nt_alignment_file, path_summarised_nt_alignment_file, max_nt_diff_5p, max_nt_diff_3p):
-    """Calculate the nucleotide frequency at extension positions and save to the summarised nt alignment file.
-    
+    n_isomiRs, n_positions = matrix.shape
+    _, pre_lens = alignment_store.get_precursor_matrix(alignment)
+    # Length of each isomiR aligned to its extended precursor (the isomiR may go past the end of the precursor)
+    tag_lens = np.char.str_len(alignment['tag_sequences']) if n_isomiRs else np.zeros(0, dtype=np.int64)
+    aligned_lens = np.maximum(pre_lens[alignment_store.get_isomiR_mirnas(alignment)], alignment['starts'] + tag_lens)
+
+    # Column (0-based) of each extension position for each isomiR
+    cols_5p = np.broadcast_to(np.arange(max_nt_diff_5p - 1, -1, -1), (n_isomiRs, max_nt_diff_5p))
+    cols_3p = aligned_lens[:, None] - max_nt_diff_3p + np.arange(max_nt_diff_3p)
+    cols = np.concatenate([cols_5p, cols_3p], axis=1)
+    # Positions outside the alignment have no value
+    is_valid = (cols >= 0) & (cols < n_positions)
+    values = np.take_along_axis(matrix, np.clip(cols, 0, max(n_positions - 1, 0)), axis=1) if n_positions else np.zeros(cols.shape, dtype=matrix.dtype)
+    return np.where(is_valid, values, 0).astype(matrix.dtype)
+
+def count_values(matrix, n_values, weights=None):
+    """Count each value in each column of a matrix. 
+
     Parameters
     ----------
-    path_nt_alignment_file : str 
-        Path to nt alignment file. 
-    path_summarised_nt_alignment_file : str
-        Path to summarised nt alignment (for extension positions) file. 
+    matrix : numpy.ndarray 
+        A matrix of integer values in [0, n_values) e.g nucleotide codes or states. 
+    n_values : int
+        The number of distinct values. 
+    weights : numpy.ndarray
+        The weight of each row e.g the read count of each isomiR. None counts each row once. 
+
+    Returns
+    -------
+    numpy.ndarray
+        A matrix (one row per column of the input matrix, one column per value) of the number (or the total weight) of rows with that value. 
+    """
+    n_cols = matrix.shape[1]
+    # Count (column, value) pairs at once 
+    pairs = (np.arange(n_cols) * n_values + matrix.astype(np.int64)).ravel()
+    if weights is not None:
+        weights = np.repeat(np.asarray(weights, dtype=np.float64), n_cols)
+    return np.bincount(pairs, weights=weights, minlength=n_cols * n_values).reshape(n_cols, n_values)
+
+def count_all_values(matrix, n_values, replicate_index):
+    """Count each value in each column of a matrix, by unique tags, by read counts and by rpm. 
+
+    Parameters
+    ----------
+    matrix : numpy.ndarray 
+        A matrix of integer values in [0, n_values) with one row per isomiR of the unique tag alignment. 
+    n_values : int
+        The number of distinct values. 
+    replicate_index : dict
+        The rows, read counts and total read count of the isomiRs of a replicate (see nt_templated.get_replicate_index()). 
+
+    Returns
+    -------
+    dict
+        The count matrices (see count_values()) keyed by summary column: value (number of unique tags), read_count (sum of read counts) and rpm (read counts normalised by the total read count of the replicate). 
+    """
+    # Rows of the isomiRs of the replicate
+    matrix = matrix[replicate_index['rows']]
+    read_counts = count_values(matrix, n_values, replicate_index['counts'])
+    return {
+        'value': count_values(matrix, n_values),
+        'read_count': np.rint(read_counts).astype(np.int64),
+        'rpm': read_counts * 1000000 / replicate_index['total_count'] if replicate_index['total_count'] else read_counts}
+
+def get_nt_summary(nt_counts, max_nt_diff_5p, max_nt_diff_3p):
+    """Build the table of nucleotide frequency at extension positions.
+
+    Parameters
+    ----------
+    nt_counts : dict
+        The number of isomiRs (and their read counts / rpm) with each nucleotide code (columns) at each extension position (rows), see count_all_values(). 
     max_nt_diff_5p : int 
         The maximum number of nucleotide difference at 5' end across all isomiRs.
     max_nt_diff_3p : int 
@@ -70,55 +170,38 @@ def summarise_nt_alignment(path_nt_alignment_file, path_summarised_nt_alignment_
     sja-miR-10-3p : u,g,a,u,a,u,a,c,u,u,u
 
 
-    Output :
-    position | nucleotide | value
-    5'+1     |          a |     2
-    5'+1     |          u |     2        
-    5'+1     |          c |     0
-    5'+1     |          g |     0
-    5'+2     |          a |     0
-    5'+2     |          u |     1
-    5'+2     |          c |     0
-    5'+2     |          g |     3
-    ....     |        ... |   ...
+    Output (read_count and rpm are the read counts of the same isomiRs):
+    position | nucleotide | value | read_count | rpm
+    5'+1     |          a |     2 |        120 | ...
+    5'+1     |          u |     2 |         15 | ...
+    5'+1     |          c |     0 |          0 | ...
+    5'+1     |          g |     0 |          0 | ...
+    5'+2     |          a |     0 |          0 | ...
+    5'+2     |          u |     1 |         10 | ...
+    5'+2     |          c |     0 |          0 | ...
+    5'+2     |          g |     3 |        125 | ...
+    ....     |        ... |   ... |        ... | ...
     ```
 
     Returns
     -------
-    None. A summarised nt alignment file that stores the nucleotide frequency at extension positions is generated. 
+    pandas.DataFrame
+        The nucleotide frequency at extension positions with columns position, nucleotide, value (unique tags), read_count, rpm. 
     """
-    # Read the nt alignment file 
-    nt_alignment = pd.read_csv(path_nt_alignment_file)
+    extension_cols = get_extension_cols(max_nt_diff_5p, max_nt_diff_3p)
+    nt_codes = [ord(nt) for nt in EXTENSION_NUCLEOTIDES]
+    return pd.DataFrame({
+        'position': np.repeat(extension_cols, len(nt_codes)),
+        'nucleotide': np.tile(EXTENSION_NUCLEOTIDES, len(extension_cols)),
+        **{col: counts[:, nt_codes].ravel() for col, counts in nt_counts.items()}})
+
+def get_templated_summary(state_counts, max_nt_diff_5p, max_nt_diff_3p):
+    """Build the table of templated / nontemplated frequency at extension positions.
 
-    # Create a list of columns for extension positions at 5p
-    extension_5p_cols = [ f"5'+{i + 1}" for i in range(max_nt_diff_5p)]
-    # Create a list of columns for extension positions at 3p
-    extension_3p_cols = [ f"3'+{i + 1}" for i in range(max_nt_diff_3p)]
-    # Combine 5 extension cols and 3 extension cols
-    extension_cols = extension_5p_cols + extension_3p_cols
-
-    # Remove precursor rows 
-    nt_alignment = nt_alignment[nt_alignment['is_pre'] == False]
-    # For each isomiR/canonical, get nucleotide at 5e1, 5e2, 5e3,..., 3e1, 3e2,... 
-    nt_alignment[extension_cols] = nt_alignment.apply(lambda r: get_extension_values(r, max_nt_diff_5p, max_nt_diff_3p), axis=1)
-    # Create a dataframe that stores the nucleotide frequency at extension positions
-    nt_summary = pd.DataFrame(columns=['position', 'nucleotide', 'value'])
-    for col in extension_cols: 
-        freq_counts = Counter(list(nt_alignment[col]))
-        for nt in ['a', 'u', 'c', 'g']:
-            nt_value = freq_counts[nt] if nt in freq_counts else 0
-            nt_summary.loc[len(nt_summary.index)] = [col, nt, nt_value]
-    nt_summary.to_csv(path_summarised_nt_alignment_file, index = False)
-
-def summarise_templated_alignment(path_templated_alignment_file, path_summarised_templated_alignment_file, max_nt_diff_5p, max_nt_diff_3p):
-    """Calculate the templated / nontemplated frequency at extension positions and save to the summarised templated alignment file.
-    
     Parameters
     ----------
-    path_templated_alignment_file : str 
-        Path to templated alignment file. 
-    path_summarised_templated_alignment_file : str
-        Path to summarised templated alignment (for extension positions) file. 
+    state_counts : dict
+        The number of isomiRs (and their read counts / rpm) in each state (columns) at each extension position (rows), see count_all_values(). 
     max_nt_diff_5p : int 
         The maximum number of nucleotide difference at 5' end across all isomiRs.
     max_nt_diff_3p : int 
@@ -149,41 +232,19 @@ def summarise_templated_alignment(path_templated_alignment_file, path_summarised
 
     Returns
     -------
-    None. A summarised templated alignment file that stores the templated / nontemplated frequency at extension positions is generated. 
+    pandas.DataFrame
+        The templated / nontemplated frequency at extension positions with columns position, templated, value (unique tags), read_count, rpm. 
     """
-    # Read the templated alignment file 
-    templated_alignment = pd.read_csv(path_templated_alignment_file)
-    # Create a list of columns for extension positions at 5p
-    extension_5p_cols = [ f"5'+{i + 1}" for i in range(max_nt_diff_5p)]
-    # Create a list of columns for extension positions at 3p
-    extension_3p_cols = [ f"3'+{i + 1}" for i in range(max_nt_diff_3p)]
-    # Combine 5 extension cols and 3 extension cols
-    extension_cols = extension_5p_cols + extension_3p_cols
-
-    # Remove precursor rows 
-    templated_alignment = templated_alignment[templated_alignment['is_pre'] == False]
-    # For each miRNA/isomiR, get values at 5e1, 5e2, 5e3,..., 3e1, 3e2,... 
-    templated_alignment[extension_cols] = templated_alignment.apply(lambda r: get_extension_values(r, max_nt_diff_5p, max_nt_diff_3p), axis=1)
-    # Create a dataframe that stores the templated / nontemplated frequency at extension positions
-    templated_summary = pd.DataFrame(columns=['position', 'templated', 'value'])
-    for col in extension_cols: 
-        freq_counts = Counter(list(templated_alignment[col]))
-        templated_value = freq_counts['+'] if '+' in freq_counts else 0
-        untemplated_value = freq_counts['-'] if '-' in freq_counts else 0
-        templated_summary.loc[len(templated_summary.index)] = [col, 'Templated', templated_value]
-        templated_summary.loc[len(templated_summary.index)] = [col, 'Nontemplated', untemplated_value]
-    templated_summary.to_csv(path_summarised_templated_alignment_file, index = False)
-
-def summarise_templated_alignment_all(path_templated_alignment_file, path_summarised_templated_alignment_all_file, max_nt_diff_5p):
-    """Calculate the templated / nontemplated frequency at all positions and save to the summarised templated alignment file. 
+    return get_state_table(get_extension_cols(max_nt_diff_5p, max_nt_diff_3p), state_counts)
+
+def get_templated_all_summary(state_counts, max_nt_diff_5p):
+    """Build the table of templated / nontemplated frequency at all positions.
 
     Parameters
     ----------
-    path_templated_alignment_file : str 
-        Path to templated alignment file. 
-    path_summarised_templated_alignment_all_file : str
-        Path to summarised templated alignment for (all positions) file. 
-    max_nt_diff_5p : str
+    state_counts : dict
+        The number of isomiRs (and their read counts / rpm) in each state (columns) at each position of the extended precursors (rows), see count_all_values(). 
+    max_nt_diff_5p : int 
         The maximum number of nucleotide difference at 5' end across all isomiRs.
 
     Example
@@ -208,75 +269,161 @@ def summarise_templated_alignment_all(path_templated_alignment_file, path_summar
     ....     |     ...     |   ...
     ```
 
-    Returns 
+    Returns
+    -------
+    pandas.DataFrame
+        The templated / nontemplated frequency at all positions with columns position, templated, value (unique tags), read_count, rpm. 
+    """
+    # Positions before the canonical are named 5'+1, 5'+2, ..., the canonical starts at 1 
+    positions = [f"5'+{max_nt_diff_5p - col + 1}" if col <= max_nt_diff_5p else str(col - max_nt_diff_5p) for col in range(1, len(state_counts['value']) + 1)]
+    return get_state_table(positions, state_counts)
+
+def get_state_table(positions, state_counts):
+    """Build a table of templated / nontemplated frequency with a Templated row and a Nontemplated row per position.
+
+    Parameters
+    ----------
+    positions : list
+        The name of each position. 
+    state_counts : dict
+        The number of isomiRs (and their read counts / rpm) in each state (columns) at each position (rows), keyed by summary column. 
+
+    Returns
     -------
-    None. A summarised templated alignment file that stores the templated / nontemplated frequency at all positions is generated. 
+    pandas.DataFrame
+        The templated / nontemplated frequency with columns position, templated, value (unique tags), read_count, rpm. 
     """
-    # Read the templated alignment file 
-    templated_alignment = pd.read_csv(path_templated_alignment_file)
-    # Remove precursor rows 
-    templated_alignment = templated_alignment[templated_alignment['is_pre'] == False]
-    # Create a dataframe that stores the templated / nontemplated frequency at all positions
-    templated_summary = pd.DataFrame(columns=['position', 'templated', 'value'])
-    # Position columns 
-    cols = list(templated_alignment.columns)
-    del cols[0:4]
-
-    # Loop through each position 
-    for col in cols: 
-        freq_counts = Counter(list(templated_alignment[col]))
-        templated_value = freq_counts['+'] if '+' in freq_counts else 0
-        untemplated_value = freq_counts['-'] if '-' in freq_counts else 0
-        col = int(col)
-        col = f"5'+{max_nt_diff_5p - col + 1}" if col <= max_nt_diff_5p else col - max_nt_diff_5p
-        templated_summary.loc[len(templated_summary.index)] = [col, 'Templated', templated_value]
-        templated_summary.loc[len(templated_summary.index)] = [col, 'Nontemplated', untemplated_value]
-    templated_summary.to_csv(path_summarised_templated_alignment_all_file, index = False)
+    return pd.DataFrame({
+        'position': np.repeat(np.array(positions, dtype=object), 2),
+        'templated': np.tile(['Templated', 'Nontemplated'], len(positions)),
+        **{col: counts[:, [TEMPLATED, NONTEMPLATED]].ravel() for col, counts in state_counts.items()}})
+
+def get_tag_values(unique_tag_alignment, max_nt_diff_5p, max_nt_diff_3p):
+    """Get the values counted by the summaries for each distinct isomiR, once for all replicates. 
+
+    Parameters
+    ----------
+    unique_tag_alignment : dict
+        The unique tag alignment shared by all replicates (see nt_templated.align_unique_tags()). 
+    max_nt_diff_5p : int 
+        The maximum number of nucleotide difference at 5' end across all isomiRs.
+    max_nt_diff_3p : int 
+        The maximum number of nucleotide difference at 3' end across all isomiRs.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray
+        The nucleotide codes at extension positions, the states at extension positions and the states at all positions (one row per isomiR of the unique tag alignment). 
+    """
+    states = get_position_states(unique_tag_alignment)
+    return (
+        get_extension_values(unique_tag_alignment['nt'], unique_tag_alignment, max_nt_diff_5p, max_nt_diff_3p), 
+        get_extension_values(states, unique_tag_alignment, max_nt_diff_5p, max_nt_diff_3p), 
+        states)
+
+def summarise_alignment(replicate_index, tag_values, max_nt_diff_5p, max_nt_diff_3p):
+    """Calculate the 3 summaries (nt at extension positions, templated at extension positions, templated at all positions) of a replicate, counting all positions at once. 
+    Each summary counts unique tags (value) and read counts (read_count, rpm) from the same matrices. 
+
+    Parameters
+    ----------
+    replicate_index : dict
+        The rows, read counts and total read count of the isomiRs of a replicate (see nt_templated.get_replicate_index()). 
+    tag_values : tuple
+        The values of each distinct isomiR returned by get_tag_values(). 
+    max_nt_diff_5p : int 
+        The maximum number of nucleotide difference at 5' end across all isomiRs.
+    max_nt_diff_3p : int 
+        The maximum number of nucleotide difference at 3' end across all isomiRs.
+
+    Returns
+    -------
+    pandas.DataFrame, pandas.DataFrame, pandas.DataFrame
+        The summarised nt alignment, summarised templated alignment and summarised templated alignment (all positions). 
+    """
+    extension_nts, extension_states, states = tag_values
+    # Count nucleotide codes and states at each position
+    nt_counts = count_all_values(extension_nts, 256, replicate_index)
+    extension_state_counts = count_all_values(extension_states, 3, replicate_index)
+    all_state_counts = count_all_values(states, 3, replicate_index)
+    return (
+        get_nt_summary(nt_counts, max_nt_diff_5p, max_nt_diff_3p), 
+        get_templated_summary(extension_state_counts, max_nt_diff_5p, max_nt_diff_3p), 
+        get_templated_all_summary(all_state_counts, max_nt_diff_5p))
+
+def summarise_replicate(path_nt_templated_alignment_file, tag_values, path_summarised_nt_alignment_file, path_summarised_templated_alignment_file, path_summarised_templated_alignment_all_file, max_nt_diff_5p, max_nt_diff_3p):
+    """Generate the 3 summarised alignment files (nt at extension positions, templated at extension positions, templated at all positions) of a replicate. 
+
+    Parameters
+    ----------
+    path_nt_templated_alignment_file : str 
+        Path to the replicate index file (.npz) of a replicate. 
+    tag_values : tuple
+        The values of each distinct isomiR returned by get_tag_values(). 
+    path_summarised_nt_alignment_file : str
+        Path to summarised nt alignment (for extension positions) file, without extension (see table_store.write_table()). 
+    path_summarised_templated_alignment_file : str
+        Path to summarised templated alignment (for extension positions) file, without extension (see table_store.write_table()). 
+    path_summarised_templated_alignment_all_file : str
+        Path to summarised templated alignment (for all positions) file, without extension (see table_store.write_table()). 
+    max_nt_diff_5p : int 
+        The maximum number of nucleotide difference at 5' end across all isomiRs.
+    max_nt_diff_3p : int 
+        The maximum number of nucleotide difference at 3' end across all isomiRs.
+
+    Returns
+    -------
+    None. The 3 summarised alignment files are generated. 
+    """
+    summaries = summarise_alignment(alignment_store.load_alignment(path_nt_templated_alignment_file), tag_values, max_nt_diff_5p, max_nt_diff_3p)
+    for summary, path_summary_file in zip(summaries, [path_summarised_nt_alignment_file, path_summarised_templated_alignment_file, path_summarised_templated_alignment_all_file]):
+        table_store.write_table(summary, path_summary_file)
    
 def run(
-        path_nt_alignment_output_folder,
-        path_templated_alignment_output_folder,
+        path_nt_templated_alignment_output_folder,
         path_summarised_nt_alignment_output_folder,
         path_summarised_templated_alignment_output_folder,
         path_summarised_templated_alignment_all_output_folder,
-        path_precursors_output_folder):
+        path_precursors_output_folder,
+        n_workers=None,
+        manifest=None):
     print(Fore.MAGENTA + "\nSummarising statistics for different types of variation ...")
     
     # List of group folders
-    nt_group_folders = os.listdir(path_nt_alignment_output_folder)
-    templated_group_folders = os.listdir(path_templated_alignment_output_folder)
-    # Get precursor file 
-    precursor_output_file = [file for file in os.listdir(path_precursors_output_folder) if '.csv' in file][0]
-    # Get max nt difference at 5p 
-    max_nt_diff_5p, max_nt_diff_3p = int(precursor_output_file.split('_')[0]), int(precursor_output_file.split('_')[1])
+    group_folders = alignment_store.get_group_folders(path_nt_templated_alignment_output_folder)
+    # Get max nt difference at 5p and 3p from the precursor file 
+    _, max_nt_diff_5p, max_nt_diff_3p = generate_precursor.find_precursor_file(path_precursors_output_folder)
+    # Get the values of each distinct isomiR once for all replicates
+    path_unique_tags_file = alignment_store.get_unique_tags_file(path_nt_templated_alignment_output_folder)
+    tag_values = get_tag_values(alignment_store.load_alignment(path_unique_tags_file), max_nt_diff_5p, max_nt_diff_3p)
 
-    for nt_group, templated_group in zip(nt_group_folders, templated_group_folders):
-        # Get the list of nt alignment files of that group
-        rep_nt_files = os.listdir(f'{path_nt_alignment_output_folder}/{nt_group}')
-        # Get the list of templated alignment files of that group
-        rep_templated_files = os.listdir(f'{path_templated_alignment_output_folder}/{templated_group}')
+    # One job per replicate 
+    jobs = []
+    for group in group_folders:
+        # Get the list of nt templated alignment files of that group
+        rep_files = os.listdir(f'{path_nt_templated_alignment_output_folder}/{group}')
 
-        if not os.path.exists(f'{path_summarised_nt_alignment_output_folder}/{nt_group}'):
-            os.makedirs(f'{path_summarised_nt_alignment_output_folder}/{nt_group}')
-
-        if not os.path.exists(f'{path_summarised_templated_alignment_output_folder}/{templated_group}'):
-            os.makedirs(f'{path_summarised_templated_alignment_output_folder}/{templated_group}')
-
-        if not os.path.exists(f'{path_summarised_templated_alignment_all_output_folder}/{templated_group}'):
-            os.makedirs(f'{path_summarised_templated_alignment_all_output_folder}/{templated_group}')
+        for path_output_folder in [path_summarised_nt_alignment_output_folder, path_summarised_templated_alignment_output_folder, path_summarised_templated_alignment_all_output_folder]:
+            if not os.path.exists(f'{path_output_folder}/{group}'):
+                os.makedirs(f'{path_output_folder}/{group}')
 
         # Loop through each replicate file 
-        for nt_rep_file, templated_rep_file in zip(rep_nt_files, rep_templated_files):
-            summarise_nt_alignment(f'{path_nt_alignment_output_folder}/{nt_group}/{nt_rep_file}', 
-                                f'{path_summarised_nt_alignment_output_folder}/{nt_group}/{nt_rep_file}',
-                                max_nt_diff_5p,
-                                max_nt_diff_3p)
-            summarise_templated_alignment(f'{path_templated_alignment_output_folder}/{templated_group}/{templated_rep_file}', 
-                                f'{path_summarised_templated_alignment_output_folder}/{templated_group}/{templated_rep_file}',
-                                max_nt_diff_5p,
-                                max_nt_diff_3p)
-            summarise_templated_alignment_all(f'{path_templated_alignment_output_folder}/{templated_group}/{templated_rep_file}', 
-                                    f'{path_summarised_templated_alignment_all_output_folder}/{templated_group}/{templated_rep_file}',
-                                    max_nt_diff_5p)
-                    
-                                                                                                    
\ No newline at end of file
+        for rep_file in rep_files:
+            # Get replicate name 
+            rep_name = rep_file.split('.')[0]
+            jobs.append((f'{group}/{rep_name}', (
+                f'{path_nt_templated_alignment_output_folder}/{group}/{rep_file}', 
+                tag_values,
+                f'{path_summarised_nt_alignment_output_folder}/{group}/{rep_name}',
+                f'{path_summarised_templated_alignment_output_folder}/{group}/{rep_name}',
+                f'{path_summarised_templated_alignment_all_output_folder}/{group}/{rep_name}',
+                max_nt_diff_5p,
+                max_nt_diff_3p)))
+
+    if manifest is not None:
+        # A replicate is only summarised again if its replicate index or the unique tag alignment changed
+        job_keys = [stage_manifest.get_key(manifest, [args[0], path_unique_tags_file], [max_nt_diff_5p, max_nt_diff_3p]) for _, args in jobs]
+        jobs, job_keys = stage_manifest.select_jobs(manifest, 'summarise_nt_templated', jobs, job_keys, [[table_store.get_table_file(path_stem) for path_stem in args[2:5]] for _, args in jobs])
+    parallel.run_jobs(summarise_replicate, jobs, n_workers)
+    if manifest is not None:
+        stage_manifest.record_jobs(manifest, 'summarise_nt_templated', jobs, job_keys)
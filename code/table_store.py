@@ -0,0 +1,209 @@
+import pandas as pd
+import os
+# Columnar files need pyarrow, csv files are used if it is not installed
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Extension of the table files of each storage format
+TABLE_FILE_EXTS = {'parquet': '.parquet', 'csv': '.csv'}
+# Storage format of the output tables: typed, compressed columnar files (Parquet) when pyarrow is installed
+TABLE_FORMAT = 'parquet' if pa is not None else 'csv'
+# Compression of columnar files
+PARQUET_COMPRESSION = 'zstd'
+# Columns stored as categories (dictionary encoded) in columnar files
+CATEGORICAL_COLUMNS = ['mirna_name', 'type', 'grouped_type']
+# Folder (in the output folder of a species) of the csv exports of columnar tables
+CSV_EXPORT_FOLDER = 'csv_export'
+
+def get_table_file(path_stem):
+    """Get the path to a table file in the storage format.
+
+    Parameters
+    ----------
+    path_stem : str
+        Path to the table file without extension e.g <output_folder>/2_avg_replicate_isomiRs/D0
+
+    Returns
+    -------
+    str
+        e.g <output_folder>/2_avg_replicate_isomiRs/D0.parquet
+    """
+    return f'{path_stem}{TABLE_FILE_EXTS[TABLE_FORMAT]}'
+
+def get_table_name(table_file):
+    """Get the name of a table from its file name.
+
+    Parameters
+    ----------
+    table_file : str
+        The table file name e.g D0_rpt1.parquet
+
+    Returns
+    -------
+    str
+        The file name without extension e.g D0_rpt1, None if the file is not a table file.
+    """
+    name, ext = os.path.splitext(table_file)
+    return name if ext in TABLE_FILE_EXTS.values() else None
+
+def list_tables(path_folder):
+    """List the table files of a folder.
+
+    Parameters
+    ----------
+    path_folder : str
+        Path to a folder e.g <output_folder>/1_summarised_isomiRs/D0
+
+    Returns
+    -------
+    dict
+        The path to each table file keyed by table name and sorted by name e.g {'D0_rpt1': '<path_folder>/D0_rpt1.parquet', ...}
+        If a table is saved in several formats, the file in the storage format is used.
+    """
+    table_files = {}
+    for table_file in sorted(os.listdir(path_folder)):
+        name = get_table_name(table_file)
+        if name is not None and (name not in table_files or table_file.endswith(TABLE_FILE_EXTS[TABLE_FORMAT])):
+            table_files[name] = f'{path_folder}/{table_file}'
+    return dict(sorted(table_files.items()))
+
+def to_arrow_table(df, schema=None):
+    """Convert a table to an arrow table, with categorical columns dictionary encoded.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The table.
+    schema : pyarrow.Schema
+        The schema to cast to e.g the schema of the first chunk of a file. None keeps the schema of the table.
+
+    Returns
+    -------
+    pyarrow.Table
+        The arrow table.
+    """
+    df = df.astype({col: 'category' for col in CATEGORICAL_COLUMNS if col in df.columns})
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema is not None:
+        return table.cast(schema)
+    # Same index type for all dictionaries, so that chunks with more categories can be cast to the schema of the first one
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table.column(i).cast(pa.dictionary(pa.int32(), field.type.value_type)))
+    return table
+
+def write_table(df, path_stem):
+    """Save a table in the storage format.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The table.
+    path_stem : str
+        Path to the table file without extension.
+
+    Returns
+    -------
+    str
+        Path to the table file (see get_table_file()). The table file is generated.
+    """
+    path_table_file = get_table_file(path_stem)
+    if TABLE_FORMAT == 'parquet':
+        pq.write_table(to_arrow_table(df), path_table_file, compression=PARQUET_COMPRESSION)
+    else:
+        df.to_csv(path_table_file, index=False)
+    return path_table_file
+
+def write_table_chunks(chunks, path_stem, columns):
+    """Save a table chunk by chunk in the storage format, without holding the whole table in memory.
+
+    Parameters
+    ----------
+    chunks : Iterator of pandas.DataFrame
+        The chunks of the table, in order. Chunks without rows are skipped.
+    path_stem : str
+        Path to the table file without extension.
+    columns : list
+        The columns of the table, used to save an empty table if there is no chunk.
+
+    Returns
+    -------
+    str
+        Path to the table file (see get_table_file()). The table file is generated.
+    """
+    path_table_file = get_table_file(path_stem)
+    parquet_writer, is_written, empty_chunk = None, False, None
+    for chunk in chunks:
+        # Skip chunks without rows: the datatypes of their columns are unknown (e.g empty str columns), which would give a wrong schema to the file
+        if len(chunk) == 0:
+            empty_chunk = chunk if empty_chunk is None else empty_chunk
+            continue
+        if TABLE_FORMAT == 'parquet':
+            table = to_arrow_table(chunk, None if parquet_writer is None else parquet_writer.schema)
+            if parquet_writer is None:
+                parquet_writer = pq.ParquetWriter(path_table_file, table.schema, compression=PARQUET_COMPRESSION)
+            parquet_writer.write_table(table)
+        else:
+            # Append to the csv file
+            chunk.to_csv(path_table_file, index=False, mode='a' if is_written else 'w', header=not is_written)
+        is_written = True
+
+    if parquet_writer is not None:
+        parquet_writer.close()
+    # Write the header only if the table has no rows
+    if not is_written:
+        write_table(empty_chunk if empty_chunk is not None else pd.DataFrame(columns=columns), path_stem)
+    return path_table_file
+
+def read_table(path_table_file, columns=None, dtype=None):
+    """Read a table file saved in any storage format.
+
+    Parameters
+    ----------
+    path_table_file : str
+        Path to the table file (.parquet or .csv).
+    columns : list
+        Columns to read. All of them are read by default.
+    dtype : dict
+        Datatypes of columns e.g {'position': 'str'}.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The table. Categorical columns of columnar files have their categories sorted, as their values would be sorted when read from csv files.
+    """
+    if path_table_file.endswith(TABLE_FILE_EXTS['parquet']):
+        df = pd.read_parquet(path_table_file, columns=columns)
+        for col in df.columns[df.dtypes == 'category']:
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+        return df.astype(dtype) if dtype else df
+    return pd.read_csv(path_table_file, usecols=columns, dtype=dtype, low_memory=False)
+
+def export_csv(path_output_folder):
+    """Export the columnar tables of an output folder to csv files, on demand.
+
+    Parameters
+    ----------
+    path_output_folder : str
+        Path to the output folder of a species e.g output/mmu
+
+    Returns
+    -------
+    str
+        Path to the export folder (<path_output_folder>/csv_export). A csv file is generated for each columnar table, keeping the layout of the output folder (e.g csv_export/2_avg_replicate_isomiRs/D0.csv).
+    """
+    path_output_folder = os.path.normpath(path_output_folder)
+    path_export_folder = os.path.join(path_output_folder, CSV_EXPORT_FOLDER)
+    for root, dirs, files in os.walk(path_output_folder):
+        # Skip previous exports
+        dirs[:] = sorted(folder for folder in dirs if os.path.join(root, folder) != path_export_folder)
+        for file in sorted(files):
+            if file.endswith(TABLE_FILE_EXTS['parquet']):
+                path_csv_folder = os.path.join(path_export_folder, os.path.relpath(root, path_output_folder))
+                if not os.path.exists(path_csv_folder):
+                    os.makedirs(path_csv_folder)
+                read_table(os.path.join(root, file)).to_csv(f'{path_csv_folder}/{get_table_name(file)}.csv', index=False)
+    return path_export_folder
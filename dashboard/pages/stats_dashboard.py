@@ -9,6 +9,9 @@ import dash_daq as daq
 import pandas as pd
 import pathlib
 import os 
+import sys
+from functools import lru_cache
+from collections import OrderedDict
 
 register_page(__name__, "/")
 
@@ -21,72 +24,103 @@ BASE_PATH = pathlib.Path(__file__).parent.parent.parent.resolve()
 DASHBOARD_PATH = BASE_PATH.joinpath("dashboard")
 # Output path
 OUTPUT_PATH = BASE_PATH.joinpath("output")
+# Storage layer of the pipeline outputs (columnar or csv tables)
+sys.path.append(str(BASE_PATH.joinpath("code")))
+import table_store
+
+# Catalog of the analysed species, refreshed when the meta file changes
+sys.path.append(str(DASHBOARD_PATH))
+import species_catalog
 
 #################
 # IMPORT DATASETS
 ################# 
-# Read the meta file to get details of experimental design
-metadata_df = pd.read_csv(DASHBOARD_PATH.joinpath("metadata.csv"))
-
-# species-groups dict from metadata, for dropdown 
-groups_by_species = metadata_df.groupby('species').apply(lambda x: set(x['group'])).to_dict()
-
-# Species-alias dict from metadata, for dropdown 
-species_list = dict(zip(metadata_df['species'].unique(), metadata_df['alias'].unique()))
-
-# Create lists to store DataFrames before concatenation
-canonical_isomirs_list = []
-isomir_types_list = []
-isomir_types_nt_list = []
-templated_nontemplated_extended_list = []
-nt_extended_list = []
-templated_nontemplated_all_list = []
-
-for species in species_list.keys(): 
+# Maximum number of species whose graph data are kept in memory, the least recently used species are evicted first
+SPECIES_CACHE_SIZE = 8
+
+# Load graph data of a species on first request, kept in a bounded LRU cache
+@lru_cache(maxsize=SPECIES_CACHE_SIZE)
+def load_species_graph_data(species, data_version):
+    """Load the statistics outputs (8_graph_processed_data) of a species.
+
+    Parameters
+    ----------
+    species : str
+        The species code e.g mmu
+    data_version : int
+        The version of the statistics outputs (see species_catalog.get_output_version()). Outputs are loaded again when the species is analysed again, tables of previous versions are evicted from the cache as they are no longer used.
+
+    Returns
+    -------
+    dict
+        The rows of each group of each statistics output, keyed by output name and group e.g {'graph_1_data': {'D0': DataFrame, '18hr': DataFrame}, ...}.
+        Groups are kept in the order of the output file. Tables are cached and shared between callbacks, they must not be modified.
+    """
     # Path to statistics outputs 
     stats_output_path = OUTPUT_PATH.joinpath(f'{species}/8_graph_processed_data')
-    # Get the list of statistics outputs
-    outputs = os.listdir(stats_output_path)
-    for output in outputs: 
-        output_df = pd.read_csv(stats_output_path.joinpath(output))
-        output_df['species'] = species  # Add species column
-        
-        # Collect DataFrames in lists instead of appending directly
-        if output == 'graph_1_data.csv':
-            canonical_isomirs_list += [output_df]
-        elif output == 'graph_2_data.csv':
-            isomir_types_list += [output_df]
-        elif output == 'graph_3_data.csv':
-            isomir_types_nt_list += [output_df]
-        elif output == 'graph_4_data.csv':
-            templated_nontemplated_extended_list += [output_df]
-        elif output == 'graph_5_data.csv':
-            nt_extended_list += [output_df]
-        elif output == 'graph_6_data.csv':
-            templated_nontemplated_all_list += [output_df]
-
-# Efficient concatenation at the end
-canonical_isomirs_df = pd.concat(canonical_isomirs_list, ignore_index=True) if canonical_isomirs_list else pd.DataFrame()
-isomir_types_df = pd.concat(isomir_types_list, ignore_index=True) if isomir_types_list else pd.DataFrame()
-isomir_types_nt_df = pd.concat(isomir_types_nt_list, ignore_index=True) if isomir_types_nt_list else pd.DataFrame()
-templated_nontemplated_extended_df = pd.concat(templated_nontemplated_extended_list, ignore_index=True) if templated_nontemplated_extended_list else pd.DataFrame()
-nt_extended_df = pd.concat(nt_extended_list, ignore_index=True) if nt_extended_list else pd.DataFrame()
-templated_nontemplated_all_df = pd.concat(templated_nontemplated_all_list, ignore_index=True) if templated_nontemplated_all_list else pd.DataFrame()
-
-# Map analysis type with dataframe
+    graph_data = {}
+    if os.path.isdir(stats_output_path):
+        for output, path_output_file in table_store.list_tables(stats_output_path).items(): 
+            output_df = table_store.read_table(path_output_file)
+            # Split by group once, so that graphs get the rows of a group without filtering the whole table
+            graph_data[output] = {group: group_df.reset_index(drop=True) for group, group_df in output_df.groupby('group', sort=False)}
+            # Keep the columns of outputs without rows
+            if not graph_data[output]:
+                graph_data[output] = {None: output_df}
+    print(f'Loaded graph data of {species}')
+    return graph_data
+
+def get_graph_data(selected_analysis_type, species, groups):
+    """Get the rows of some groups of an analysis type for a species, loaded on first request (see load_species_graph_data()).
+
+    Parameters
+    ----------
+    selected_analysis_type : str
+        The analysis type e.g IsomiR types (rpm)
+    species : str
+        The species code e.g mmu
+    groups : list
+        The groups e.g ['D0', '18hr']
+
+    Returns
+    -------
+    pandas.DataFrame
+        The rows of the groups, in the order of the output file. Empty if the species has no statistics output for this analysis type.
+        The cached table is returned as is if there is only one group.
+    """
+    data_version = species_catalog.get_output_version(species, '8_graph_processed_data')
+    group_tables = load_species_graph_data(species, data_version).get(analysis_type_list[selected_analysis_type], {})
+    selected_group_tables = [group_df for group, group_df in group_tables.items() if group in groups]
+    if len(selected_group_tables) == 1:
+        return selected_group_tables[0]
+    elif len(selected_group_tables) > 1:
+        return pd.concat(selected_group_tables, ignore_index=True)
+    # No rows, with the columns of the output if any
+    return next(iter(group_tables.values())).iloc[0:0] if group_tables else pd.DataFrame()
+
+def report_caches():
+    """Print the hits and misses of the graph data and figure caches."""
+    for cache_name, cached_function in [('Graph data', load_species_graph_data), ('Figure', generate_cached_graph)]:
+        cache_info = cached_function.cache_info()
+        print(f'{cache_name} cache: {cache_info.hits} hits, {cache_info.misses} misses, {cache_info.currsize}/{cache_info.maxsize} cached')
+
+# Map analysis type with statistics output
 # Analysis type list, for dropdown 
 analysis_type_list = {
-    "Canonical miRNAs & isomiRs (all groups)": canonical_isomirs_df, 
-    "IsomiR types (rpm)": isomir_types_df,
-    "IsomiR types (unique tags)": isomir_types_df, 
-    "All isomiR types (charactised by nt)": isomir_types_nt_df,
-    "3'isomiR types (charactised by nt)": isomir_types_nt_df,
-    "5'isomiR types (charactised by nt)": isomir_types_nt_df,
-    "Templated vs Non-templated at extended positions (%)": templated_nontemplated_extended_df,
-    "Templated vs Non-templated at extended positions (unique tags)": templated_nontemplated_extended_df,
-    "Nt characterisation at extended positions (%)": nt_extended_df,
-    "Nt characterisation at extended positions (unique tags)": nt_extended_df,
-    "Templated vs Non-templated at all positions": templated_nontemplated_all_df
+    "Canonical miRNAs & isomiRs (all groups)": 'graph_1_data', 
+    "IsomiR types (rpm)": 'graph_2_data',
+    "IsomiR types (unique tags)": 'graph_2_data', 
+    "All isomiR types (charactised by nt)": 'graph_3_data',
+    "3'isomiR types (charactised by nt)": 'graph_3_data',
+    "5'isomiR types (charactised by nt)": 'graph_3_data',
+    "Templated vs Non-templated at extended positions (%)": 'graph_4_data',
+    "Templated vs Non-templated at extended positions (unique tags)": 'graph_4_data',
+    "Templated vs Non-templated at extended positions (rpm)": 'graph_4_data',
+    "Nt characterisation at extended positions (%)": 'graph_5_data',
+    "Nt characterisation at extended positions (unique tags)": 'graph_5_data',
+    "Nt characterisation at extended positions (rpm)": 'graph_5_data',
+    "Templated vs Non-templated at all positions": 'graph_6_data',
+    "Templated vs Non-templated at all positions (rpm)": 'graph_6_data'
 }
 
 #################
@@ -158,7 +192,7 @@ def generate_control_card():
             ),
             dcc.Dropdown(
                 id="species-select",
-                options=[{"label": v, "value": k} for k,v in species_list.items()],
+                options=species_catalog.get_species_options(),
                 multi=True,
             ),
             html.Br(),
@@ -294,9 +328,7 @@ def calculate_sizes(selected_analysis_type, selected_species_len, selected_group
 # Graph 1 
 def generate_individual_graph_1(selected_analysis_type, species, groups, sizes, selected_legend_items, legend_item_color, figures):
     # Load data
-    data = analysis_type_list[selected_analysis_type]
-    data = data[data['species'] == species]
-    data = data[data['group'].isin(groups)]
+    data = get_graph_data(selected_analysis_type, species, groups)
     data = data[data['type'].isin(selected_legend_items)]
 
     # Create figure
@@ -368,9 +400,7 @@ def generate_individual_graph_1(selected_analysis_type, species, groups, sizes,
 # Graph 2 
 def generate_individual_graph_2_pie(selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures):
     # Load data
-    data = analysis_type_list[selected_analysis_type]
-    data = data[data['species'] == species]
-    data = data[data['group'] == group]
+    data = get_graph_data(selected_analysis_type, species, [group])
     data = data[data['grouped_type'].isin(selected_legend_items)]
 
     # Value type
@@ -427,9 +457,7 @@ def generate_individual_graph_2_pie(selected_analysis_type, species, group, size
 # Graph 2 
 def generate_individual_graph_2_bar(selected_analysis_type, species, groups, sizes, selected_legend_items, legend_item_color, figures):
     # Load data
-    data = analysis_type_list[selected_analysis_type]
-    data = data[data['species'] == species]
-    data = data[data['group'].isin(groups)]
+    data = get_graph_data(selected_analysis_type, species, groups)
     data = data[data['grouped_type'].isin(selected_legend_items)]
 
     if selected_analysis_type == 'IsomiR types (rpm)': 
@@ -445,7 +473,7 @@ def generate_individual_graph_2_bar(selected_analysis_type, species, groups, siz
     traces = []
 
     # Group records by grouped_type
-    df_grouped = data.groupby('grouped_type')
+    df_grouped = data.groupby('grouped_type', observed=True)
     for grouped_type, group in df_grouped:
         traces.append(go.Bar(
             x=group['group'],
@@ -510,9 +538,7 @@ def generate_individual_graph_2_bar(selected_analysis_type, species, groups, siz
 # Graph 3 
 def generate_individual_graph_3(selected_analysis_type, species, groups, sizes, selected_legend_items, legend_item_color, figures):
     # Load data 
-    data = analysis_type_list[selected_analysis_type]
-    data = data[data['species'] == species]
-    data = data[data['group'].isin(groups)]
+    data = get_graph_data(selected_analysis_type, species, groups)
     data = data[data['type_nt'].isin(selected_legend_items)]
 
     # value type
@@ -595,9 +621,7 @@ def generate_individual_graph_3(selected_analysis_type, species, groups, sizes,
 # Graph 4 
 def generate_individual_graph_4(selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures):
     # Load data
-    data = analysis_type_list[selected_analysis_type]
-    data = data[data['species'] == species]
-    data = data[data['group'] == group]
+    data = get_graph_data(selected_analysis_type, species, [group])
     data = data[data['templated'].isin(selected_legend_items)]
 
     # Value type 
@@ -606,6 +630,9 @@ def generate_individual_graph_4(selected_analysis_type, species, group, sizes, s
     if selected_analysis_type == 'Templated vs Non-templated at extended positions (unique tags)':
         value_type = 'count'
         y_title = '# Unique tags'
+    elif selected_analysis_type == 'Templated vs Non-templated at extended positions (rpm)':
+        value_type = 'rpm'
+        y_title = 'RPM'
     else: 
         value_type = 'percentage'
         y_title = '%'
@@ -679,9 +706,7 @@ def generate_individual_graph_4(selected_analysis_type, species, group, sizes, s
 # Graph 5
 def generate_individual_graph_5(selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures):
     # Load data
-    data = analysis_type_list[selected_analysis_type]
-    data = data[data['species'] == species]
-    data = data[data['group'] == group]
+    data = get_graph_data(selected_analysis_type, species, [group])
     data = data[data['nucleotide'].isin(selected_legend_items)]
 
     # Value type 
@@ -690,6 +715,9 @@ def generate_individual_graph_5(selected_analysis_type, species, group, sizes, s
     if selected_analysis_type == 'Nt characterisation at extended positions (unique tags)':
         value_type = 'count'
         y_title = '# Unique tags'
+    elif selected_analysis_type == 'Nt characterisation at extended positions (rpm)':
+        value_type = 'rpm'
+        y_title = 'RPM'
     else: 
         value_type = 'percentage'
         y_title = '%'
@@ -768,11 +796,16 @@ def generate_individual_graph_5(selected_analysis_type, species, group, sizes, s
 # Graph 6
 def generate_individual_graph_6(selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures):
     # Load data
-    data = analysis_type_list[selected_analysis_type]
-    data = data[data['species'] == species]
-    data = data[data['group'] == group]
+    data = get_graph_data(selected_analysis_type, species, [group])
     data = data[data['templated'].isin(selected_legend_items)]
 
+    # Value type 
+    value_type = 'count'
+    y_title = '# Unique tags'
+    if selected_analysis_type == 'Templated vs Non-templated at all positions (rpm)':
+        value_type = 'rpm'
+        y_title = 'RPM'
+
     # Get the max position 
     position_count = data[data['position'].str.isnumeric()].groupby('position')['count'].sum() 
     position_count.index = position_count.index.astype(int)
@@ -794,7 +827,7 @@ def generate_individual_graph_6(selected_analysis_type, species, group, sizes, s
 
         traces.append(go.Bar(
             x=grouped['position'],
-            y=grouped['count'],
+            y=grouped[value_type],
             name=templated_category,
             marker=dict(color=legend_item_color.get(templated_category, "#636EFA"))  # Default to blue if not specified
         ))
@@ -813,7 +846,7 @@ def generate_individual_graph_6(selected_analysis_type, species, group, sizes, s
             l=2,
             r=20
         ),
-        yaxis_title="<b># Unique tags</b>",
+        yaxis_title=f"<b>{y_title}</b>",
         xaxis_title="<b>Positions</b>",
         barmode='stack',
         plot_bgcolor='white',
@@ -852,30 +885,139 @@ def generate_individual_graph_6(selected_analysis_type, species, group, sizes, s
         }
 
 
+# Maximum number of figures kept in memory, the least recently used figures are evicted first
+FIGURE_CACHE_SIZE = 256
+
+# Generate a graph only if it was not generated with the same inputs recently
+@lru_cache(maxsize=FIGURE_CACHE_SIZE)
+def generate_cached_graph(graph_function, selected_analysis_type, species, groups, selected_legend_items, legend_item_color, data_version):
+    """Generate a graph, reused until one of its inputs changes.
+
+    Parameters
+    ----------
+    graph_function : function
+        The function generating the graph e.g generate_individual_graph_4
+    selected_analysis_type : str
+        The analysis type e.g IsomiR types (rpm)
+    species : str
+        The species code e.g mmu
+    groups : str or tuple
+        The group of graphs of a group e.g D0, or the sorted groups of graphs of several groups e.g ('18hr', 'D0')
+    selected_legend_items : tuple
+        The selected legend items, in order.
+    legend_item_color : tuple
+        The (legend item, color) pairs, sorted by legend item.
+    data_version : int
+        The version of the statistics outputs of the species (see species_catalog.get_output_version()), so that graphs are generated again when the species is analysed again.
+
+    Returns
+    -------
+    tuple
+        The graph ({'id': figure name, 'figure': dcc.Graph}) and its figure. They are shared between callbacks and must not be modified.
+    """
+    figures = {}
+    # Sizes are only used by containers, not to draw figures
+    graph = graph_function(selected_analysis_type, species, list(groups) if isinstance(groups, tuple) else groups, None, list(selected_legend_items), dict(legend_item_color), figures)
+    return graph, figures[graph['id']]
+
+def get_graph(graph_function, selected_analysis_type, species, groups, sizes, selected_legend_items, legend_item_color, figures):
+    """Get a graph from the figure cache, generated only if its analysis type, species, groups, legend items, colors or data changed (see generate_cached_graph()).
+
+    Parameters
+    ----------
+    graph_function : function
+        The function generating the graph e.g generate_individual_graph_4
+    groups : str or list
+        The group of graphs of a group, or the groups of graphs of several groups.
+    figures : dict
+        The figure of each graph, keyed by figure name. The figure of the graph is added.
+
+    Other parameters are the same as the graph function.
+
+    Returns
+    -------
+    dict
+        The graph {'id': figure name, 'figure': dcc.Graph}
+    """
+    data_version = species_catalog.get_output_version(species, '8_graph_processed_data')
+    graph, fig = generate_cached_graph(
+        graph_function, 
+        selected_analysis_type, 
+        species, 
+        tuple(sorted(groups)) if isinstance(groups, list) else groups, 
+        tuple(selected_legend_items or []), 
+        tuple(sorted((legend_item_color or {}).items())), 
+        data_version
+    )
+    figures[graph['id']] = fig
+    return graph
+
+# Maximum number of figures kept for export, the least recently shown figures are removed first
+FIGURE_STORE_SIZE = 512
+
+# Figures shown in the dashboard keyed by figure name, kept on the server so that only figure names are sent to the browser
+figure_store = OrderedDict()
+
+def store_figures(figures):
+    """Keep figures on the server, for export.
+
+    Parameters
+    ----------
+    figures : dict
+        The figure of each graph, keyed by figure name.
+
+    Returns
+    -------
+    list
+        The figure names, to store in the browser (dcc.Store stored-figures). Figures are looked up by name with get_stored_figure().
+    """
+    for fig_name, fig in figures.items():
+        # Most recently shown figures last
+        figure_store.pop(fig_name, None)
+        figure_store[fig_name] = fig
+    while len(figure_store) > FIGURE_STORE_SIZE:
+        figure_store.popitem(last=False)
+    return list(figures.keys())
+
+def get_stored_figure(fig_name):
+    """Get a figure kept on the server by store_figures().
+
+    Parameters
+    ----------
+    fig_name : str
+        The figure name.
+
+    Returns
+    -------
+    plotly.graph_objects.Figure
+        The figure, None if it is no longer stored.
+    """
+    return figure_store.get(fig_name)
+
 # Graphs for a species of a type
 def generate_species_graphs(selected_analysis_type, selected_graph_type, species, selected_groups, sizes, selected_legend_items, legend_item_color, figures):
    
     species_graphs = []
     
     if selected_analysis_type == 'Canonical miRNAs & isomiRs (all groups)':
-        species_graphs.append(generate_individual_graph_1(selected_analysis_type, species, selected_groups, sizes, selected_legend_items, legend_item_color, figures))
+        species_graphs.append(get_graph(generate_individual_graph_1, selected_analysis_type, species, selected_groups, sizes, selected_legend_items, legend_item_color, figures))
     elif selected_analysis_type in ['IsomiR types (rpm)', 'IsomiR types (unique tags)']:
         if selected_graph_type == "bar":
-            species_graphs.append(generate_individual_graph_2_bar(selected_analysis_type, species, selected_groups, sizes, selected_legend_items, legend_item_color, figures))
+            species_graphs.append(get_graph(generate_individual_graph_2_bar, selected_analysis_type, species, selected_groups, sizes, selected_legend_items, legend_item_color, figures))
         else: 
             for group in selected_groups: 
-                species_graphs.append(generate_individual_graph_2_pie(selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures))
+                species_graphs.append(get_graph(generate_individual_graph_2_pie, selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures))
     elif selected_analysis_type in ['All isomiR types (charactised by nt)', "3'isomiR types (charactised by nt)", "5'isomiR types (charactised by nt)"]:
-        species_graphs.append(generate_individual_graph_3(selected_analysis_type, species, selected_groups, sizes, selected_legend_items, legend_item_color, figures))
-    elif selected_analysis_type in ["Templated vs Non-templated at extended positions (%)", 'Templated vs Non-templated at extended positions (unique tags)']:
+        species_graphs.append(get_graph(generate_individual_graph_3, selected_analysis_type, species, selected_groups, sizes, selected_legend_items, legend_item_color, figures))
+    elif selected_analysis_type in ["Templated vs Non-templated at extended positions (%)", 'Templated vs Non-templated at extended positions (unique tags)', 'Templated vs Non-templated at extended positions (rpm)']:
         for group in selected_groups: 
-            species_graphs.append(generate_individual_graph_4(selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures))
-    elif selected_analysis_type in ['Nt characterisation at extended positions (%)', 'Nt characterisation at extended positions (unique tags)']:
+            species_graphs.append(get_graph(generate_individual_graph_4, selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures))
+    elif selected_analysis_type in ['Nt characterisation at extended positions (%)', 'Nt characterisation at extended positions (unique tags)', 'Nt characterisation at extended positions (rpm)']:
         for group in selected_groups: 
-            species_graphs.append(generate_individual_graph_5(selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures))
-    elif selected_analysis_type == 'Templated vs Non-templated at all positions':
+            species_graphs.append(get_graph(generate_individual_graph_5, selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures))
+    elif selected_analysis_type in ['Templated vs Non-templated at all positions', 'Templated vs Non-templated at all positions (rpm)']:
         for group in selected_groups: 
-            species_graphs.append(generate_individual_graph_6(selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures))
+            species_graphs.append(get_graph(generate_individual_graph_6, selected_analysis_type, species, group, sizes, selected_legend_items, legend_item_color, figures))
 
     return species_graphs
 
@@ -918,7 +1060,7 @@ def generate_graph_containers(selected_analysis_type, selected_graph_type, selec
                 id=f'{species}_container',
                 className='graph_container',
                 children=[
-                    html.B(species_list[species]),
+                    html.B(species_catalog.get_species_list().get(species, species)),
                     html.Hr()
                 ]
                 + [generate_graph_subplots(species_graphs, species, sizes)],
@@ -954,12 +1096,12 @@ def get_legend_item_color(selected_analysis_type, selected_species, selected_gro
             "Canonical":'#FFD678',
             "Others": '#A7B6FF'
         }
-    elif selected_analysis_type in ["Templated vs Non-templated at extended positions (%)", "Templated vs Non-templated at extended positions (unique tags)", "Templated vs Non-templated at all positions"]:
+    elif selected_analysis_type in ["Templated vs Non-templated at extended positions (%)", "Templated vs Non-templated at extended positions (unique tags)", "Templated vs Non-templated at extended positions (rpm)", "Templated vs Non-templated at all positions", "Templated vs Non-templated at all positions (rpm)"]:
         return {
             "Templated": "#A8FCD5",
             "Nontemplated": "#A7B6FF"
         }
-    elif selected_analysis_type in ["Nt characterisation at extended positions (%)", "Nt characterisation at extended positions (unique tags)"]:
+    elif selected_analysis_type in ["Nt characterisation at extended positions (%)", "Nt characterisation at extended positions (unique tags)", "Nt characterisation at extended positions (rpm)"]:
         return {
             "a": "#A8FCD5",
             "c": "#A7B6FF",
@@ -967,9 +1109,7 @@ def get_legend_item_color(selected_analysis_type, selected_species, selected_gro
             "u":"#30A0C5"
         }
     else:
-        data = analysis_type_list[selected_analysis_type]
-        data = data[data['species'].isin(selected_species)]
-        data = data[data['group'].isin(selected_groups)]
+        data = pd.concat([get_graph_data(selected_analysis_type, species, selected_groups) for species in selected_species], ignore_index=True)
         if selected_analysis_type == "3'isomiR types (charactised by nt)":
             data = data[data['grouped_type'] == "3'isomiR"]
         elif selected_analysis_type == "5'isomiR types (charactised by nt)":
@@ -981,9 +1121,9 @@ def get_legend_item_color(selected_analysis_type, selected_species, selected_gro
         return dict(zip(legend_items, colors))
 
 def get_legend_title(selected_analysis_type):
-    if selected_analysis_type in ["Templated vs Non-templated at extended positions (%)", "Templated vs Non-templated at extended positions (unique tags)", "Templated vs Non-templated at all positions"]: 
+    if selected_analysis_type in ["Templated vs Non-templated at extended positions (%)", "Templated vs Non-templated at extended positions (unique tags)", "Templated vs Non-templated at extended positions (rpm)", "Templated vs Non-templated at all positions", "Templated vs Non-templated at all positions (rpm)"]: 
         return 'Templated'
-    elif selected_analysis_type in ["Nt characterisation at extended positions (%)", "Nt characterisation at extended positions (unique tags)"] :
+    elif selected_analysis_type in ["Nt characterisation at extended positions (%)", "Nt characterisation at extended positions (unique tags)", "Nt characterisation at extended positions (rpm)"] :
         return 'Nucleotide'
     else:
         return 'Variation type'
@@ -995,7 +1135,10 @@ def export_figures(selected_analysis_type, selected_figures, stored_figures, sel
                 selected_figure_names = selected_figure.split(':')
                 species = selected_figure_names[1]
                 group = selected_figure_names[2].split("|")[0]
-                fig = stored_figures[selected_figure]
+                fig = get_stored_figure(selected_figure)
+                if fig is None:
+                    print(f'Figure {selected_figure} is no longer stored, show it again to export it')
+                    continue
             
                 figure_path = f'{OUTPUT_PATH}/{species}/graphs/{selected_analysis_type}/{group}'
                 if not os.path.exists(figure_path):
@@ -1043,6 +1186,8 @@ layout = html.Div(
             # Storage 
             dcc.Store(id="legend-item-color"),
             dcc.Store(id="stored-figures"),
+            # Check for newly analysed species
+            dcc.Interval(id="catalog-interval", interval=species_catalog.CATALOG_REFRESH_INTERVAL),
             # Side bar
             html.Div(
                 id="left-column",
@@ -1074,6 +1219,18 @@ def update_analysis_type(selected_analysis_type):
         return ''
     return selected_analysis_type
 
+@callback(
+    Output("species-select", "options"),
+    Input("catalog-interval", "n_intervals"),
+    State("species-select", "options")
+)
+def update_species_options(n_intervals, species_options):
+    # Only update the dropdown if species were added or removed since it was last updated
+    new_species_options = species_catalog.get_species_options()
+    if new_species_options == species_options:
+        return dash.no_update
+    return new_species_options
+
 @callback(
     Output("group-select", "options"),
     Input("species-select", "value"),
@@ -1084,6 +1241,7 @@ def update_group_options(selected_species):
         return []  # Empty options if no species selected
     
     # Get the intersection of all groups for selected species
+    groups_by_species = species_catalog.get_groups_by_species()
     available_groups = set()
     for species in selected_species: 
         groups = groups_by_species.get(species, set())
@@ -1156,7 +1314,9 @@ def update_graphs(selected_analysis_type, selected_graph_type, selected_species,
         return [], []
         
     results = generate_graph_containers(selected_analysis_type, selected_graph_type, selected_species, selected_groups, selected_legend_items, legend_item_color, figures)
-    return results, figures
+    report_caches()
+    # Only figure names are sent to the browser, figures are kept on the server
+    return results, store_figures(figures)
 
 @callback(
     Output("modal-stats", "is_open"),
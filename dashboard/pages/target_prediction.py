@@ -1,8 +1,10 @@
+import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html, Input, Output, State, callback_context, callback, register_page, dash_table 
 import pandas as pd
 import pathlib
 import os 
+import sys
 import subprocess
 
 register_page(__name__, "/target_prediction")
@@ -18,18 +20,13 @@ DASHBOARD_PATH = BASE_PATH.joinpath("dashboard")
 INPUT_PATH = BASE_PATH.joinpath("input")
 # Output path
 OUTPUT_PATH = BASE_PATH.joinpath("output")
+# Storage layer of the pipeline outputs (columnar or csv tables)
+sys.path.append(str(BASE_PATH.joinpath("code")))
+import table_store
 
-#################
-# IMPORT DATASETS
-################# 
-# Read the meta file to get details of experimental design
-metadata_df = pd.read_csv(DASHBOARD_PATH.joinpath("metadata.csv"))
-
-# species-groups dict from metadata, for dropdown 
-groups_by_species = metadata_df.groupby('species').apply(lambda x: set(x['group'])).to_dict()
-
-# Species-alias dict from metadata, for dropdown 
-species_list = dict(zip(metadata_df['species'].unique(), metadata_df['alias'].unique()))
+# Catalog of the analysed species, refreshed when the meta file changes
+sys.path.append(str(DASHBOARD_PATH))
+import species_catalog
 
 # 12 isomiR types 
 isomir_types = [
@@ -75,7 +72,7 @@ def generate_control_card():
             html.P("Select species", className="select-title"),
             dcc.Dropdown(
                 id="species-select-target",
-                options=[{"label": v, "value": k} for k,v in species_list.items()],
+                options=species_catalog.get_species_options(),
                 multi=False,
             ),
             html.Br(),
@@ -132,6 +129,8 @@ layout = html.Div(
         children=[
             # Storage 
             dcc.Store(id="data"),
+            # Check for newly analysed species
+            dcc.Interval(id="catalog-interval-target", interval=species_catalog.CATALOG_REFRESH_INTERVAL),
 
             # Side bar
             html.Div(
@@ -189,6 +188,18 @@ def predict_target(data, selected_species, selected_group, selected_canonical, s
         print("Error running miRanda:")
         print(e.stderr)
 
+@callback(
+    Output("species-select-target", "options"),
+    Input("catalog-interval-target", "n_intervals"),
+    State("species-select-target", "options")
+)
+def update_species_options(n_intervals, species_options):
+    # Only update the dropdown if species were added or removed since it was last updated
+    new_species_options = species_catalog.get_species_options()
+    if new_species_options == species_options:
+        return dash.no_update
+    return new_species_options
+
 @callback(
     Output("group-select-target", "options"),
     Input("species-select-target", "value"),
@@ -198,7 +209,7 @@ def update_group_options(selected_species):
     if not selected_species:
         return []  # Empty options if no species selected
 
-    groups = groups_by_species.get(selected_species, set())
+    groups = species_catalog.get_groups_by_species().get(selected_species, set())
 
     return [{"label": g, "value": g} for g in sorted(groups)]
 
@@ -223,9 +234,10 @@ def load_data_and_canonical_list(selected_species, selected_group):
     group_df_list = []
     
     if selected_species and selected_group:
-        for rep_file in os.listdir(f"{OUTPUT_PATH}/{selected_species}/1_summarised_isomiRs/{selected_group}"):
-            rep_df = pd.read_csv(f'{OUTPUT_PATH}/{selected_species}/1_summarised_isomiRs/{selected_group}/{rep_file}')
-            rep_df = rep_df[['mirna_name', 'tag_sequence', 'type', 'annotation']]
+        for path_rep_file in table_store.list_tables(f"{OUTPUT_PATH}/{selected_species}/1_summarised_isomiRs/{selected_group}").values():
+            rep_df = table_store.read_table(path_rep_file, columns=['mirna_name', 'tag_sequence', 'type', 'annotation'])
+            # Categories of columnar files differ between replicates
+            rep_df = rep_df.astype({'mirna_name': str, 'type': str})
             group_df_list.append(rep_df)
         group_df = pd.concat(group_df_list, ignore_index=True) if group_df_list else pd.DataFrame()
         group_df = group_df.drop_duplicates()
@@ -0,0 +1,97 @@
+import pandas as pd
+import pathlib
+import os
+
+################
+# PATH
+################
+# Project path
+BASE_PATH = pathlib.Path(__file__).parent.parent.resolve()
+# Meta file of the analysed species, updated by code/main.py after each analysis
+METADATA_PATH = BASE_PATH.joinpath("dashboard/metadata.csv")
+# Output path
+OUTPUT_PATH = BASE_PATH.joinpath("output")
+
+# Interval (ms) at which dashboard pages check the catalog for newly analysed species
+CATALOG_REFRESH_INTERVAL = 5000
+
+# Species and groups of the last read meta file, with the modification time it was read at
+catalog = {
+    'metadata_mtime': None,
+    'species_list': {},
+    'groups_by_species': {}
+}
+
+def refresh_catalog():
+    """Read the meta file again if it changed since it was last read.
+
+    Returns
+    -------
+    bool
+        True if the catalog changed. The catalog is emptied if the meta file does not exist (no species analysed yet).
+    """
+    metadata_mtime = os.stat(METADATA_PATH).st_mtime_ns if os.path.exists(METADATA_PATH) else None
+    if metadata_mtime == catalog['metadata_mtime']:
+        return False
+
+    metadata_df = pd.read_csv(METADATA_PATH) if metadata_mtime is not None else pd.DataFrame(columns=['species', 'alias', 'group'])
+    # species-groups dict from metadata, for dropdown
+    catalog['groups_by_species'] = metadata_df.groupby('species').apply(lambda x: set(x['group'])).to_dict()
+    # Species-alias dict from metadata, for dropdown
+    catalog['species_list'] = dict(zip(metadata_df['species'].unique(), metadata_df['alias'].unique()))
+    catalog['metadata_mtime'] = metadata_mtime
+    return True
+
+def get_species_list():
+    """Get the analysed species.
+
+    Returns
+    -------
+    dict
+        The alias of each species code e.g {'mmu': 'Mus musculus', ...}
+    """
+    refresh_catalog()
+    return catalog['species_list']
+
+def get_groups_by_species():
+    """Get the groups of each analysed species.
+
+    Returns
+    -------
+    dict
+        The groups of each species code e.g {'mmu': {'D0', '18hr'}, ...}
+    """
+    refresh_catalog()
+    return catalog['groups_by_species']
+
+def get_species_options():
+    """Get the options of a species dropdown.
+
+    Returns
+    -------
+    list
+        e.g [{'label': 'Mus musculus', 'value': 'mmu'}, ...]
+    """
+    return [{"label": v, "value": k} for k,v in get_species_list().items()]
+
+def get_output_version(species, output_folder):
+    """Get the version of an output folder of a species, to know when its tables must be loaded again.
+
+    Parameters
+    ----------
+    species : str
+        The species code e.g mmu
+    output_folder : str
+        The output folder e.g 8_graph_processed_data
+
+    Returns
+    -------
+    int
+        The latest modification time (ns) of the folder and its files, 0 if the folder does not exist.
+        Files rewritten in place do not change the folder modification time, so files are checked too.
+    """
+    path_output_folder = OUTPUT_PATH.joinpath(f'{species}/{output_folder}')
+    if not os.path.isdir(path_output_folder):
+        return 0
+    with os.scandir(path_output_folder) as entries:
+        return max([os.stat(path_output_folder).st_mtime_ns] + [entry.stat().st_mtime_ns for entry in entries if entry.is_file()])
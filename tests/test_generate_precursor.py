@@ -0,0 +1,59 @@
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+BASE_PATH = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.append(str(BASE_PATH.joinpath("code")))
+import fasta_index
+import generate_precursor
+
+# miRNAs (name, chr, 1-based start, end, strand) near the ends and in the middle of short chromosomes
+MIRNAS = [
+    ('mir-start-plus', 'chr1', 5, 26, '+'),
+    ('mir-start-minus', 'chr1', 3, 24, '-'),
+    ('mir-middle', 'chr1', 40, 61, '+'),
+    ('mir-end-plus', 'chr1', 75, 96, '+'),
+    ('mir-end-minus', 'chr2', 52, 73, '-'),
+    ('mir-unknown-chr', 'chr3', 10, 31, '+'),
+]
+
+def write_inputs(path_folder):
+    """Write a genome of 2 short chromosomes and a miRBase gff3 file of MIRNAS."""
+    rng = np.random.default_rng(0)
+    with open(path_folder / 'genomic.fa', 'w') as f:
+        for chr_name, length in [('chr1', 100), ('chr2', 80)]:
+            seq = ''.join(rng.choice(list('ACGT'), length))
+            f.write(f'>{chr_name}\n' + '\n'.join(seq[i:i + 30] for i in range(0, length, 30)) + '\n')
+    with open(path_folder / 'miRNA_annotation.gff3', 'w') as f:
+        f.write('# miRBase\n')
+        for name, chr_name, start, end, strand in MIRNAS:
+            f.write(f'{chr_name}\t.\tmiRNA\t{start}\t{end}\t.\t{strand}\t.\tID={name};Alias={name};Name={name};Derives_from=MI0\n')
+    return str(path_folder / 'genomic.fa'), str(path_folder / 'miRNA_annotation.gff3')
+
+def extract_exact_flanks(path_genomic_file, path_coords_file, max_nt_diff_5p, max_nt_diff_3p):
+    """Extract the extended precursors with flanks of exactly the max nt differences, without the precursor cache."""
+    regions = generate_precursor.get_extended_precursor_regions(generate_precursor.read_miRNA_coordinates(True, path_coords_file), max_nt_diff_5p, max_nt_diff_3p)
+    seqs = fasta_index.fetch_sequences(path_genomic_file, regions)
+    precursors = pd.DataFrame({
+        'mir_name': list(regions.loc[seqs.index, 'name']),
+        'precursor_seq': [seq.upper().replace('T', 'U') for seq in seqs],
+        'flank_5p': max_nt_diff_5p,
+        'flank_3p': max_nt_diff_3p})
+    return generate_precursor.slice_precursors(precursors, max_nt_diff_5p, max_nt_diff_3p)
+
+@pytest.mark.parametrize('max_nt_diffs, mir_names', [
+    ([(3, 8)], ['mir-start-plus', 'mir-middle', 'mir-end-minus']),
+    ([(0, 0)], ['mir-start-plus', 'mir-start-minus', 'mir-middle', 'mir-end-plus', 'mir-end-minus']),
+    ([(12, 1)], ['mir-start-minus', 'mir-middle', 'mir-end-plus']),
+    ([(2, 2), (4, 11), (3, 8)], ['mir-start-plus', 'mir-middle', 'mir-end-minus'])])
+def test_cached_precursors_near_chromosome_ends(tmp_path, max_nt_diffs, mir_names):
+    """Precursors served from the cache (extracted with flanks of at least PRECURSOR_CACHE_FLANK) are those extracted with the exact max nt differences."""
+    path_genomic_file, path_coords_file = write_inputs(tmp_path)
+    for max_nt_diff_5p, max_nt_diff_3p in max_nt_diffs:
+        extended_precursors = generate_precursor.get_extended_precursors(True, False, max_nt_diff_5p, max_nt_diff_3p, path_genomic_file, path_coords_file)
+        pd.testing.assert_frame_equal(extended_precursors, extract_exact_flanks(path_genomic_file, path_coords_file, max_nt_diff_5p, max_nt_diff_3p))
+    # miRNAs near the ends are kept if the last max nt differences fit within the chromosome
+    assert list(extended_precursors['mir_name']) == mir_names
@@ -0,0 +1,56 @@
+import pathlib
+import sys
+
+import pandas as pd
+
+BASE_PATH = pathlib.Path(__file__).parent.parent.resolve()
+sys.path.append(str(BASE_PATH.joinpath("code")))
+import summarise_isomir_sea
+import table_store
+
+# Bundled isomiR-SEA outputs
+RAW_OUTPUT_PATH = BASE_PATH.joinpath("input/mmu/isomiR-SEA_outputs")
+
+def write_raw_outputs(path_raw_output_folder, n_rows=300):
+    """Write the first rows of the bundled replicates, and a replicate whose tags are all below the read count threshold."""
+    for path_rep_file in sorted(RAW_OUTPUT_PATH.glob('*/*.txt')):
+        (path_raw_output_folder / path_rep_file.parent.name).mkdir(parents=True, exist_ok=True)
+        with open(path_rep_file, encoding='latin-1') as f:
+            lines = [next(f) for _ in range(n_rows + 1)]
+        with open(path_raw_output_folder / path_rep_file.parent.name / path_rep_file.name, 'w', encoding='latin-1') as f:
+            f.writelines(lines)
+
+    # A single read of a tag found nowhere else
+    header, row = lines[0], lines[1].split('\t')
+    row[1], row[3] = 'ACGUACGUACGUACGUACGUACG', '1'
+    (path_raw_output_folder / 'low').mkdir()
+    with open(path_raw_output_folder / 'low/low_rpt1.txt', 'w', encoding='latin-1') as f:
+        f.writelines([header, '\t'.join(row)])
+
+def read_outputs(path_summarised_output_folder):
+    """Read the summarised isomiRs of each replicate and the statistics file."""
+    tables = {}
+    for path_group_folder in sorted(path_summarised_output_folder.iterdir()):
+        if path_group_folder.is_dir():
+            for rep_name, path_table_file in table_store.list_tables(str(path_group_folder)).items():
+                tables[rep_name] = table_store.read_table(path_table_file).astype(str)
+    return tables, summarise_isomir_sea.read_stats(str(path_summarised_output_folder))
+
+def test_small_chunks_with_no_kept_tags(tmp_path):
+    """Chunks (and replicates) without kept tags give the same outputs as reading whole files at once."""
+    write_raw_outputs(tmp_path / 'raw')
+
+    outputs = []
+    for chunk_size in [20, summarise_isomir_sea.CHUNK_SIZE]:
+        path_summarised_output_folder = tmp_path / f'summarised_{chunk_size}'
+        summarise_isomir_sea.run(str(tmp_path / 'raw'), str(path_summarised_output_folder), 1000, chunk_size=chunk_size, n_workers=1)
+        outputs.append(read_outputs(path_summarised_output_folder))
+
+    (small_chunk_tables, small_chunk_stats), (tables, stats) = outputs
+    assert small_chunk_tables.keys() == tables.keys()
+    for rep_name, table in tables.items():
+        pd.testing.assert_frame_equal(small_chunk_tables[rep_name], table)
+    assert len(tables['low_rpt1']) == 0
+    assert list(tables['low_rpt1'].columns) == list(summarise_isomir_sea.ISOMIR_SEA_DTYPES.keys()) + summarise_isomir_sea.ANNOTATION_COLUMNS
+    assert small_chunk_stats == stats
+    assert stats['replicates']['low/low_rpt1.txt'] == [0, 0]